@@ -1,5 +1,320 @@
+import argparse
+import difflib
+import io
 import sys
+import timeit
+
 from classfile import *
+from classfile.classpath import ClassPath, open_container
+from classfile.fingerprint import class_fingerprint
+from classfile.header import read_summary
+from classfile.poolorder import shuffle_pool
+from classfile.jardiff import diff_containers
+from classfile.refgraph import EdgeKind, ReferenceGraph
+from classfile.scan import find_callers, parse_method_spec
+from classfile.symbolindex import SymbolIndex, SymbolKind
+from classfile.symbols import SymbolTable
+
+
+def dump (args):
+  print(ClassFile.from_file(args.file))
+
+def summary (args):
+  if args.file == '-':
+    data = sys.stdin.buffer.read()
+  else:
+    with open(args.file, 'rb') as f:
+      data = f.read()
+  summary = read_summary(data)
+  print(summary)
+  if args.benchmark:
+    times = {}
+    for label, parse in (
+        ('read_summary', lambda: read_summary(data)),
+        ('ClassFile.from_bytes',
+         lambda: ClassFile.from_bytes(io.BytesIO(data)))):
+      times[label] = min(timeit.repeat(parse, number=1,
+                                       repeat=args.benchmark))
+      print('{:>22}: {:9.3f} ms'.format(label, 1000*times[label]))
+    print('{:>22}: {:9.1f}x'.format('speedup',
+                                    times['ClassFile.from_bytes'] /
+                                    times['read_summary']))
+
+def fingerprint (args):
+  changed = 0
+  for file in args.files:
+    with open(file, 'rb') as f:
+      data = f.read()
+    fingerprints = class_fingerprint(ClassFile.from_bytes(data))
+    partial = ''
+    if fingerprints.skipped:
+      partial = '  (partial: {})'.format(', '.join(fingerprints.skipped))
+    print('{}  {}{}'.format(fingerprints.digest.hex(), file, partial))
+    for seed in range(args.check):
+      try:
+        shuffled = class_fingerprint(ClassFile.from_bytes(
+          shuffle_pool(data, seed)))
+      except ValueError as e:
+        print('{}: cannot shuffle its pool: {}'.format(file, e),
+              file=sys.stderr)
+        break
+      if shuffled.digest != fingerprints.digest:
+        print('{}: fingerprint changes with the pool order (seed {})'.format(
+          file, seed), file=sys.stderr)
+        changed += 1
+        break
+    if args.members:
+      for key, digest in sorted({**fingerprints.fields,
+                                 **fingerprints.methods}.items()):
+        print('  {}  {}'.format(digest.hex(), key))
+  if changed:
+    sys.exit(1)
+
+def diff (args):
+  old = open_container(args.old)
+  new = open_container(args.new)
+  try:
+    result = diff_containers(old, new)
+    for change in result.changes:
+      print(change)
+      if args.source and change.old is not None and change.new is not None:
+        from decompyler import render_method_body
+        for old_method, new_method in change.changed_methods():
+          for line in difflib.unified_diff(
+              render_method_body(change.old, old_method),
+              render_method_body(change.new, new_method),
+              '{}!{}.{}'.format(args.old, change.name, old_method.name),
+              '{}!{}.{}'.format(args.new, change.name, new_method.name),
+              n=args.context, lineterm=''):
+            print(line)
+    print(result, file=sys.stderr)
+  finally:
+    old.close()
+    new.close()
+
+def callers (args):
+  owner, name, descriptor = parse_method_spec(args.method)
+  classpath = ClassPath(args.classpath)
+  for caller in find_callers(classpath, owner, name, descriptor, args.jobs):
+    line = '' if caller.line is None else ' (line {})'.format(caller.line)
+    print('{}.{}{} @{}{}'.format(caller.class_name, caller.method_name,
+                                 caller.descriptor, caller.pc, line))
+
+def index (args):
+  symbols = SymbolIndex(args.database)
+  try:
+    indexed, unchanged, removed = symbols.update(ClassPath(args.classpath))
+  finally:
+    symbols.close()
+  print('{} indexed, {} unchanged, {} removed'.format(indexed, unchanged,
+                                                      removed))
+
+def search (args):
+  symbols = SymbolIndex(args.database)
+  try:
+    kind = args.kind and SymbolKind[args.kind]
+    for hit in symbols.search(args.text, kind, args.substring, args.limit):
+      print('{}\t{}\t{}!{}'.format(hit.kind, hit.text, hit.container,
+                                   hit.name))
+  finally:
+    symbols.close()
+
+def graph (args):
+  references = ReferenceGraph(args.database)
+  try:
+    classes, edges = references.build(ClassPath(args.classpath))
+  finally:
+    references.close()
+  print('{} classes, {} edges'.format(classes, edges))
+
+def reach (args):
+  references = ReferenceGraph(args.database)
+  try:
+    if references.is_class(args.target):
+      owner, name, descriptor = args.target, None, None
+    else:
+      owner, name, descriptor = parse_method_spec(args.target)
+      owner = owner.replace('/', '.')
+    kinds = args.kind and [EdgeKind[kind] for kind in args.kind]
+    find = references.callers if args.callers else references.callees
+    for node in find(owner, name, descriptor, kinds):
+      print(node)
+  finally:
+    references.close()
+
+def unused (args):
+  references = ReferenceGraph(args.database)
+  try:
+    for name in references.unused_classes():
+      print(name)
+  finally:
+    references.close()
+
+def clones (args):
+  # Imported here so the other commands work without NumPy.
+  from classfile.clones import CloneIndex
+  index = CloneIndex(args.database)
+  try:
+    if args.classpath:
+      indexed, unchanged = index.update(ClassPath(args.classpath))
+      print('{} indexed, {} unchanged'.format(indexed, unchanged),
+            file=sys.stderr)
+    if args.method:
+      owner, name, descriptor = parse_method_spec(args.method)
+      found = index.similar_to(owner.replace('/', '.'), name, descriptor,
+                               args.threshold)
+    else:
+      found = index.candidates(args.threshold)
+    for clone in found:
+      print(clone)
+  finally:
+    index.close()
+
+def symbols (args):
+  table = SymbolTable()
+  classpath = ClassPath(args.classpath)
+  classes = []
+  try:
+    for resource in classpath.resources():
+      try:
+        classes.append(ClassFile.from_bytes(
+          resource.container.read(resource.name), symbols=table))
+      except (ValueError, IndexError) as e:
+        print('Skipping {}: {}'.format(resource.name, e), file=sys.stderr)
+  finally:
+    classpath.close()
+  print('{} classes; {}'.format(len(classes), table))
+
+def stats (args):
+  from classfile.stats import MethodStats
+  collected = MethodStats()
+  classes = collected.collect(ClassPath(args.classpath))
+  collected.save(args.output)
+  print('{} classes, {} methods'.format(classes, len(collected)))
+
+
+def main (argv):
+  parser = argparse.ArgumentParser(prog='python -m classfile')
+  commands = parser.add_subparsers(dest='command', required=True)
+
+  command = commands.add_parser('dump', help='Describe a class file (default)')
+  command.add_argument('file', help="A class file, or '-' for standard input")
+  command.set_defaults(run=dump)
+
+  command = commands.add_parser('summary',
+                                help="Summarize a class file's header and "
+                                     "members without a full parse")
+  command.add_argument('file')
+  command.add_argument('-b', '--benchmark', type=int, metavar='N', default=0,
+                       help='Also time N runs against ClassFile.from_bytes '
+                            'and print the best of each')
+  command.set_defaults(run=summary)
+
+  command = commands.add_parser('fingerprint',
+                                help='Hash class files, ignoring debug '
+                                     'information and pool layout')
+  command.add_argument('files', nargs='+')
+  command.add_argument('-m', '--members', action='store_true',
+                       help='Also print each field and method fingerprint')
+  command.add_argument('-c', '--check', type=int, metavar='N', default=0,
+                       help='Also fingerprint N copies of each class with '
+                            'its constant pool shuffled, and fail if any '
+                            'differs')
+  command.set_defaults(run=fingerprint)
+
+  command = commands.add_parser('diff',
+                                help='Structural diff of two jars or class '
+                                     'directories')
+  command.add_argument('old')
+  command.add_argument('new')
+  command.add_argument('-s', '--source', action='store_true',
+                       help='Also diff the decompiled bodies of changed '
+                            'methods')
+  command.add_argument('-U', '--context', type=int, default=3,
+                       help='Lines of context in source diffs')
+  command.set_defaults(run=diff)
+
+  command = commands.add_parser('callers', help='Find calls to a method')
+  command.add_argument('method',
+                       help='pkg.Owner.name, optionally followed by its '
+                            'descriptor, e.g. java.io.PrintStream.println'
+                            '(Ljava/lang/String;)V')
+  command.add_argument('classpath', nargs='+',
+                       help='Jars, directories and class files to search')
+  command.add_argument('-j', '--jobs', type=int, default=None,
+                       help='Parallel processes (default: one per CPU)')
+  command.set_defaults(run=callers)
+
+  command = commands.add_parser('index',
+                                help='Index the constants on a classpath')
+  command.add_argument('database', help='SQLite index file, created if needed')
+  command.add_argument('classpath', nargs='+',
+                       help='Jars, directories and class files to index')
+  command.set_defaults(run=index)
+
+  command = commands.add_parser('search', help='Search a constant index')
+  command.add_argument('database')
+  command.add_argument('text')
+  command.add_argument('-s', '--substring', action='store_true',
+                       help='Match constants containing text')
+  command.add_argument('-k', '--kind',
+                       choices=[kind.name for kind in SymbolKind])
+  command.add_argument('-n', '--limit', type=int, default=None)
+  command.set_defaults(run=search)
+
+  command = commands.add_parser('clones',
+                                help='Find near-duplicate methods (needs '
+                                     'NumPy)')
+  command.add_argument('database', help='SQLite clone index, created if needed')
+  command.add_argument('classpath', nargs='*',
+                       help='Jars, directories and class files to add first')
+  command.add_argument('-t', '--threshold', type=float, default=0.8,
+                       help='Minimum estimated similarity (default 0.8)')
+  command.add_argument('-m', '--method',
+                       help='Only report clones of pkg.Owner.name[(desc)]')
+  command.set_defaults(run=clones)
+
+  command = commands.add_parser('stats',
+                                help='Export per-method metrics to .npz '
+                                     '(needs NumPy)')
+  command.add_argument('output', help='The .npz file to write')
+  command.add_argument('classpath', nargs='+')
+  command.set_defaults(run=stats)
+
+  command = commands.add_parser('symbols',
+                                help='Parse a classpath with shared UTF-8 '
+                                     'constants and report the memory saved')
+  command.add_argument('classpath', nargs='+')
+  command.set_defaults(run=symbols)
+
+  command = commands.add_parser('graph',
+                                help='Build the reference graph of a classpath')
+  command.add_argument('database', help='SQLite graph file, created if needed')
+  command.add_argument('classpath', nargs='+')
+  command.set_defaults(run=graph)
+
+  command = commands.add_parser('reach', help='Transitive callees or callers')
+  command.add_argument('database')
+  command.add_argument('target',
+                       help='A class, or pkg.Owner.member optionally '
+                            'followed by its descriptor')
+  command.add_argument('-r', '--callers', action='store_true',
+                       help='Find what uses target rather than what it uses')
+  command.add_argument('-k', '--kind', action='append',
+                       choices=[kind.name for kind in EdgeKind],
+                       help='Only follow these edges (repeatable)')
+  command.set_defaults(run=reach)
+
+  command = commands.add_parser('unused',
+                                help='Classes nothing else refers to')
+  command.add_argument('database')
+  command.set_defaults(run=unused)
+
+  if argv and argv[0] not in commands.choices and \
+     argv[0] not in ('-h', '--help'):
+    argv = ['dump'] + argv
+  args = parser.parse_args(argv)
+  args.run(args)
 
-classfile = ClassFile.from_file(sys.argv[1])
-print(classfile)
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -1,23 +1,28 @@
 from classfile import *
 from classfile.bytecode import ByteCode
-from classfile.descriptor import HasDescriptor
+from classfile.descriptor import HasDescriptor, parse_descriptor
 from classfile.flags import *
 from classfile.frames import *
+from classfile.handlers import ExceptionHandlerIndex
 from classfile.bytereader import ByteReader
 from enum import Enum
 import io
-from collections import defaultdict
+from classfile.meta import lazy_property
 from formatter import Document
 
 import logging
 
 class Attribute (Parsed, metaclass=MetaTaggedParsed):
-  _class_map = defaultdict(lambda: AttributeStub)
   attribute_length = 'u4'
 
+  def __init__ (self, rdr, attribute_name=None, **kwargs):
+    super().__init__(rdr, **kwargs)
+    self.attribute_name = attribute_name
+
   @classmethod
   def _read_tag (cls, rdr):
-    return rdr.pool_ref(ConstantUtf8).string
+    name = rdr.pool_ref(ConstantUtf8).string
+    return name, {'attribute_name': name}
 
   def describe (self):
     return repr(self)
@@ -83,6 +88,8 @@ class AttributeStub (Attribute):
   """ Reads all the attribute data if we don't know what else to do with it. """
   info = ('read', 'attribute_length')
 
+Attribute._default_subclass = AttributeStub
+
 
 class AttributeConstantValue (Attribute):
   constantvalue_index = Constant
@@ -105,6 +112,10 @@ class AttributeCode (Attribute):
   exception_table = ('many', 'exception_table_length', ExceptionHandler)
   attributes = Attributes
 
+  @lazy_property
+  def handler_index (self):
+    return ExceptionHandlerIndex(self.exception_table)
+
   def describe (self):
     doc = Document()
     doc.append("AttributeCode:")
@@ -140,19 +151,15 @@ class AttributeExceptions (Attribute, uses_constant_pool=True):
   number_of_exceptions = 'u2'
   exception_index_table = ('many', 'number_of_exceptions', 'u2')
 
-  _exception_table = None
-
-  @property
+  @lazy_property
   def exception_table (self):
-    if not self._exception_table:
-      self._exception_table = []
-      for exception_index in self.exception_index_table:
-        const = self.constant_pool[exception_index]
-        assert isinstance(const, ConstantClass), (
-          "Exception table entries must be ConstantClass")
-        self._exception_table.append(const)
-
-    return self._exception_table
+    exception_table = []
+    for exception_index in self.exception_index_table:
+      const = self.constant_pool[exception_index]
+      assert isinstance(const, ConstantClass), (
+        "Exception table entries must be ConstantClass")
+      exception_table.append(const)
+    return exception_table
 
 class InnerClass (Parsed):
   inner_class_info_index = ConstantClass
@@ -188,7 +195,7 @@ class AttributeSourceFile (Attribute):
             .format(self.sourcefile))
 
 class AttributeSourceDebugExtension (Attribute):
-  debug_extension = ('read', None)
+  debug_extension = ('read', 'attribute_length')
 
 class LineNumberEntry (Parsed):
   start_pc = 'u2'
@@ -233,90 +240,250 @@ class AttributeDeprecated (Attribute):
   # 0-length attribute
   pass
 
-class ElementValue (Parsed):
-  tag = 'u1'
+class ElementValue (Parsed, metaclass=MetaTaggedParsed):
+  def __init__ (self, rdr, tag=None, **kwargs):
+    super().__init__(rdr, **kwargs)
+    self.tag = tag
 
   @classmethod
-  def parse (class_, rdr):
-    self = class_._parse(rdr)
-
-    if tag in b"BCDFIJSZs":
-      ...
-    elif tag in b"e":
-      ...
-    elif tag in b"c":
-      ...
-    elif tag in b"@":
-      ...
-    elif tag == 91: # b'[' vim is dumb
-      ...
-    else:
-      raise ValueError("Unknown ElementValue tag: {}".format(tag))
-
-    return self
+  def _read_tag (cls, rdr):
+    tag = chr(rdr.u1())
+    return (tag, {'tag': tag})
 
 class ElementValueConst (ElementValue):
+  # One class covers all the primitive and String constant tags.
+  tags = 'BCDFIJSZs'
   const_value_index = Constant
 
+  def __str__ (self):
+    if self.tag == 'Z':
+      return str(bool(self.const_value.value)).lower()
+    if self.tag == 'C':
+      return repr(chr(self.const_value.value))
+    if self.tag == 's':
+      return '"{}"'.format(self.const_value.string
+                           .replace('\\', r'\\')
+                           .replace('"', r'\"'))
+    return str(self.const_value)
+
 class ElementValueEnumConst (ElementValue):
+  tag = 'e'
   type_name_index = ConstantUtf8
   const_name_index = ConstantUtf8
 
+  def __str__ (self):
+    return "{}.{}".format(parse_descriptor(self.type_name.string),
+                          self.const_name)
+
 class ElementValueClass (ElementValue):
+  tag = 'c'
   class_info_index = ConstantUtf8
 
+  def __str__ (self):
+    return "{}.class".format(parse_descriptor(self.class_info.string))
+
 class ElementValueArray (ElementValue):
+  tag = '['
   num_values = 'u2'
   values = ('many', 'num_values', ElementValue)
 
+  def __str__ (self):
+    return "{{{}}}".format(", ".join(str(value) for value in self.values))
+
 class ElementValuePair (Parsed):
   element_name_index = ConstantUtf8
   value = ElementValue
 
+  def __str__ (self):
+    return "{}={}".format(self.element_name, self.value)
+
 class Annotation (Parsed):
   type_index = ConstantUtf8
   num_element_value_pairs = 'u2'
   element_value_pairs = ('many', 'num_element_value_pairs', ElementValuePair)
 
+  @property
+  def descriptor (self):
+    return parse_descriptor(self.type.string)
+
+  def __str__ (self):
+    if not self.element_value_pairs:
+      return "@{}".format(self.descriptor)
+    return "@{}({})".format(self.descriptor,
+                            ", ".join(str(pair)
+                                      for pair in self.element_value_pairs))
+
 class ElementValueAnnotation (ElementValue):
+  tag = '@'
   annotation = Annotation
 
+  def __str__ (self):
+    return str(self.annotation)
+
 class Annotations (Parsed):
   num_annotations = 'u2'
   annotations = ('many', 'num_annotations', Annotation)
 
-class AttributeRuntimeVisibleAnnotations (Annotations):
-  pass
+class AttributeRuntimeVisibleAnnotations (Attribute):
+  num_annotations = 'u2'
+  annotations = ('many', 'num_annotations', Annotation)
+
+  def describe (self):
+    doc = Document()
+    doc.append(type(self).__name__)
+    doc.indent().extend(self.annotations)
+    return doc
 
-class AttributeRuntimeInvisibleAnnotations (Annotations):
+class AttributeRuntimeInvisibleAnnotations (
+    AttributeRuntimeVisibleAnnotations):
   pass
 
-class ParameterAnnotations (Parsed):
+class AttributeRuntimeVisibleParameterAnnotations (Attribute):
   num_parameters = 'u1'
   parameter_annotations = ('many', 'num_parameters', Annotations)
 
-class AttributeRuntimeVisibleParameterAnnotations (ParameterAnnotations):
-  pass
-
-class AttributeRuntimeInvisibleParameterAnnotations (ParameterAnnotations):
-  pass
+class AttributeRuntimeInvisibleParameterAnnotations (Attribute):
+  num_parameters = 'u1'
+  parameter_annotations = ('many', 'num_parameters', Annotations)
 
 class AttributeAnnotationDefault (Attribute):
   default_value = ElementValue
 
-class BootstrapMethods (Parsed):
+class BootstrapMethod (Parsed):
   bootstrap_method_ref_index = ConstantMethodHandle
   num_bootstrap_arguments = 'u2'
-  bootstrap_argument_indexes = ...
+  bootstrap_argument_indexes = ('many', 'num_bootstrap_arguments', 'u2')
 
   _bootstrap_arguments = None
 
   @property
   def bootstrap_arguments (self):
-    if not self._bootstrap_arguments:
+    if self._bootstrap_arguments is None:
       self._bootstrap_arguments = [self.constant_pool[idx]
                                    for idx in self.bootstrap_argument_indexes]
     return self._bootstrap_arguments
 
-class AttributesBootstrapMethods (Attribute):
+  def __str__ (self):
+    return "{} {}".format(self.bootstrap_method_ref,
+                          [str(arg) for arg in self.bootstrap_arguments])
+
+class AttributeBootstrapMethods (Attribute):
   num_bootstrap_methods = 'u2'
+  bootstrap_methods = ('many', 'num_bootstrap_methods', BootstrapMethod)
+
+  def describe (self):
+    doc = Document()
+    doc.append("AttributeBootstrapMethods: {}".format(
+      len(self.bootstrap_methods)))
+    body = doc.indent()
+    for i, method in enumerate(self.bootstrap_methods):
+      body.append("#{}: {}".format(i, method))
+    return doc
+
+class AttributeNestHost (Attribute):
+  host_class_index = ConstantClass
+
+class AttributeNestMembers (Attribute, uses_constant_pool=True):
+  number_of_classes = 'u2'
+  class_indexes = ('many', 'number_of_classes', 'u2')
+
+  @lazy_property
+  def classes (self):
+    return [self.constant_pool.resolve(idx, ConstantClass)
+            for idx in self.class_indexes]
+
+class AttributePermittedSubclasses (AttributeNestMembers):
+  pass
+
+class MethodParameter (Parsed):
+  name_index = ConstantUtf8
+  access_flags = 'u2'
+
+class AttributeMethodParameters (Attribute):
+  parameters_count = 'u1'
+  parameters = ('many', 'parameters_count', MethodParameter)
+
+class RecordComponent (Parsed, HasDescriptor):
+  name_index = ConstantUtf8
+  _descriptor_index = ConstantUtf8
+  attributes = Attributes
+
+class AttributeRecord (Attribute):
+  components_count = 'u2'
+  components = ('many', 'components_count', RecordComponent)
+
+class TypeAnnotationTarget (Parsed, metaclass=MetaTaggedParsed):
+  """ The target_info of a type annotation, by its target_type. """
+  def __init__ (self, rdr, tag=None, **kwargs):
+    super().__init__(rdr, **kwargs)
+    self.tag = tag
+
+  @classmethod
+  def _read_tag (cls, rdr):
+    tag = rdr.u1()
+    return (tag, {'tag': tag})
+
+class TypeAnnotationTargetTypeParameter (TypeAnnotationTarget):
+  tags = (0x00, 0x01)
+  type_parameter_index = 'u1'
+
+class TypeAnnotationTargetSupertype (TypeAnnotationTarget):
+  tag = 0x10
+  supertype_index = 'u2'
+
+class TypeAnnotationTargetTypeParameterBound (TypeAnnotationTarget):
+  tags = (0x11, 0x12)
+  type_parameter_index = 'u1'
+  bound_index = 'u1'
+
+class TypeAnnotationTargetEmpty (TypeAnnotationTarget):
+  tags = (0x13, 0x14, 0x15)
+
+class TypeAnnotationTargetFormalParameter (TypeAnnotationTarget):
+  tag = 0x16
+  formal_parameter_index = 'u1'
+
+class TypeAnnotationTargetThrows (TypeAnnotationTarget):
+  tag = 0x17
+  throws_type_index = 'u2'
+
+class LocalVariableTarget (Parsed):
+  start_pc = 'u2'
+  length = 'u2'
+  index = 'u2'
+
+class TypeAnnotationTargetLocalVariable (TypeAnnotationTarget):
+  tags = (0x40, 0x41)
+  table_length = 'u2'
+  table = ('many', 'table_length', LocalVariableTarget)
+
+class TypeAnnotationTargetCatch (TypeAnnotationTarget):
+  tag = 0x42
+  exception_table_index = 'u2'
+
+class TypeAnnotationTargetOffset (TypeAnnotationTarget):
+  tags = (0x43, 0x44, 0x45, 0x46)
+  offset = 'u2'
+
+class TypeAnnotationTargetTypeArgument (TypeAnnotationTarget):
+  tags = (0x47, 0x48, 0x49, 0x4a, 0x4b)
+  offset = 'u2'
+  type_argument_index = 'u1'
+
+class TypePathEntry (Parsed):
+  type_path_kind = 'u1'
+  type_argument_index = 'u1'
+
+class TypeAnnotation (Parsed):
+  target_info = TypeAnnotationTarget
+  path_length = 'u1'
+  target_path = ('many', 'path_length', TypePathEntry)
+  annotation = Annotation
+
+class AttributeRuntimeVisibleTypeAnnotations (Attribute):
+  num_annotations = 'u2'
+  annotations = ('many', 'num_annotations', TypeAnnotation)
+
+class AttributeRuntimeInvisibleTypeAnnotations (
+    AttributeRuntimeVisibleTypeAnnotations):
+  pass
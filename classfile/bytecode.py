@@ -19,13 +19,22 @@ class ByteCode (Parsed):
 
     return self
 
-  def formatted (self):
+  def __iter__ (self):
+    """ Yields instructions in pc order. """
+    return (op for op in self._byte_code if op)
+
+  def op_at (self, pc):
+    """ The instruction starting at pc, or None if pc is mid-instruction. """
+    return self._byte_code[pc]
+
+  def formatted (self, describe=str):
+    """ Yields one line per instruction, rendered by describe(op). """
     index_width = len(str(len(self._byte_code)))
     op_fmt = '{{:{}}} {{}}'.format(index_width)
 
     for idx, op in enumerate(self._byte_code):
       if op:
-        yield op_fmt.format(idx, op)
+        yield op_fmt.format(idx, describe(op))
 
 
   def __str__ (self):
@@ -273,14 +282,14 @@ class Op_ (Parsed, metaclass=MetaTaggedParsed):
   def _read_tag (cls, rdr):
     opcode = rdr.u1()
     if opcode == _WIDE_OP:
-      return opcode << 8 + rdr.u1()
+      return (opcode << 8) + rdr.u1()
     return opcode
 
   @classmethod
   def parse (cls, rdr, **kwargs):
     offset = rdr.aligned_offset
     self = cls._parse(rdr, **kwargs)
-    self._offset = offset
+    self.pc = offset
 
     return self
 
@@ -290,7 +299,7 @@ class Op_ (Parsed, metaclass=MetaTaggedParsed):
       val = getattr(self, name)
       if name.endswith('_offset'):
         # Make jump offsets print absolute indexes.
-        val += self._offset
+        val += self.pc
       parts.append(str(val))
     return " ".join(parts)
 
@@ -475,3 +484,4 @@ for code in Opcode:
   class_name = 'Op_{}'.format(code.name)
   if class_name not in namespace:
     exec("class {} (Op_): pass".format(class_name))
+  namespace[class_name].opcode = code
@@ -4,15 +4,12 @@ def _debug_log (start, n, b, end=None):
 def parse_int(n, signed=False):
   def N (self, callback=None):
     """ Read and parse a {}-byte {} integer. """
-    start = self.offset
-    b = self.data.read(n)
+    start = self._base + self._pos
+    b = self._take(n)
     i = int.from_bytes(b, 'big', signed=signed)
     if self._debug:
       _debug_log(start, n, b, end='')
       print(' ->', i)
-
-    if i == 1572910:
-      import pdb;pdb.set_trace()
     if callback:
       return callback(i)
     return i
@@ -21,13 +18,34 @@ def parse_int(n, signed=False):
   N.__doc__ = N.__doc__.format(n, ['unsigned', 'signed'][signed])
   return N
 
-class ByteReader:
-  _debug = False
+# How much a ByteReader asks its stream for at a time.
+CHUNK_SIZE = 1 << 16
 
-  def __init__ (self, data, constant_pool=None):
-    self.data = data
+class ByteReader:
+  """ Reads big-endian values forward from bytes or any binary stream.
+
+  The stream is only ever read, never seeked or told, so a pipe, a socket or
+  a decompressing stream work as well as a file. Offsets are counted here,
+  and bytes come through a buffer of about CHUNK_SIZE that rolls forward as
+  it is used up. Running out of input raises ValueError.
+
+  With a SymbolTable (see classfile.symbols), UTF-8 constants are shared
+  with other class files parsed with it.
+  """
+  def __init__ (self, data, constant_pool=None, debug=False, symbols=None):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+      self.data = None
+      self._buffer = bytes(data)
+    else:
+      self.data = data
+      self._buffer = b''
+    self._pos = 0
+    # The offset of _buffer[0] in the input.
+    self._base = 0
     self.constant_pool = constant_pool
+    self.symbols = symbols
     self._align_from = 0
+    self._debug = debug
 
   u1 = parse_int(1)
   u2 = parse_int(2)
@@ -39,24 +57,42 @@ class ByteReader:
   i2 = parse_int(2, signed=True)
   i4 = parse_int(4, signed=True)
 
-  @property
-  def length (self):
-    if not hasattr(self, '_length'):
-      orig_pos = self.data.tell()
-      self._length = self.data.seek(0, 2)
-      self.data.seek(orig_pos)
-    return self._length
+  def _fill (self, n):
+    """ Roll the buffer forward until it holds at least n unread bytes. """
+    chunks = [self._buffer[self._pos:]]
+    have = len(chunks[0])
+    while have < n and self.data is not None:
+      chunk = self.data.read(max(CHUNK_SIZE, n - have))
+      if not chunk:
+        break
+      chunks.append(chunk)
+      have += len(chunk)
+    if have < n:
+      raise ValueError("Expected {} bytes at offset {} but the input ends "
+                       "after {}".format(n, self.offset, have))
+    self._base += self._pos
+    self._buffer = b''.join(chunks)
+    self._pos = 0
+
+  def _take (self, n):
+    pos = self._pos
+    end = pos + n
+    if end > len(self._buffer):
+      self._fill(n)
+      pos, end = 0, n
+    self._pos = end
+    return self._buffer[pos:end]
 
   @property
   def offset (self):
-    return self.data.tell()
+    return self._base + self._pos
 
   def start_align (self):
     self._align_from = self.offset
 
   @property
   def aligned_offset (self):
-    return self.offset - self._align_from
+    return self._base + self._pos - self._align_from
 
   def read (self, n, callback=None):
     """ Read n bytes returned as a bytes object, or optionally through a callback.
@@ -65,7 +101,7 @@ class ByteReader:
     and returns that result.
     """
     start = self.offset
-    b = self.data.read(n)
+    b = self._take(n)
     if self._debug:
       _debug_log(start, n, b)
     if callback:
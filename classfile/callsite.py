@@ -0,0 +1,76 @@
+from classfile.constant import ConstantInvokeDynamic
+
+
+class CallSite:
+  """ An invokedynamic call site with its bootstrap method resolved.
+
+  name and descriptor are what the call site itself declares, for a lambda
+  the functional interface method name and a factory signature returning
+  the interface. bootstrap is the ConstantMethodHandle of the bootstrap
+  method and arguments its static arguments, as pool constants.
+  """
+
+  def __init__ (self, index, constant, bootstrap_method):
+    self.index = index
+    self.constant = constant
+    self.name = constant.name_and_type.name.string
+    self.descriptor = constant.name_and_type.descriptor
+    self.bootstrap = bootstrap_method.bootstrap_method_ref
+    self.arguments = bootstrap_method.bootstrap_arguments
+
+  @property
+  def kind (self):
+    return self.bootstrap.reference_kind
+
+  @property
+  def bootstrap_class (self):
+    return self.bootstrap.reference.cls
+
+  @property
+  def bootstrap_name (self):
+    return self.bootstrap.reference.name_and_type.name.string
+
+  @property
+  def is_lambda (self):
+    return str(self.bootstrap_class) == 'java.lang.invoke.LambdaMetafactory'
+
+  @property
+  def is_string_concat (self):
+    return (str(self.bootstrap_class) ==
+            'java.lang.invoke.StringConcatFactory')
+
+  def __repr__ (self):
+    return "<CallSite #{} {} via {}.{}>".format(
+      self.index, self.name, self.bootstrap_class, self.bootstrap_name)
+
+
+class CallSiteIndex:
+  """ Every invokedynamic call site of a class, keyed by pool index.
+
+  Built once per class; an Op_invokedynamic's call_site_index looks its call
+  site up here instead of re-walking the pool and BootstrapMethods.
+  """
+
+  def __init__ (self, classfile):
+    self._sites = {}
+    pool = classfile.constant_pool
+    attributes = classfile.attributes
+    if 'BootstrapMethods' not in attributes:
+      return
+    methods = attributes.BootstrapMethods.bootstrap_methods
+    for index, constant in enumerate(pool):
+      if isinstance(constant, ConstantInvokeDynamic):
+        bootstrap = methods[constant.bootstrap_method_attr_index]
+        self._sites[index] = CallSite(index, constant, bootstrap)
+
+  def __getitem__ (self, index):
+    return self._sites[index]
+
+  def __contains__ (self, index):
+    return index in self._sites
+
+  def __iter__ (self):
+    return iter(self._sites.values())
+
+  def __len__ (self):
+    return len(self._sites)
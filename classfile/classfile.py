@@ -1,9 +1,13 @@
 from classfile.attribute import Attributes
 from classfile.bytereader import ByteReader
+from classfile.callsite import CallSiteIndex
 from classfile.constant import *
 from classfile.descriptor import HasDescriptor
+from classfile.fingerprint import class_fingerprint, member_fingerprint
 from classfile.flags import *
+from classfile.meta import lazy_property
 from formatter import Document
+import sys
 
 
 class Field (Parsed, HasDescriptor):
@@ -12,6 +16,11 @@ class Field (Parsed, HasDescriptor):
   _descriptor_index = ConstantUtf8
   attributes = Attributes
 
+  def fingerprint (self):
+    """ Hex digest of the field, ignoring debug attributes and pool
+    layout. """
+    return member_fingerprint(self).hex()
+
   def describe (self):
     doc = Document()
     doc.append('Field name: {}'.format(self.name))
@@ -27,6 +36,11 @@ class Method (Parsed, HasDescriptor):
   _descriptor_index = ConstantUtf8
   attributes = Attributes
 
+  def fingerprint (self, bootstrap_methods=None):
+    """ Hex digest of the method and its normalized code. Pass the class's
+    BootstrapMethods list to key invokedynamic by bootstrap method. """
+    return member_fingerprint(self, bootstrap_methods).hex()
+
   def describe (self):
     doc = Document()
     doc.append('Method name: {}'.format(self.name))
@@ -79,16 +93,40 @@ class ClassFile (Parsed):
 
     return "Unknown"
 
+  @lazy_property
+  def call_sites (self):
+    return CallSiteIndex(self)
+
+  def fingerprint (self):
+    """ Hex digest of everything but debug information; see
+    classfile.fingerprint. """
+    return class_fingerprint(self).digest.hex()
+
+  def release (self):
+    """ Break the reference cycles between the constant pool and its
+    constants, so this parse is freed as soon as it is dropped instead of
+    at the next garbage collection. The ClassFile is unusable afterwards. """
+    self.constant_pool.clear()
+
   @classmethod
-  def from_file (class_, file):
+  def from_file (class_, file, symbols=None):
+    """ Parse the class file at path file, or standard input if file is
+    '-'. """
+    if file == '-':
+      cf = class_.from_bytes(sys.stdin.buffer, symbols=symbols)
+      cf._file_name = '<stdin>'
+      return cf
     with open(file, 'rb') as f:
-      cf = class_.from_bytes(f)
+      cf = class_.from_bytes(f, symbols=symbols)
     cf._file_name = file
     return cf
 
   @classmethod
-  def from_bytes (class_, data):
-    rdr = ByteReader(data)
+  def from_bytes (class_, data, debug=False, symbols=None):
+    """ Parse a class file from bytes or a binary stream. With a
+    SymbolTable, share UTF-8 constants with the other class files parsed
+    with it (see classfile.symbols). """
+    rdr = ByteReader(data, debug=debug, symbols=symbols)
     return ClassFile.parse(rdr)
 
 
@@ -0,0 +1,274 @@
+""" A classpath of directories and jars, indexed by header parsing only.
+
+  >>> cp = ClassPath(['lib/a.jar', 'build/classes'], cache='classpath.idx')
+  >>> cp.supertypes('com.acme.Foo')
+  >>> cp.save()
+"""
+
+from collections import namedtuple
+import json
+import logging
+import os
+import zipfile
+import zlib
+
+from classfile.flags import ClassAccessFlags
+from classfile.header import read_header
+
+log = logging.getLogger(__name__)
+
+ClassResource = namedtuple('ClassResource',
+                           ('container', 'name', 'stamp', 'position'))
+ClassResource.__doc__ = """ A .class file inside a container on the
+classpath. name is its path within the container. stamp changes whenever
+the content does: the zip entry's CRC32 for jars, a digest of size and mtime
+for directories. position is its place in the container's listing. """
+
+
+class Archive:
+  """ A jar or zip on the classpath. """
+
+  def __init__ (self, path):
+    self.path = path
+    self._zip = None
+
+  @property
+  def zip (self):
+    if self._zip is None:
+      self._zip = zipfile.ZipFile(self.path)
+    return self._zip
+
+  def resources (self):
+    for position, info in enumerate(self.zip.infolist()):
+      if info.filename.endswith('.class') and not info.is_dir():
+        yield ClassResource(self, info.filename, info.CRC, position)
+
+  @property
+  def key (self):
+    """ A CRC over the central directory; no entry is decompressed. """
+    crc = 0
+    for info in self.zip.infolist():
+      crc = zlib.crc32('{}\0{:08x}\0{}\n'.format(info.filename, info.CRC,
+                                                 info.file_size).encode(), crc)
+    return crc
+
+  def read (self, name):
+    return self.zip.read(name)
+
+  def close (self):
+    if self._zip is not None:
+      self._zip.close()
+      self._zip = None
+
+
+class Directory:
+  """ A directory tree of .class files on the classpath. """
+
+  def __init__ (self, path):
+    self.path = path
+
+  def _stats (self):
+    for root, dirs, files in os.walk(self.path):
+      dirs.sort()
+      for file_name in sorted(files):
+        if file_name.endswith('.class'):
+          full = os.path.join(root, file_name)
+          name = os.path.relpath(full, self.path).replace(os.sep, '/')
+          yield name, os.stat(full)
+
+  @staticmethod
+  def _stamp (name, stat):
+    return zlib.crc32('{}\0{}\0{}'.format(name, stat.st_size,
+                                          stat.st_mtime_ns).encode())
+
+  def resources (self):
+    for position, (name, stat) in enumerate(self._stats()):
+      yield ClassResource(self, name, self._stamp(name, stat), position)
+
+  @property
+  def key (self):
+    crc = 0
+    for name, stat in self._stats():
+      crc = zlib.crc32(self._stamp(name, stat).to_bytes(4, 'big'), crc)
+    return crc
+
+  def read (self, name):
+    with open(os.path.join(self.path, name), 'rb') as f:
+      return f.read()
+
+  def close (self):
+    pass
+
+
+class SingleFile (Directory):
+  """ One .class file given directly on the classpath. """
+
+  def _stats (self):
+    yield os.path.basename(self.path), os.stat(self.path)
+
+  def read (self, name):
+    with open(self.path, 'rb') as f:
+      return f.read()
+
+
+def open_container (path):
+  if os.path.isdir(path):
+    return Directory(path)
+  if path.endswith('.class'):
+    return SingleFile(path)
+  return Archive(path)
+
+def split_classpath (entries):
+  """ Accept a list of paths or an os.pathsep separated string. """
+  if isinstance(entries, str):
+    entries = entries.split(os.pathsep)
+  return [entry for entry in entries if entry]
+
+
+class ClassPath:
+  """ Headers and type hierarchy of every class on a classpath.
+
+  Each container is indexed from class headers alone the first time it is
+  needed. With a cache file, indexes are reloaded from disk for containers
+  whose key (a CRC over a jar's central directory, or over a directory's
+  file stamps) has not changed, and save() writes back any that were
+  rebuilt. Earlier containers shadow later ones, as on a JVM classpath.
+  """
+
+  _CACHE_VERSION = 1
+
+  def __init__ (self, entries, cache=None):
+    self.containers = [open_container(path)
+                       for path in split_classpath(entries)]
+    self.cache = cache
+    self._cached = {}
+    self._dirty = False
+    self._headers = None
+    self._supertypes = {}
+    if cache is not None and os.path.exists(cache):
+      with open(cache) as f:
+        stored = json.load(f)
+      if stored.get('version') == self._CACHE_VERSION:
+        self._cached = stored['containers']
+
+  def resources (self):
+    """ Every ClassResource on the classpath, shadowed ones included. """
+    for container in self.containers:
+      yield from container.resources()
+
+  def _index (self, container):
+    path = os.path.abspath(container.path)
+    key = container.key
+    cached = self._cached.get(path)
+    if cached is not None and cached['key'] == key:
+      return cached['classes']
+    classes = []
+    for resource in container.resources():
+      try:
+        header = read_header(container.read(resource.name))
+      except (ValueError, IndexError) as e:
+        log.warning("Skipping %s!%s: %s", container.path, resource.name, e)
+        continue
+      classes.append([str(header.name),
+                      header.super_class and str(header.super_class),
+                      [str(iface) for iface in header.interfaces],
+                      header.access_flags, resource.name])
+    self._cached[path] = {'key': key, 'classes': classes}
+    self._dirty = True
+    return classes
+
+  @property
+  def headers (self):
+    """ Map dotted class name to (super_class, interfaces, access_flags,
+    container, resource name), built on first use. """
+    if self._headers is None:
+      headers = {}
+      for container in self.containers:
+        for name, super_class, interfaces, access_flags, resource in \
+            self._index(container):
+          if name not in headers:
+            headers[name] = (super_class, tuple(interfaces), access_flags,
+                             container, resource)
+      self._headers = headers
+    return self._headers
+
+  def save (self):
+    """ Write the index cache, if there is one and anything changed. """
+    if self.cache is None or not self._dirty:
+      return
+    self.headers
+    tmp = '{}.tmp{}'.format(self.cache, os.getpid())
+    with open(tmp, 'w') as f:
+      json.dump({'version': self._CACHE_VERSION,
+                 'containers': self._cached}, f)
+    os.replace(tmp, self.cache)
+    self._dirty = False
+
+  def close (self):
+    for container in self.containers:
+      container.close()
+
+  def __contains__ (self, name):
+    return str(name) in self.headers
+
+  def __iter__ (self):
+    return iter(self.headers)
+
+  def __len__ (self):
+    return len(self.headers)
+
+  def read (self, name):
+    """ The bytes of the class file that defines name. """
+    _, _, _, container, resource = self.headers[str(name)]
+    return container.read(resource)
+
+  def super_class (self, name):
+    return self.headers[str(name)][0]
+
+  def interfaces (self, name):
+    return self.headers[str(name)][1]
+
+  def access_flags (self, name):
+    return ClassAccessFlags.flags(self.headers[str(name)][2])
+
+  def is_interface (self, name):
+    return bool(self.headers[str(name)][2] & ClassAccessFlags.ACC_INTERFACE)
+
+  def superclasses (self, name):
+    """ The super class chain of name, nearest first. Stops at the first
+    class that is not on the classpath. """
+    chain = []
+    name = str(name)
+    while name in self.headers:
+      name = self.headers[name][0]
+      if name is None or name in chain:
+        break
+      chain.append(name)
+    return chain
+
+  def supertypes (self, name):
+    """ Every class and interface name is assignable to, itself excluded.
+
+    Memoized, so a whole hierarchy costs one visit per class. Types missing
+    from the classpath are included but not expanded.
+    """
+    name = str(name)
+    try:
+      return self._supertypes[name]
+    except KeyError:
+      pass
+    # Guards against malformed, cyclic hierarchies.
+    self._supertypes[name] = frozenset()
+    result = set()
+    if name in self.headers:
+      super_class, interfaces = self.headers[name][:2]
+      for parent in ((super_class,) if super_class else ()) + interfaces:
+        result.add(parent)
+        result.update(self.supertypes(parent))
+    result = frozenset(result)
+    self._supertypes[name] = result
+    return result
+
+  def is_subtype (self, name, other):
+    return str(name) == str(other) or str(other) in self.supertypes(name)
+
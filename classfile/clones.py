@@ -0,0 +1,350 @@
+""" Find duplicated and near-duplicated methods with MinHash and LSH.
+
+Each method's code is reduced to its opcodes, with operands dropped and the
+variants that only differ in a local slot or index width folded together, so
+copies that were renamed, shaded or recompiled against another constant pool
+still look alike. The set of opcode n-grams is summarized by a MinHash
+signature, and signatures are split into bands that are stored in SQLite; two
+methods that share any band bucket are candidate clones. Needs NumPy.
+
+  >>> clones = CloneIndex('clones.db')
+  >>> clones.update(ClassPath(['lib/a.jar', 'vendor/b.jar']))
+  >>> for clone in clones.candidates(0.8): print(clone)
+"""
+
+from collections import namedtuple
+import logging
+import os
+import sqlite3
+
+import numpy as np
+
+from classfile.bytecode import Opcode
+from classfile.header import RawClass
+from classfile.rawcode import RawCode, raw_instructions
+
+log = logging.getLogger(__name__)
+
+_WIDE = 0xc4
+
+def _normalized_opcodes ():
+  table = np.arange(256, dtype=np.uint8)
+  for prefix in 'ilfda':
+    for op in ('load', 'store'):
+      base = Opcode[prefix + op]
+      for slot in range(4):
+        table[Opcode['{}{}_{}'.format(prefix, op, slot)]] = base
+  table[Opcode.ldc_w] = Opcode.ldc
+  table[Opcode.goto_w] = Opcode.goto
+  table[Opcode.jsr_w] = Opcode.jsr
+  return table
+
+NORMALIZED_OPCODE = _normalized_opcodes()
+
+def normalized_opcodes (code):
+  """ The opcodes of a method's code bytes as a uint8 array, with wide
+  folded into the instruction it widens and slot and width variants
+  collapsed. """
+  ops = bytearray()
+  for pc, opcode in raw_instructions(code):
+    ops.append(code[pc + 1] if opcode == _WIDE else opcode)
+  return NORMALIZED_OPCODE[np.frombuffer(bytes(ops), dtype=np.uint8)]
+
+def shingles (opcodes, n=4):
+  """ The distinct opcode n-grams of an opcode array, each packed into a
+  uint64. Sequences shorter than n make a single shingle. """
+  if not 1 <= n <= 8:
+    raise ValueError("Shingle length must be 1 to 8, not {}".format(n))
+  opcodes = opcodes.astype(np.uint64)
+  count = len(opcodes) - n + 1
+  if count < 1:
+    packed = np.zeros(1, dtype=np.uint64)
+    for i, opcode in enumerate(opcodes):
+      packed |= opcode << np.uint64(8*i)
+    return packed
+  packed = np.zeros(count, dtype=np.uint64)
+  for i in range(n):
+    packed |= opcodes[i:i + count] << np.uint64(8*i)
+  return np.unique(packed)
+
+def _mix (x):
+  """ splitmix64's finalizer, element-wise, wrapping like the original. """
+  x = x ^ (x >> np.uint64(30))
+  x = x * np.uint64(0xbf58476d1ce4e5b9)
+  x = x ^ (x >> np.uint64(27))
+  x = x * np.uint64(0x94d049bb133111eb)
+  return x ^ (x >> np.uint64(31))
+
+
+def splitmix64 (seed, count):
+  """ The first count outputs of splitmix64 seeded with seed, as uint64s. """
+  steps = np.arange(1, count + 1, dtype=np.uint64)
+  with np.errstate(over='ignore'):
+    return _mix(np.uint64(seed) + steps * np.uint64(0x9e3779b97f4a7c15))
+
+
+class MinHasher:
+  """ num_perm multiply-shift hash functions over 64 bit shingles. A
+  signature is the minimum of each function over a set, as uint32s.
+
+  The functions' coefficients are drawn from splitmix64 rather than a NumPy
+  Generator, whose stream may change between NumPy versions, so that the
+  same seed always gives the same signatures.
+  """
+
+  def __init__ (self, num_perm=128, seed=1):
+    self.num_perm = num_perm
+    stream = splitmix64(seed, 2*num_perm) >> np.uint64(1)
+    self.a = stream[:num_perm] | np.uint64(1)
+    self.b = stream[num_perm:]
+
+  def signature (self, shingles):
+    x = _mix(shingles)
+    with np.errstate(over='ignore'):
+      hashed = (self.a[:, None] * x[None, :] + self.b[:, None]) >> \
+               np.uint64(32)
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def band_keys (signature, bands):
+  """ One int64 bucket key per band of a signature. """
+  rows = signature.reshape(bands, -1).astype(np.uint64)
+  keys = np.zeros(bands, dtype=np.uint64)
+  with np.errstate(over='ignore'):
+    for column in rows.T:
+      keys = _mix(keys ^ column)
+  return keys.view(np.int64)
+
+def similarity (a, b):
+  """ The fraction of agreeing MinHash values, which estimates the Jaccard
+  similarity of the two shingle sets. """
+  return float(np.mean(a == b))
+
+
+Method = namedtuple('Method', ('container', 'class_name', 'name',
+                               'descriptor', 'length'))
+
+class Clone (namedtuple('Clone', ('similarity', 'a', 'b'))):
+  __slots__ = ()
+
+  def __str__ (self):
+    return '{:.2f} {}.{}{} {}.{}{}'.format(
+      self.similarity, self.a.class_name, self.a.name, self.a.descriptor,
+      self.b.class_name, self.b.name, self.b.descriptor)
+
+
+# PRAGMA user_version of an up to date index. Indexes before version 1 drew
+# their MinHash coefficients from NumPy's default_rng.
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS setting (
+  name TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resource (
+  id INTEGER PRIMARY KEY,
+  container TEXT NOT NULL,
+  name TEXT NOT NULL,
+  stamp INTEGER NOT NULL,
+  UNIQUE (container, name)
+);
+CREATE TABLE IF NOT EXISTS method (
+  id INTEGER PRIMARY KEY,
+  resource_id INTEGER NOT NULL,
+  class_name TEXT NOT NULL,
+  name TEXT NOT NULL,
+  descriptor TEXT NOT NULL,
+  length INTEGER NOT NULL,
+  signature BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS method_resource ON method (resource_id);
+CREATE TABLE IF NOT EXISTS bucket (
+  band INTEGER NOT NULL,
+  key INTEGER NOT NULL,
+  method_id INTEGER NOT NULL,
+  PRIMARY KEY (band, key, method_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bucket_method ON bucket (method_id);
+"""
+
+
+class CloneIndex:
+  """ MinHash signatures of every method on the classpaths added so far,
+  banded for lookup.
+
+  The settings are fixed when the database is created; later, settings left
+  as None are taken from it and conflicting ones are an error. Methods with
+  fewer than min_length instructions are not indexed, since short accessors
+  all look alike. Like SymbolIndex, update() only re-reads class files whose
+  stamp changed.
+  """
+
+  DEFAULTS = {'num_perm': 128, 'bands': 32, 'shingle': 4, 'min_length': 10,
+              'seed': 1}
+
+  def __init__ (self, path, num_perm=None, bands=None, shingle=None,
+                min_length=None, seed=None):
+    self.path = path
+    self.db = sqlite3.connect(path)
+    version = self.db.execute("PRAGMA user_version").fetchone()[0]
+    self.db.executescript(_SCHEMA)
+    if version < _SCHEMA_VERSION:
+      # Signatures from older hash functions match nothing new; forget the
+      # class files so update() indexes them again.
+      with self.db:
+        for table in ('bucket', 'method', 'resource'):
+          self.db.execute("DELETE FROM {}".format(table))
+        self.db.execute("PRAGMA user_version = {}".format(_SCHEMA_VERSION))
+    given = {'num_perm': num_perm, 'bands': bands, 'shingle': shingle,
+             'min_length': min_length, 'seed': seed}
+    stored = dict(self.db.execute("SELECT name, value FROM setting"))
+    if stored:
+      for name, value in given.items():
+        if value is not None and value != stored[name]:
+          raise ValueError("{} was built with {} = {}, not {}".format(
+            path, name, stored[name], value))
+      settings = stored
+    else:
+      settings = {name: self.DEFAULTS[name] if value is None else value
+                  for name, value in given.items()}
+      if settings['num_perm'] % settings['bands']:
+        raise ValueError("{bands} bands do not divide {num_perm} "
+                         "hashes".format(**settings))
+      with self.db:
+        self.db.executemany("INSERT INTO setting VALUES (?, ?)",
+                            settings.items())
+    num_perm, bands, shingle, min_length, seed = (
+      settings[name] for name in ('num_perm', 'bands', 'shingle',
+                                  'min_length', 'seed'))
+    self.bands = bands
+    self.shingle = shingle
+    self.min_length = min_length
+    self.hasher = MinHasher(num_perm, seed)
+
+  def close (self):
+    self.db.close()
+
+  def method_signatures (self, data):
+    """ Yield (class name, name, descriptor, length, signature) for each
+    method in a class file's bytes that is long enough to index. """
+    raw = RawClass(data)
+    class_name = raw.name.replace('/', '.')
+    for method in raw.methods:
+      code = RawCode.of(raw, method)
+      if code is None:
+        continue
+      opcodes = normalized_opcodes(code.code)
+      if len(opcodes) < self.min_length:
+        continue
+      yield (class_name, raw.member_name(method), raw.member_descriptor(method),
+             len(opcodes),
+             self.hasher.signature(shingles(opcodes, self.shingle)))
+
+  def update (self, classpath, batch_size=500):
+    """ Add or refresh every class file on a ClassPath.
+
+    Returns (indexed, unchanged) resource counts. Containers that are not on
+    this classpath are left alone, so jars can be added one at a time.
+    """
+    indexed = unchanged = 0
+    for container in classpath.containers:
+      path = os.path.abspath(container.path)
+      known = {name: (id_, stamp) for id_, name, stamp in self.db.execute(
+        "SELECT id, name, stamp FROM resource WHERE container = ?", (path,))}
+      pending = []
+      for resource in container.resources():
+        previous = known.pop(resource.name, None)
+        if previous is not None and previous[1] == resource.stamp:
+          unchanged += 1
+          continue
+        pending.append((previous, resource))
+        if len(pending) >= batch_size:
+          indexed += self._load(path, container, pending)
+          pending = []
+      indexed += self._load(path, container, pending)
+      with self.db:
+        for id_, _ in known.values():
+          self._forget(id_)
+          self.db.execute("DELETE FROM resource WHERE id = ?", (id_,))
+    return indexed, unchanged
+
+  def _forget (self, resource_id):
+    self.db.execute("DELETE FROM bucket WHERE method_id IN "
+                    "(SELECT id FROM method WHERE resource_id = ?)",
+                    (resource_id,))
+    self.db.execute("DELETE FROM method WHERE resource_id = ?", (resource_id,))
+
+  def _load (self, path, container, pending):
+    parsed = []
+    for previous, resource in pending:
+      try:
+        methods = list(self.method_signatures(container.read(resource.name)))
+      except (ValueError, IndexError) as e:
+        log.warning("Skipping %s!%s: %s", path, resource.name, e)
+        methods = []
+      parsed.append((previous, resource, methods))
+    db = self.db
+    with db:
+      for previous, resource, methods in parsed:
+        if previous is None:
+          resource_id = db.execute(
+            "INSERT INTO resource (container, name, stamp) VALUES (?, ?, ?)",
+            (path, resource.name, resource.stamp)).lastrowid
+        else:
+          resource_id = previous[0]
+          self._forget(resource_id)
+          db.execute("UPDATE resource SET stamp = ? WHERE id = ?",
+                     (resource.stamp, resource_id))
+        for class_name, name, descriptor, length, signature in methods:
+          method_id = db.execute(
+            "INSERT INTO method (resource_id, class_name, name, descriptor, "
+            "length, signature) VALUES (?, ?, ?, ?, ?, ?)",
+            (resource_id, class_name, name, descriptor, length,
+             signature.tobytes())).lastrowid
+          db.executemany(
+            "INSERT OR IGNORE INTO bucket VALUES (?, ?, ?)",
+            [(band, int(key), method_id)
+             for band, key in enumerate(band_keys(signature, self.bands))])
+    return len(pending)
+
+  _METHOD_COLUMNS = ("r.container, m.class_name, m.name, m.descriptor, "
+                     "m.length, m.signature")
+
+  def _clones (self, pairs, args, threshold):
+    query = ("SELECT {0}, {1} FROM ({2}) p "
+             "JOIN method m ON m.id = p.a "
+             "JOIN resource r ON r.id = m.resource_id "
+             "JOIN method n ON n.id = p.b "
+             "JOIN resource s ON s.id = n.resource_id "
+             "ORDER BY p.a, p.b").format(
+               self._METHOD_COLUMNS,
+               self._METHOD_COLUMNS.replace('r.', 's.').replace('m.', 'n.'),
+               pairs)
+    for row in self.db.execute(query, args):
+      a, b = row[:6], row[6:]
+      score = similarity(np.frombuffer(a[5], dtype=np.uint32),
+                         np.frombuffer(b[5], dtype=np.uint32))
+      if score >= threshold:
+        yield Clone(score, Method(*a[:5]), Method(*b[:5]))
+
+  def candidates (self, threshold=0.5):
+    """ Yield a Clone for each pair of methods that share an LSH bucket and
+    whose estimated similarity is at least threshold. """
+    return self._clones(
+      "SELECT DISTINCT x.method_id AS a, y.method_id AS b FROM bucket x "
+      "JOIN bucket y ON y.band = x.band AND y.key = x.key "
+      "AND y.method_id > x.method_id", (), threshold)
+
+  def similar_to (self, class_name, name, descriptor=None, threshold=0.5):
+    """ Yield a Clone of class_name.name against each candidate of it. """
+    where = "m.class_name = ? AND m.name = ?"
+    args = [class_name, name]
+    if descriptor is not None:
+      where += " AND m.descriptor = ?"
+      args.append(descriptor)
+    return self._clones(
+      "SELECT DISTINCT x.method_id AS a, y.method_id AS b FROM method m "
+      "JOIN bucket x ON x.method_id = m.id "
+      "JOIN bucket y ON y.band = x.band AND y.key = x.key "
+      "AND y.method_id != x.method_id WHERE " + where, args, threshold)
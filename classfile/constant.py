@@ -13,10 +13,13 @@ class ConstantPool (Parsed, list):
     self = cls._parse(rdr)
 
     rdr.constant_pool = self
+    symbols = rdr.symbols
 
     self.append(None) # Constant pool starts at 1
     while len(self) < self.pool_count:
       const = Constant.parse(rdr)
+      if symbols is not None and const.tag == ConstantType.Utf8:
+        const = symbols.intern(const)
       self.append(const)
       if const.tag in (ConstantType.Long, ConstantType.Double):
         # Longs and Doubles take up two slots
@@ -26,19 +29,17 @@ class ConstantPool (Parsed, list):
 
   def resolve (self, idx, ref_type):
     if idx == 0:
-      # TODO: Is this the right approach?
-      import pdb;pdb.set_trace()
+      # Index 0 is never a valid entry; optional references such as a
+      # catch-all handler's catch_type use it to mean "none".
       return None
     try:
       ref = self[idx]
-      assert (isinstance(ref, ref_type),
-              "constant_pool[{}] = {!r}, expected {}".format(idx, ref, ref_type))
-      return ref
     except IndexError:
       return idx
-    #except (TypeError, AssertionError) as e:
-      ##import pdb;pdb.set_trace()
-      #print(e)
+    if not isinstance(ref, ref_type):
+      raise ValueError("constant_pool[{}] = {!r}, expected {}"
+                       .format(idx, ref, ref_type.__name__))
+    return ref
 
 
 class ConstantType (IntEnum):
@@ -203,8 +204,9 @@ class ConstantDouble (Constant64Bits):
   def __str__ (self):
     return str(self.value)
 
-#NO idea what to do with these
-class ConstantMethodHandle (Constant):
+class ReferenceKind (IntEnum):
+  """Method handle reference kinds, with the bytecode each one behaves like."""
+
   REF_getField          =  1  #  getfield         C.f:T
   REF_getStatic         =  2  #  getstatic        C.f:T
   REF_putField          =  3  #  putfield         C.f:T
@@ -215,26 +217,36 @@ class ConstantMethodHandle (Constant):
   REF_newInvokeSpecial  =  8  #  new C; dup; invokespecial  C.<init>:(A*)void
   REF_invokeInterface   =  9  #  invokeinterface  C.m:(A*)T
 
+  def __str__ (self):
+    return self.name
+
+class ConstantMethodHandle (Constant):
   tag = ConstantType.MethodHandle
 
-  reference_kind = 'u1'
-  # 1,2,3,4
-  reference_index = ConstantFieldref
-  # 5,6,7,8
-  reference_index = ConstantMethodref
-  # 9
-  reference_index = ConstantInterfaceMethodref
+  reference_kind = ('u1', ReferenceKind)
+  # A ConstantFieldref for kinds 1-4, a ConstantMethodref for 5-8 (named
+  # <init> exactly for 8), and a ConstantInterfaceMethodref for 9. Kinds 6
+  # and 7 may also refer to interface methods.
+  reference_index = Constant
 
-  # 5,6,7,9 -> ref name != <init> or <clinit>
-  # 8 -> ref name == <init>
+  def __str__ (self):
+    return "{} {}".format(self.reference_kind, self.reference)
 
-class ConstantMethodType (Constant):
+class ConstantMethodType (Constant, HasDescriptor):
   tag = ConstantType.MethodType
 
-  descriptor_index = ConstantUtf8
+  _descriptor_index = ConstantUtf8
+
+  def __str__ (self):
+    return str(self.descriptor)
 
 class ConstantInvokeDynamic (Constant):
   tag = ConstantType.InvokeDynamic
 
-  #bootstrap_method_attr_index = Bootsrap_ref #??
+  # Index into the class's BootstrapMethods attribute, not the pool.
+  bootstrap_method_attr_index = 'u2'
   name_and_type_index = ConstantNameAndType
+
+  def __str__ (self):
+    return "#{}:{}".format(self.bootstrap_method_attr_index,
+                           self.name_and_type)
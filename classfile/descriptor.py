@@ -1,3 +1,7 @@
+import functools
+
+from classfile.meta import lazy_property
+
 def _class_name (it):
   chars = []
   try:
@@ -57,6 +61,17 @@ def parse_descriptor (desc):
 
   return t
 
+@functools.lru_cache(maxsize=1 << 16)
+def cached_descriptor (desc):
+  """ parse_descriptor of a descriptor string, memoized across classes.
+  Descriptors are never modified once parsed, so equal strings share one. """
+  return parse_descriptor(desc)
+
+def set_descriptor_cache (maxsize):
+  """ Replace the descriptor memo with an empty one of maxsize entries. """
+  global cached_descriptor
+  cached_descriptor = functools.lru_cache(maxsize=maxsize)(parse_descriptor)
+
 class TypeDescriptor:
   pass
 
@@ -95,8 +110,6 @@ class SignatureDescriptor (TypeDescriptor):
     return "{} ({})".format(self.return_type, self.arg_types)
 
 class HasDescriptor:
-  @property
+  @lazy_property
   def descriptor (self):
-    if not hasattr(self, '_parsed_descriptor'):
-      self._parsed_descriptor = parse_descriptor(self._descriptor)
-    return self._parsed_descriptor
+    return cached_descriptor(str(self._descriptor))
@@ -0,0 +1,285 @@
+""" Fingerprints of what a class means rather than how its bytes are laid out.
+
+Constants are hashed by what they resolve to, never by pool index, and
+instructions are normalized: ldc_w is ldc, goto_w is goto, iload_1 is iload
+1, wide only widens, and branch targets and exception ranges are instruction
+numbers rather than pcs. Debug and derived attributes (line numbers, local
+variable tables, source file, stack maps) are left out, so recompiling the
+same source gives the same fingerprint. Attributes nothing here parses
+are hashed by name alone, since their bytes hold pool indexes; a class
+with any is only partly fingerprinted, and says which.
+
+Each field and method is hashed on its own, in one pass over its parsed
+form, and a class's fingerprint covers its header and the sorted digests of
+its members.
+"""
+
+from collections import namedtuple
+import hashlib
+
+from classfile.attribute import Attributes, AttributeStub
+from classfile.constant import *
+from classfile.meta import Parsed
+
+IGNORED_ATTRIBUTES = frozenset((
+  'LineNumberTable', 'LocalVariableTable', 'LocalVariableTypeTable',
+  'SourceFile', 'SourceDebugExtension', 'StackMapTable',
+  # Folded into the invokedynamic constants that use it.
+  'BootstrapMethods',
+))
+
+_DIGEST_SIZE = 16
+
+
+class _Digest:
+  """ Feeds values to a hash as an unambiguous, type-tagged stream. """
+
+  def __init__ (self):
+    self.hash = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+
+  def update (self, *values):
+    update = self.hash.update
+    for value in values:
+      if value is None:
+        update(b'N')
+      elif isinstance(value, str):
+        data = value.encode('utf-8', 'surrogatepass')
+        update(b'S%d:' % len(data))
+        update(data)
+      elif isinstance(value, (bytes, bytearray)):
+        update(b'B%d:' % len(value))
+        update(value)
+      elif isinstance(value, int):
+        update(b'I%d;' % value)
+      elif isinstance(value, float):
+        update(b'F' + value.hex().encode() + b';')
+      elif isinstance(value, (tuple, list)):
+        update(b'L%d:' % len(value))
+        self.update(*value)
+      else:
+        raise TypeError("Cannot fingerprint {!r}".format(value))
+
+  def digest (self):
+    return self.hash.digest()
+
+
+def _flags (flags):
+  return sum(flags)
+
+def constant_key (const, bootstrap_methods=None):
+  """ A tuple naming what a pool constant resolves to.
+
+  An invokedynamic constant is keyed by its bootstrap method when
+  bootstrap_methods (the class's BootstrapMethods list) is given, and
+  otherwise by its position in that list.
+  """
+  if const is None:
+    return None
+  tag = const.tag
+  if tag == ConstantType.Utf8:
+    return ('Utf8', const.string)
+  if tag == ConstantType.Class:
+    return ('Class', const.name.string)
+  if tag == ConstantType.String:
+    return ('String', const.value.string)
+  if tag in (ConstantType.Integer, ConstantType.Float, ConstantType.Long,
+             ConstantType.Double):
+    return (tag.name, const.bytes)
+  if tag == ConstantType.NameAndType:
+    return ('NameAndType', const.name.string, const._descriptor.string)
+  if tag in (ConstantType.Fieldref, ConstantType.Methodref,
+             ConstantType.InterfaceMethodref):
+    return (tag.name, const._cls.name.string,
+            const.name_and_type.name.string,
+            const.name_and_type._descriptor.string)
+  if tag == ConstantType.MethodHandle:
+    return ('MethodHandle', int(const.reference_kind),
+            constant_key(const.reference))
+  if tag == ConstantType.MethodType:
+    return ('MethodType', const._descriptor.string)
+  if tag == ConstantType.InvokeDynamic:
+    index = const.bootstrap_method_attr_index
+    if bootstrap_methods is not None:
+      method = bootstrap_methods[index]
+      bootstrap = (constant_key(method.bootstrap_method_ref),
+                   [constant_key(arg, bootstrap_methods)
+                    for arg in method.bootstrap_arguments])
+    else:
+      bootstrap = index
+    return ('InvokeDynamic', bootstrap, const.name_and_type.name.string,
+            const.name_and_type._descriptor.string)
+  raise ValueError("Unknown constant {!r}".format(const))
+
+
+def _skipped_name (name):
+  """ Counts and lengths are implied by what they count, and raw index lists
+  are resolved through the properties that read them. """
+  return (name.endswith(('_count', '_length', '_pad', '_indexes',
+                         '_index_table')) or
+          name.startswith(('number_of_', 'num_')))
+
+def _kept_attributes (attributes, skipped):
+  """ (name, attribute) for each attribute that is not ignored. Attributes
+  nothing parses come with None, and their names are added to skipped. """
+  kept = []
+  for attribute in attributes:
+    name = attribute.attribute_name
+    if name in IGNORED_ATTRIBUTES:
+      continue
+    if isinstance(attribute, AttributeStub):
+      skipped.add(name)
+      attribute = None
+    kept.append((name, attribute))
+  return kept
+
+def _canonical (value, bootstrap_methods, skipped):
+  """ value with constants replaced by their keys and parsed structures by
+  tuples of their tags, if any, and fields, in declaration order. """
+  if isinstance(value, Constant):
+    return constant_key(value, bootstrap_methods)
+  if isinstance(value, Attributes):
+    return [(name, _canonical(attribute, bootstrap_methods, skipped))
+            for name, attribute in _kept_attributes(value, skipped)]
+  if isinstance(value, Parsed):
+    return (type(value).__name__, _canonical(getattr(value, 'tag', None),
+                                             bootstrap_methods, skipped),
+            [_canonical(getattr(value, name), bootstrap_methods, skipped)
+             for name in type(value).parsed_names()
+             if not _skipped_name(name)])
+  if isinstance(value, (list, tuple)):
+    return [_canonical(item, bootstrap_methods, skipped) for item in value]
+  if isinstance(value, (set, frozenset)):
+    return sorted(int(item) for item in value)
+  if value is None or isinstance(value, (str, bytes, int, float)):
+    return value
+  return str(value)
+
+
+_WIDTH_VARIANTS = {'ldc_w': 'ldc', 'goto_w': 'goto', 'jsr_w': 'jsr'}
+
+def _op_name (op):
+  """ The normalized name of an instruction, and the local slot its name
+  implies, if any. """
+  name = type(op).__name__[3:]
+  if name.startswith('wide_'):
+    name = name[5:]
+  name = _WIDTH_VARIANTS.get(name, name)
+  base, _, slot = name.rpartition('_')
+  if base.endswith(('load', 'store')) and slot.isdigit():
+    return base, int(slot)
+  return name, None
+
+def _update_code (digest, code, bootstrap_methods, skipped):
+  ops = list(code.byte_code)
+  numbers = {op.pc: i for i, op in enumerate(ops)}
+  numbers[code.byte_code.code_length] = len(ops)
+
+  def number (pc):
+    # Malformed code can jump between instructions; keep such pcs as they are.
+    return numbers.get(pc, ('pc', pc))
+
+  digest.update('Code', code.max_stack, code.max_locals, len(ops))
+  for op in ops:
+    name, slot = _op_name(op)
+    operands = [] if slot is None else [slot]
+    for field in type(op).parsed_names():
+      if field in ('align_pad', 'zero_pad', 'table_size'):
+        continue
+      value = getattr(op, field)
+      if field.endswith('_offset'):
+        operands.append(number(op.pc + value))
+      elif field == 'jump_table':
+        operands.append([number(op.pc + offset) for offset in value])
+      elif field == 'lookup_table':
+        operands.append([(pair.match, number(op.pc + pair.offset))
+                         for pair in value])
+      else:
+        operands.append(_canonical(value, bootstrap_methods, skipped))
+    digest.update(name, operands)
+
+  digest.update([(number(handler.start_pc), number(handler.end_pc),
+                  number(handler.handler_pc),
+                  constant_key(handler.catch_type))
+                 for handler in code.exception_table])
+  _update_attributes(digest, code.attributes, bootstrap_methods, skipped)
+
+def _update_attributes (digest, attributes, bootstrap_methods, skipped):
+  kept = _kept_attributes(attributes, skipped)
+  digest.update(len(kept))
+  for name, attribute in kept:
+    if attribute is None:
+      digest.update(name, None)
+    elif name == 'Code':
+      _update_code(digest, attribute, bootstrap_methods, skipped)
+    elif name == 'Exceptions':
+      digest.update(name, [constant_key(const)
+                           for const in attribute.exception_table])
+    else:
+      digest.update(name, _canonical(attribute, bootstrap_methods, skipped))
+
+
+def bootstrap_methods (classfile):
+  """ A class's BootstrapMethods list, or None. """
+  if 'BootstrapMethods' in classfile.attributes:
+    return classfile.attributes.BootstrapMethods.bootstrap_methods
+  return None
+
+def member_key (member):
+  """ 'name:descriptor' for a field, 'name(args)ret' for a method. """
+  descriptor = member._descriptor.string
+  separator = '' if descriptor.startswith('(') else ':'
+  return member.name.string + separator + descriptor
+
+def member_fingerprint (member, bootstrap_methods=None, skipped=None):
+  """ The digest of a Field or Method: flags, name, descriptor and every
+  attribute that is not debug information. The names of attributes hashed
+  by name alone are added to skipped, if given. """
+  if skipped is None:
+    skipped = set()
+  digest = _Digest()
+  digest.update(type(member).__name__, _flags(member.access_flags),
+                member.name.string, member._descriptor.string)
+  _update_attributes(digest, member.attributes, bootstrap_methods, skipped)
+  return digest.digest()
+
+def code_fingerprint (method, bootstrap_methods=None, skipped=None):
+  """ The digest of a method's normalized code alone, or None for a method
+  without code. skipped is as for member_fingerprint. """
+  if 'Code' not in method.attributes:
+    return None
+  if skipped is None:
+    skipped = set()
+  digest = _Digest()
+  _update_code(digest, method.attributes.Code, bootstrap_methods, skipped)
+  return digest.digest()
+
+
+ClassFingerprint = namedtuple('ClassFingerprint', ('digest', 'header',
+                                                   'fields', 'methods',
+                                                   'skipped'))
+ClassFingerprint.__doc__ = """ digest covers the whole class. header covers
+its version, flags, names, interfaces and class attributes. fields and
+methods map each member_key to that member's digest. skipped is the sorted
+names of the attributes hashed by name alone; if there are any, the
+fingerprint is partial, blind to changes inside them. """
+
+def class_fingerprint (classfile):
+  bootstraps = bootstrap_methods(classfile)
+  skipped = set()
+  header = _Digest()
+  header.update(classfile.major_version, _flags(classfile.access_flags),
+                classfile._this_class.name.string,
+                classfile._super_class and classfile._super_class.name.string,
+                [iface.name.string for iface in classfile.interfaces])
+  _update_attributes(header, classfile.attributes, bootstraps, skipped)
+  header = header.digest()
+
+  fields = {member_key(field): member_fingerprint(field, None, skipped)
+            for field in classfile.fields}
+  methods = {member_key(method): member_fingerprint(method, bootstraps,
+                                                    skipped)
+             for method in classfile.methods}
+  digest = _Digest()
+  digest.update(header, sorted(fields.items()), sorted(methods.items()))
+  return ClassFingerprint(digest.digest(), header, fields, methods,
+                          tuple(sorted(skipped)))
@@ -0,0 +1,106 @@
+from bisect import bisect_left, bisect_right
+
+
+class _Node:
+  """ A centered interval tree node.
+
+  Every interval stored here contains center. They are kept twice, sorted by
+  start_pc and by end_pc, so a stabbing query only walks the ones it reports.
+  """
+  __slots__ = ('center', 'by_start', 'by_end', 'left', 'right')
+
+  def __init__ (self, center, here, left, right):
+    self.center = center
+    self.by_start = sorted(here)
+    self.by_end = sorted(here, key=lambda entry: entry[1], reverse=True)
+    self.left = left
+    self.right = right
+
+
+class ExceptionHandlerIndex:
+  """ Answers which entries of an exception table cover a pc or a pc range.
+
+  Handler ranges are half-open [start_pc, end_pc). Building is O(n log n) and
+  every query is O(log n + k) for k reported handlers. Results are always in
+  exception table order, which is the order the JVM searches them in.
+  """
+
+  def __init__ (self, exception_table):
+    self.handlers = list(exception_table)
+    entries = [(handler.start_pc, handler.end_pc, i)
+               for i, handler in enumerate(self.handlers)
+               if handler.start_pc < handler.end_pc]
+    entries.sort()
+    self._starts = [start for start, _, _ in entries]
+    self._by_start = entries
+    self._root = self._build(entries)
+
+  @classmethod
+  def _build (cls, entries):
+    if not entries:
+      return None
+    # entries are sorted by start_pc, so the median start is a valid center
+    # and at least that entry stays at this node.
+    center = entries[len(entries)//2][0]
+    left, here, right = [], [], []
+    for entry in entries:
+      if entry[1] <= center:
+        left.append(entry)
+      elif entry[0] > center:
+        right.append(entry)
+      else:
+        here.append(entry)
+    return _Node(center, here, cls._build(left), cls._build(right))
+
+  def _stab (self, pc):
+    """ Yield the table indexes of every range containing pc. """
+    node = self._root
+    while node is not None:
+      if pc < node.center:
+        for start, _, i in node.by_start:
+          if start > pc:
+            break
+          yield i
+        node = node.left
+      elif pc > node.center:
+        for _, end, i in node.by_end:
+          if end <= pc:
+            break
+          yield i
+        node = node.right
+      else:
+        for _, _, i in node.by_start:
+          yield i
+        break
+
+  def _handlers (self, indexes):
+    return [self.handlers[i] for i in sorted(indexes)]
+
+  def at (self, pc):
+    """ Handlers whose range contains pc. """
+    return self._handlers(self._stab(pc))
+
+  def covering (self, start_pc, end_pc):
+    """ Handlers whose range contains all of [start_pc, end_pc).
+
+    This is the question to ask for a basic block: a handler protects the
+    whole block or none of it.
+    """
+    return self._handlers(i for i in self._stab(start_pc)
+                          if self.handlers[i].end_pc >= end_pc)
+
+  def overlapping (self, start_pc, end_pc):
+    """ Handlers whose range shares at least one pc with [start_pc, end_pc). """
+    # Ranges starting at or before start_pc overlap iff they contain it; the
+    # rest overlap iff they start inside the range.
+    indexes = list(self._stab(start_pc))
+    lo = bisect_right(self._starts, start_pc)
+    hi = bisect_left(self._starts, end_pc)
+    indexes.extend(i for _, _, i in self._by_start[lo:hi])
+    return self._handlers(indexes)
+
+  def __len__ (self):
+    return len(self.handlers)
+
+  def __iter__ (self):
+    return iter(self.handlers)
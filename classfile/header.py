@@ -0,0 +1,264 @@
+""" Read class file headers straight from bytes, without a full parse.
+
+RawClass walks the constant pool, recording where each entry starts;
+entries are decoded when something asks for them. This is enough for a
+class's name, super class, interfaces and flags at a small fraction of the
+cost of ClassFile.from_bytes. Asked for its members, it goes on to record
+where every field, method and attribute is, stepping over attribute bodies
+by their length. read_header and read_summary are built on it.
+"""
+
+from collections import namedtuple
+
+from classfile.descriptor import ClassDescriptor
+
+_MAGIC = b'\xca\xfe\xba\xbe'
+
+# Size of each constant's body after its tag byte; None for Utf8, whose size
+# is in its first two bytes. Dynamic (17), Module (19) and Package (20) are
+# newer than the full parser but must still be stepped over.
+_CONSTANT_SIZE = {
+  1: None, 3: 4, 4: 4, 5: 8, 6: 8, 7: 2, 8: 2, 9: 4, 10: 4, 11: 4, 12: 4,
+  15: 3, 16: 2, 17: 4, 18: 4, 19: 2, 20: 2,
+}
+_UTF8, _CLASS, _LONG, _DOUBLE = 1, 7, 5, 6
+
+
+def u2 (data, offset):
+  return (data[offset] << 8) | data[offset + 1]
+
+def u4 (data, offset):
+  return int.from_bytes(data[offset:offset + 4], 'big')
+
+
+class RawConstantPool:
+  """ Offsets of the constants in a class file's bytes, decoded on demand.
+
+  offsets[i] is where constant i's tag byte is, or None for slot 0 and the
+  second slot of longs and doubles. end is the offset just past the pool.
+  """
+
+  def __init__ (self, data, offset=8):
+    self.data = data
+    count = u2(data, offset)
+    offset += 2
+    offsets = [None] * count
+    i = 1
+    while i < count:
+      offsets[i] = offset
+      tag = data[offset]
+      try:
+        size = _CONSTANT_SIZE[tag]
+      except KeyError:
+        raise ValueError("Unknown constant tag {} at offset {}".format(tag,
+                                                                     offset))
+      if size is None:
+        size = 2 + u2(data, offset + 1)
+      offset += 1 + size
+      i += 2 if tag in (_LONG, _DOUBLE) else 1
+    self.offsets = offsets
+    self.end = offset
+    self._strings = {}
+
+  def __len__ (self):
+    return len(self.offsets)
+
+  def tag (self, idx):
+    offset = self.offsets[idx]
+    return None if offset is None else self.data[offset]
+
+  def u2_at (self, idx, field=0):
+    """ The field'th u2 of constant idx, e.g. a Class's name_index. """
+    return u2(self.data, self.offsets[idx] + 1 + 2*field)
+
+  def utf8 (self, idx):
+    try:
+      return self._strings[idx]
+    except KeyError:
+      pass
+    offset = self.offsets[idx]
+    if self.data[offset] != _UTF8:
+      raise ValueError("Constant #{} is not Utf8".format(idx))
+    length = u2(self.data, offset + 1)
+    string = bytes(self.data[offset + 3:offset + 3 + length]).decode(
+      'utf-8', 'surrogateescape')
+    self._strings[idx] = string
+    return string
+
+  def class_name (self, idx):
+    """ The internal (slash separated) name of Class constant idx. """
+    if idx == 0:
+      return None
+    if self.tag(idx) != _CLASS:
+      raise ValueError("Constant #{} is not a Class".format(idx))
+    return self.utf8(self.u2_at(idx))
+
+
+RawMember = namedtuple('RawMember', ('access_flags', 'name_index',
+                                     'descriptor_index', 'attributes'))
+RawAttribute = namedtuple('RawAttribute', ('name_index', 'offset', 'length'))
+RawAttribute.__doc__ = """ An attribute whose body is
+data[offset:offset + length]. """
+
+
+def check_magic (data):
+  if bytes(data[:4]) != _MAGIC:
+    raise ValueError("Expected to read {!r} but found {!r}".format(
+      _MAGIC, bytes(data[:4])))
+
+def read_attributes (data, offset):
+  """ Read an attribute table at offset; returns (attributes, end offset). """
+  count = u2(data, offset)
+  offset += 2
+  attributes = []
+  for _ in range(count):
+    length = u4(data, offset + 2)
+    attributes.append(RawAttribute(u2(data, offset), offset + 6, length))
+    offset += 6 + length
+  return attributes, offset
+
+def _read_members (data, offset):
+  count = u2(data, offset)
+  offset += 2
+  members = []
+  for _ in range(count):
+    attributes, end = read_attributes(data, offset + 6)
+    members.append(RawMember(u2(data, offset), u2(data, offset + 2),
+                             u2(data, offset + 4), attributes))
+    offset = end
+  return members, offset
+
+
+class RawClass:
+  """ The layout of a class file: where its pool, members and attributes are.
+
+  The pool and the header after it are read up front. The member and
+  attribute tables are read the first time fields, methods or attributes
+  is asked for; nothing in them is decoded, and Code and every other
+  attribute is skipped by length. Names are internal (slash separated).
+  """
+
+  def __init__ (self, data):
+    check_magic(data)
+    self.data = data
+    self.minor_version = u2(data, 4)
+    self.major_version = u2(data, 6)
+    self.pool = pool = RawConstantPool(data)
+    offset = pool.end
+    self.access_flags = u2(data, offset)
+    self.this_class_index = u2(data, offset + 2)
+    self.super_class_index = u2(data, offset + 4)
+    interfaces_count = u2(data, offset + 6)
+    offset += 8
+    self.interface_indexes = [u2(data, offset + 2*i)
+                              for i in range(interfaces_count)]
+    self._members_offset = offset + 2*interfaces_count
+    # (fields, methods, attributes), set at once so threads sharing a
+    # RawClass never see some of them.
+    self._tables = None
+
+  def _read_tables (self):
+    tables = self._tables
+    if tables is None:
+      fields, offset = _read_members(self.data, self._members_offset)
+      methods, offset = _read_members(self.data, offset)
+      attributes, _ = read_attributes(self.data, offset)
+      tables = self._tables = (fields, methods, attributes)
+    return tables
+
+  @property
+  def fields (self):
+    return self._read_tables()[0]
+
+  @property
+  def methods (self):
+    return self._read_tables()[1]
+
+  @property
+  def attributes (self):
+    return self._read_tables()[2]
+
+  @property
+  def name (self):
+    return self.pool.class_name(self.this_class_index)
+
+  @property
+  def super_name (self):
+    """ None for java/lang/Object. """
+    return self.pool.class_name(self.super_class_index)
+
+  @property
+  def interface_names (self):
+    return [self.pool.class_name(idx) for idx in self.interface_indexes]
+
+  def member_name (self, member):
+    return self.pool.utf8(member.name_index)
+
+  def member_descriptor (self, member):
+    return self.pool.utf8(member.descriptor_index)
+
+  def attribute_name (self, attribute):
+    return self.pool.utf8(attribute.name_index)
+
+  def find_attribute (self, attributes, name):
+    """ The first RawAttribute called name in attributes, or None. """
+    for attribute in attributes:
+      if self.attribute_name(attribute) == name:
+        return attribute
+    return None
+
+  def attribute_data (self, attribute):
+    return self.data[attribute.offset:attribute.offset + attribute.length]
+
+
+ClassHeader = namedtuple('ClassHeader', ('name', 'super_class', 'interfaces',
+                                         'access_flags', 'major_version',
+                                         'minor_version'))
+ClassHeader.__doc__ = """ What a class file says about its place in the type
+hierarchy. Names are ClassDescriptors; super_class is None for
+java.lang.Object. access_flags is the raw u2. """
+
+
+def class_descriptor (internal_name):
+  if internal_name is None:
+    return None
+  return ClassDescriptor(internal_name.replace('/', '.'))
+
+def _header (raw):
+  return ClassHeader(class_descriptor(raw.name),
+                     class_descriptor(raw.super_name),
+                     tuple(class_descriptor(name)
+                           for name in raw.interface_names),
+                     raw.access_flags, raw.major_version, raw.minor_version)
+
+def read_header (data):
+  """ Parse a ClassHeader from the bytes of a class file. """
+  return _header(RawClass(data))
+
+
+MemberSummary = namedtuple('MemberSummary', ('access_flags', 'name',
+                                             'descriptor'))
+ClassSummary = namedtuple('ClassSummary', ('name', 'super_class', 'interfaces',
+                                           'access_flags', 'fields', 'methods',
+                                           'major_version', 'minor_version'))
+ClassSummary.__doc__ = """ A ClassHeader with the class's members. fields
+and methods are tuples of MemberSummary, whose names and descriptors are
+the raw strings; access_flags are raw u2s. """
+
+
+def read_summary (data):
+  """ Parse a ClassSummary from the bytes of a class file.
+
+  Only the constants the summary names are decoded, and every attribute,
+  Code included, is stepped over by its length.
+  """
+  raw = RawClass(data)
+  header = _header(raw)
+  def members (table):
+    return tuple(MemberSummary(member.access_flags, raw.member_name(member),
+                               raw.member_descriptor(member))
+                 for member in table)
+  return ClassSummary(header.name, header.super_class, header.interfaces,
+                      header.access_flags, members(raw.fields),
+                      members(raw.methods), header.major_version,
+                      header.minor_version)
@@ -0,0 +1,191 @@
+""" Structural diffs between two versions of a jar or class directory.
+
+The comparison is a Merkle tree walked top down. Each package hashes the
+names and stamps of its class files, and a jar entry's stamp is its CRC32
+from the central directory, so equal packages are skipped without reading
+anything. Only classes whose stamps differ are parsed, and only their
+members are fingerprinted (see classfile.fingerprint). Members whose
+digests match are skipped. A class that was merely rebuilt, with a new
+CRC but the same fingerprint, is reported unchanged. The work done
+therefore grows with the size of the change, not the size of the jar.
+
+  >>> for change in diff_containers(open_container('old.jar'),
+  ...                               open_container('new.jar')).changes:
+  ...   print(change)
+"""
+
+from collections import namedtuple
+import hashlib
+import io
+
+from classfile.classfile import ClassFile
+from classfile.fingerprint import (bootstrap_methods, class_fingerprint,
+                                   code_fingerprint, member_key)
+
+ADDED, REMOVED, CHANGED = '+', '-', '~'
+
+
+def format_flags (flags):
+  return ' '.join(flag.name[4:].lower() for flag in sorted(flags)) or '-'
+
+def class_name (resource_name):
+  return resource_name[:-len('.class')].replace('/', '.')
+
+def package_tree (container):
+  """ Map package name to (digest, {resource name: stamp}), reading only
+  the container's directory. """
+  packages = {}
+  for resource in container.resources():
+    package = resource.name.rpartition('/')[0].replace('/', '.')
+    packages.setdefault(package, {})[resource.name] = resource.stamp
+  tree = {}
+  for package, stamps in packages.items():
+    digest = hashlib.blake2b(digest_size=16)
+    for name in sorted(stamps):
+      digest.update('{}\0{}\n'.format(name, stamps[name]).encode())
+    tree[package] = (digest.digest(), stamps)
+  return tree
+
+
+MemberChange = namedtuple('MemberChange', ('status', 'kind', 'key',
+                                           'details'))
+MemberChange.__doc__ = """ status is ADDED, REMOVED or CHANGED; kind is
+'field' or 'method'; key is the member_key. details describe what changed:
+flags, 'body' for a method whose code differs, or 'attributes'. """
+
+class ClassChange (namedtuple('ClassChange', ('status', 'name', 'details',
+                                              'members', 'old', 'new'))):
+  """ A class that was added, removed or changed. old and new are the
+  parsed ClassFiles, where they exist. """
+  __slots__ = ()
+
+  def __str__ (self):
+    lines = ['{} class {}'.format(self.status, self.name)]
+    lines.extend('    {}'.format(detail) for detail in self.details)
+    for member in self.members:
+      line = '  {} {} {}'.format(member.status, member.kind, member.key)
+      if member.details:
+        line += ': ' + ', '.join(member.details)
+      lines.append(line)
+    return '\n'.join(lines)
+
+  def changed_methods (self):
+    """ (old Method, new Method) for each method whose body changed. """
+    old = {member_key(method): method for method in self.old.methods}
+    new = {member_key(method): method for method in self.new.methods}
+    for member in self.members:
+      if member.kind == 'method' and 'body' in member.details:
+        yield old[member.key], new[member.key]
+
+
+class StructuralDiff:
+  """ The changes between two containers and how much had to be looked at
+  to find them. """
+
+  def __init__ (self):
+    self.changes = []
+    self.packages = 0
+    self.packages_skipped = 0
+    self.classes_parsed = 0
+    self.classes_rebuilt = 0
+
+  def __str__ (self):
+    return ('{} classes changed; {} of {} packages skipped, {} classes '
+            'parsed, {} rebuilt without changes'.format(
+              len(self.changes), self.packages_skipped, self.packages,
+              self.classes_parsed, self.classes_rebuilt))
+
+
+def _parse (container, name):
+  return ClassFile.from_bytes(io.BytesIO(container.read(name)))
+
+def _header_details (old, new):
+  details = []
+  if old.access_flags != new.access_flags:
+    details.append('flags: {} -> {}'.format(format_flags(old.access_flags),
+                                            format_flags(new.access_flags)))
+  if str(old.super_class) != str(new.super_class):
+    details.append('extends: {} -> {}'.format(old.super_class,
+                                              new.super_class))
+  old_ifaces = [str(iface) for iface in old.interfaces]
+  new_ifaces = [str(iface) for iface in new.interfaces]
+  if old_ifaces != new_ifaces:
+    details.append('implements: {} -> {}'.format(
+      ', '.join(old_ifaces) or '-', ', '.join(new_ifaces) or '-'))
+  if old.major_version != new.major_version:
+    details.append('version: {} -> {}'.format(old.major_version,
+                                              new.major_version))
+  return details or ['attributes']
+
+def _member_changes (kind, old_members, new_members, old_digests,
+                     new_digests, old_bootstraps, new_bootstraps):
+  old_members = {member_key(member): member for member in old_members}
+  new_members = {member_key(member): member for member in new_members}
+  changes = []
+  for key in sorted(old_digests.keys() | new_digests.keys()):
+    if key not in new_digests:
+      changes.append(MemberChange(REMOVED, kind, key, []))
+    elif key not in old_digests:
+      changes.append(MemberChange(ADDED, kind, key, []))
+    elif old_digests[key] != new_digests[key]:
+      old, new = old_members[key], new_members[key]
+      details = []
+      if old.access_flags != new.access_flags:
+        details.append('flags {} -> {}'.format(
+          format_flags(old.access_flags), format_flags(new.access_flags)))
+      if kind == 'method' and \
+         code_fingerprint(old, old_bootstraps) != \
+         code_fingerprint(new, new_bootstraps):
+        details.append('body')
+      changes.append(MemberChange(CHANGED, kind, key,
+                                  details or ['attributes']))
+  return changes
+
+def diff_class (name, old, new):
+  """ The ClassChange between two parses of a class, or None if they are
+  semantically the same. """
+  old_print = class_fingerprint(old)
+  new_print = class_fingerprint(new)
+  if old_print.digest == new_print.digest:
+    return None
+  details = []
+  if old_print.header != new_print.header:
+    details = _header_details(old, new)
+  old_bootstraps = bootstrap_methods(old)
+  new_bootstraps = bootstrap_methods(new)
+  members = (
+    _member_changes('field', old.fields, new.fields, old_print.fields,
+                    new_print.fields, old_bootstraps, new_bootstraps) +
+    _member_changes('method', old.methods, new.methods, old_print.methods,
+                    new_print.methods, old_bootstraps, new_bootstraps))
+  return ClassChange(CHANGED, name, details, members, old, new)
+
+def diff_containers (old, new):
+  """ The StructuralDiff from container old to container new. """
+  result = StructuralDiff()
+  old_tree = package_tree(old)
+  new_tree = package_tree(new)
+  changes = result.changes
+  for package in sorted(old_tree.keys() | new_tree.keys()):
+    result.packages += 1
+    old_digest, old_stamps = old_tree.get(package, (None, {}))
+    new_digest, new_stamps = new_tree.get(package, (None, {}))
+    if old_digest == new_digest:
+      result.packages_skipped += 1
+      continue
+    for name in sorted(old_stamps.keys() | new_stamps.keys()):
+      if name not in new_stamps:
+        changes.append(ClassChange(REMOVED, class_name(name), [], [],
+                                   None, None))
+      elif name not in old_stamps:
+        changes.append(ClassChange(ADDED, class_name(name), [], [],
+                                   None, None))
+      elif old_stamps[name] != new_stamps[name]:
+        result.classes_parsed += 1
+        change = diff_class(class_name(name), _parse(old, name),
+                            _parse(new, name))
+        if change is None:
+          result.classes_rebuilt += 1
+        else:
+          changes.append(change)
+  return result
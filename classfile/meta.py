@@ -2,6 +2,25 @@ from collections import OrderedDict
 from collections.abc import Sequence
 from classfile.bytereader import ByteReader
 
+class lazy_property (property):
+  """ A read-only property computed once per instance and then kept.
+
+  The value is stored with dict.setdefault, so threads that race to compute
+  it all return whichever value was stored first.
+  """
+
+  def __set_name__ (self, owner, name):
+    self._key = '_cached_' + name
+
+  def __get__ (self, obj, owner=None):
+    if obj is None:
+      return self
+    values = obj.__dict__
+    try:
+      return values[self._key]
+    except KeyError:
+      return values.setdefault(self._key, self.fget(obj))
+
 def _ref_resolver (name, ref_type):
   def resolve_ref (self):
     idx = getattr(self, name)
@@ -28,7 +47,10 @@ class MetaParsed (type):
       if isinstance(val, Sequence):
         if isinstance(val, str):
           val = (val,)
-        if isinstance(val, tuple) and not hasattr(ByteReader, val[0]):
+        # A tuple not led by a ByteReader method name, like the tags of
+        # a MetaTaggedParsed subclass, is not a field.
+        if isinstance(val, tuple) and not (isinstance(val[0], str) and
+                                           hasattr(ByteReader, val[0])):
           continue
         parse_method = val
         if len(val) == 2 and is_Constant(val[1]):
@@ -78,13 +100,10 @@ class MetaParsed (type):
       parse_name = '_parse'
     if parse_name in dct:
       parse_name += '2'
-    debug_this = 'debug_parse' in dct and dct['debug_parse']
     def parse (class_, rdr, **kwargs):
       """ MetaParsed {} """
       if uses_constant_pool:
         kwargs['constant_pool'] = rdr.constant_pool
-      if debug_this:
-        import pdb;pdb.set_trace()
       self = super(myclass, class_).parse(rdr, **kwargs)
       myclass._parse_self(self, rdr)
       return self
@@ -122,6 +141,8 @@ class MetaTaggedParsed (MetaParsed):
     if not any(isinstance(base, MetaTaggedParsed) for base in bases):
       if '_class_map' not in dct:
         dct['_class_map'] = {}
+      # The subclass for tags not in _class_map, if any.
+      dct.setdefault('_default_subclass', None)
 
       if '_read_tag' not in dct:
         def _read_tag (cls, rdr):
@@ -144,11 +165,10 @@ class MetaTaggedParsed (MetaParsed):
           if isinstance(tag, tuple):
             tag, new_args = tag
             kwargs.update(new_args)
-          try:
-            SubClass = TopClass._class_map[tag]
-            return SubClass.parse(rdr, **kwargs)
-          except KeyError:
+          SubClass = TopClass._class_map.get(tag, TopClass._default_subclass)
+          if SubClass is None:
             raise ValueError("No subclass of {} tagged with {}".format(TopClass, tag))
+          return SubClass.parse(rdr, **kwargs)
         return getattr(TopClass, delegate_parse).__func__(class_, rdr, **kwargs)
       parse.__doc__ = parse.__doc__.format(class_name)
       dct[parse_name] = classmethod(parse)
@@ -157,17 +177,24 @@ class MetaTaggedParsed (MetaParsed):
     return TopClass
 
   def __init__ (cls, class_name, bases, dct, **kwargs):
+    """ Register a subclass under its tag, each of its tags, or else its
+    name less the top-level class's. """
     for base in bases:
       if hasattr(base, '_class_map'):
+        top = next(klass for klass in base.__mro__
+                   if '_class_map' in vars(klass))
         if 'tag' in dct:
-          base._class_map[dct['tag']] = cls
+          top._class_map[dct['tag']] = cls
+        elif 'tags' in dct:
+          for tag in dct['tags']:
+            top._class_map[tag] = cls
         else:
-          if class_name.startswith(base.__name__):
-            class_name = class_name[len(base.__name__):]
-          if hasattr(base, 'tag') and hasattr(base.tag, class_name):
-            base._class_map[getattr(base.tag, class_name)] = cls
+          if class_name.startswith(top.__name__):
+            class_name = class_name[len(top.__name__):]
+          if hasattr(top, 'tag') and hasattr(top.tag, class_name):
+            top._class_map[getattr(top.tag, class_name)] = cls
           else:
-            base._class_map[class_name] = cls
+            top._class_map[class_name] = cls
         break
 
 class Constant (Parsed, metaclass=MetaTaggedParsed):
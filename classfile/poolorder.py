@@ -0,0 +1,284 @@
+""" Rewrite a class file with its constant pool in another order.
+
+What a class means does not depend on where its constants sit in the pool,
+so a shuffled copy is a check on anything that claims to ignore pool
+layout, like classfile.fingerprint:
+
+  >>> shuffled = shuffle_pool(data, seed=1)
+  >>> class_fingerprint(ClassFile.from_bytes(data)) == \\
+  ...   class_fingerprint(ClassFile.from_bytes(shuffled))
+
+Every index into the pool is rewritten: in the pool itself, the header,
+members, bytecode and each attribute the JVM specification defines up to
+Java 17, except Module. The constants that ldc loads keep indexes below
+256, so every instruction keeps its length and every pc its meaning.
+"""
+
+import random
+
+from classfile.bytecode import Opcode
+from classfile.header import RawClass, read_attributes, u2, u4
+from classfile.rawcode import raw_instructions
+
+# Where the u2 indexes are in each kind of constant's body, by tag. A
+# MethodHandle's one follows its reference kind byte, and an (Invoke)Dynamic
+# constant's first u2 indexes BootstrapMethods, not the pool.
+_CONSTANT_REFS = {
+  7: (0,), 8: (0,), 9: (0, 2), 10: (0, 2), 11: (0, 2), 12: (0, 2), 15: (1,),
+  16: (0,), 17: (2,), 18: (2,), 19: (0,), 20: (0,),
+}
+_LONG, _DOUBLE = 5, 6
+
+_POOL_OPERAND = frozenset(Opcode[name] for name in (
+  'ldc_w', 'ldc2_w', 'getstatic', 'putstatic', 'getfield', 'putfield',
+  'invokevirtual', 'invokespecial', 'invokestatic', 'invokeinterface',
+  'invokedynamic', 'new', 'anewarray', 'checkcast', 'instanceof',
+  'multianewarray'))
+
+# Attributes whose bodies are one pool index, or a u2 count of them; and
+# those whose bodies hold none.
+_SINGLE = frozenset(('ConstantValue', 'Signature', 'SourceFile', 'NestHost',
+                     'ModuleMainClass'))
+_LISTS = frozenset(('Exceptions', 'NestMembers', 'PermittedSubclasses',
+                    'ModulePackages'))
+_OPAQUE = frozenset(('SourceDebugExtension', 'LineNumberTable', 'Synthetic',
+                     'Deprecated'))
+
+
+class _Rewriter:
+  """ Rewrites the pool indexes in out, a copy of raw's bytes, through
+  remap, a list from old indexes to new ones. """
+
+  def __init__ (self, raw, out, remap):
+    self.raw = raw
+    self.data = raw.data
+    self.out = out
+    self.remap = remap
+
+  def index (self, offset, optional=False):
+    """ Rewrite the u2 index at offset; 0 is left alone if optional. """
+    old = u2(self.data, offset)
+    if old == 0 and optional:
+      return
+    new = self.remap[old]
+    if new is None:
+      raise ValueError("Index #{} at offset {} is not a constant".format(
+        old, offset))
+    self.out[offset:offset + 2] = new.to_bytes(2, 'big')
+
+  def indexes (self, offset, count, stride=2, optional=False):
+    for i in range(count):
+      self.index(offset + i*stride, optional)
+
+  def attributes (self, attributes):
+    for attribute in attributes:
+      self.index(attribute.offset - 6)
+      name = self.raw.attribute_name(attribute)
+      offset = attribute.offset
+      if name in _SINGLE:
+        self.index(offset)
+      elif name in _LISTS:
+        self.indexes(offset + 2, u2(self.data, offset))
+      elif name == 'Code':
+        self.code(offset)
+      elif name == 'StackMapTable':
+        self.stack_map(offset)
+      elif name == 'InnerClasses':
+        for entry in range(offset + 2, offset + 2 + 8*u2(self.data, offset),
+                           8):
+          self.indexes(entry, 3, optional=True)
+      elif name == 'EnclosingMethod':
+        self.index(offset)
+        self.index(offset + 2, optional=True)
+      elif name in ('LocalVariableTable', 'LocalVariableTypeTable'):
+        self.indexes(offset + 6, u2(self.data, offset), 10)
+        self.indexes(offset + 8, u2(self.data, offset), 10)
+      elif name in ('RuntimeVisibleAnnotations',
+                    'RuntimeInvisibleAnnotations'):
+        self.many(offset, self.annotation)
+      elif name in ('RuntimeVisibleParameterAnnotations',
+                    'RuntimeInvisibleParameterAnnotations'):
+        offset += 1
+        for _ in range(self.data[attribute.offset]):
+          offset = self.many(offset, self.annotation)
+      elif name in ('RuntimeVisibleTypeAnnotations',
+                    'RuntimeInvisibleTypeAnnotations'):
+        self.many(offset, self.type_annotation)
+      elif name == 'AnnotationDefault':
+        self.element_value(offset)
+      elif name == 'BootstrapMethods':
+        offset += 2
+        for _ in range(u2(self.data, attribute.offset)):
+          self.index(offset)
+          count = u2(self.data, offset + 2)
+          self.indexes(offset + 4, count)
+          offset += 4 + 2*count
+      elif name == 'MethodParameters':
+        self.indexes(offset + 1, self.data[offset], 4, optional=True)
+      elif name == 'Record':
+        offset += 2
+        for _ in range(u2(self.data, attribute.offset)):
+          self.indexes(offset, 2)
+          components, offset = read_attributes(self.data, offset + 4)
+          self.attributes(components)
+      elif name not in _OPAQUE:
+        raise ValueError("Cannot rewrite the pool indexes in a {} "
+                         "attribute".format(name))
+
+  def code (self, offset):
+    data = self.data
+    start = offset + 8
+    code = data[start:start + u4(data, offset + 4)]
+    for pc, opcode in raw_instructions(code):
+      if opcode in _POOL_OPERAND:
+        self.index(start + pc + 1)
+      elif opcode == Opcode.ldc:
+        new = self.remap[code[pc + 1]]
+        if new is None or new > 0xff:
+          raise ValueError("ldc #{} cannot be moved".format(code[pc + 1]))
+        self.out[start + pc + 1] = new
+    offset = start + len(code)
+    handlers = u2(data, offset)
+    self.indexes(offset + 8, handlers, 8, optional=True)
+    attributes, _ = read_attributes(data, offset + 2 + 8*handlers)
+    self.attributes(attributes)
+
+  def verification_types (self, offset, count):
+    for _ in range(count):
+      tag = self.data[offset]
+      if tag == 7:
+        self.index(offset + 1)
+      offset += 3 if tag in (7, 8) else 1
+    return offset
+
+  def stack_map (self, offset):
+    data = self.data
+    offset += 2
+    for _ in range(u2(data, offset - 2)):
+      frame_type = data[offset]
+      offset += 1
+      if 64 <= frame_type < 128:
+        offset = self.verification_types(offset, 1)
+      elif frame_type == 247:
+        offset = self.verification_types(offset + 2, 1)
+      elif 248 <= frame_type <= 251:
+        offset += 2
+      elif 252 <= frame_type <= 254:
+        offset = self.verification_types(offset + 2, frame_type - 251)
+      elif frame_type == 255:
+        offset = self.verification_types(offset + 4, u2(data, offset + 2))
+        offset = self.verification_types(offset + 2, u2(data, offset))
+
+  def many (self, offset, item):
+    """ Rewrite a u2 count of items at offset; returns the offset after. """
+    count = u2(self.data, offset)
+    offset += 2
+    for _ in range(count):
+      offset = item(offset)
+    return offset
+
+  def annotation (self, offset):
+    self.index(offset)
+    count = u2(self.data, offset + 2)
+    offset += 4
+    for _ in range(count):
+      self.index(offset)
+      offset = self.element_value(offset + 2)
+    return offset
+
+  def element_value (self, offset):
+    tag = chr(self.data[offset])
+    offset += 1
+    if tag in 'BCDFIJSZsc':
+      self.index(offset)
+      return offset + 2
+    if tag == 'e':
+      self.indexes(offset, 2)
+      return offset + 4
+    if tag == '@':
+      return self.annotation(offset)
+    if tag == '[':
+      return self.many(offset, self.element_value)
+    raise ValueError("Unknown element value tag {!r}".format(tag))
+
+  def type_annotation (self, offset):
+    target_type = self.data[offset]
+    offset += 1
+    if target_type in (0x00, 0x01, 0x16):
+      offset += 1
+    elif target_type in (0x10, 0x11, 0x12, 0x17, 0x42) or \
+         0x43 <= target_type <= 0x46:
+      offset += 2
+    elif target_type in (0x40, 0x41):
+      offset += 2 + 6*u2(self.data, offset)
+    elif 0x47 <= target_type <= 0x4b:
+      offset += 3
+    elif not 0x13 <= target_type <= 0x15:
+      raise ValueError("Unknown type annotation target {:#x}".format(
+        target_type))
+    offset += 1 + 2*self.data[offset]
+    return self.annotation(offset)
+
+
+def _ldc_targets (raw):
+  """ The pool indexes that ldc instructions load. """
+  targets = set()
+  for member in raw.methods:
+    attribute = raw.find_attribute(member.attributes, 'Code')
+    if attribute is None:
+      continue
+    start = attribute.offset + 8
+    code = raw.data[start:start + u4(raw.data, attribute.offset + 4)]
+    for pc, opcode in raw_instructions(code):
+      if opcode == Opcode.ldc:
+        targets.add(code[pc + 1])
+  return targets
+
+def reorder_pool (data, order):
+  """ The bytes of the class file data with its constants in order, a list
+  of their current indexes. The constants that ldc loads must end up with
+  indexes below 256. """
+  raw = RawClass(data)
+  pool = raw.pool
+  starts = [offset for offset in pool.offsets if offset is not None]
+  if sorted(order) != [idx for idx, offset in enumerate(pool.offsets)
+                       if offset is not None]:
+    raise ValueError("order must list every constant once")
+  remap = [None] * len(pool)
+  index = 1
+  for old in order:
+    remap[old] = index
+    index += 2 if pool.tag(old) in (_LONG, _DOUBLE) else 1
+
+  out = bytearray(data)
+  rewriter = _Rewriter(raw, out, remap)
+  for old in order:
+    for field in _CONSTANT_REFS.get(pool.tag(old), ()):
+      rewriter.index(pool.offsets[old] + 1 + field)
+  rewriter.index(pool.end + 2)
+  rewriter.index(pool.end + 4, optional=True)
+  rewriter.indexes(pool.end + 8, len(raw.interface_indexes))
+  offset = raw._members_offset
+  for table in (raw.fields, raw.methods):
+    offset += 2
+    for member in table:
+      rewriter.indexes(offset + 2, 2)
+      rewriter.attributes(member.attributes)
+      _, offset = read_attributes(data, offset + 6)
+  rewriter.attributes(raw.attributes)
+
+  ends = dict(zip(starts, starts[1:] + [pool.end]))
+  entries = (out[pool.offsets[old]:ends[pool.offsets[old]]] for old in order)
+  return bytes(out[:10] + b''.join(entries) + out[pool.end:])
+
+def shuffle_pool (data, seed=0):
+  """ The bytes of the class file data with its constants shuffled, except
+  that those ldc loads come first. """
+  raw = RawClass(data)
+  pool = raw.pool
+  loaded = _ldc_targets(raw)
+  first = sorted(loaded)
+  rest = [idx for idx in range(1, len(pool))
+          if pool.offsets[idx] is not None and idx not in loaded]
+  random.Random(seed).shuffle(rest)
+  return reorder_pool(data, first + rest)
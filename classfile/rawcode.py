@@ -0,0 +1,113 @@
+""" Walk Code attributes in place, without building Op_ objects. """
+
+from bisect import bisect_right
+from collections import namedtuple
+
+from classfile.bytecode import Opcode
+from classfile.header import u2, u4, read_attributes
+
+_WIDE = 0xc4
+
+def _operand_lengths ():
+  lengths = [0] * 256
+  def set_length (length, *names):
+    for name in names:
+      lengths[Opcode[name]] = length
+  set_length(1, 'bipush', 'ldc', 'newarray', 'ret',
+             'iload', 'lload', 'fload', 'dload', 'aload',
+             'istore', 'lstore', 'fstore', 'dstore', 'astore')
+  set_length(2, 'sipush', 'ldc_w', 'ldc2_w', 'iinc',
+             'getstatic', 'putstatic', 'getfield', 'putfield',
+             'invokevirtual', 'invokespecial', 'invokestatic',
+             'new', 'anewarray', 'checkcast', 'instanceof',
+             'goto', 'jsr', 'ifnull', 'ifnonnull',
+             'ifeq', 'ifne', 'iflt', 'ifge', 'ifgt', 'ifle',
+             'if_icmpeq', 'if_icmpne', 'if_icmplt', 'if_icmpge', 'if_icmpgt',
+             'if_icmple', 'if_acmpeq', 'if_acmpne')
+  set_length(3, 'multianewarray')
+  set_length(4, 'invokeinterface', 'invokedynamic', 'goto_w', 'jsr_w')
+  return lengths
+
+OPERAND_LENGTH = _operand_lengths()
+
+def instruction_length (code, pc):
+  """ The length in bytes of the instruction at code[pc]. """
+  opcode = code[pc]
+  if opcode == Opcode.tableswitch:
+    base = (pc + 4) & ~3  # Padded to a multiple of 4 from the code start
+    low = int.from_bytes(code[base + 4:base + 8], 'big', signed=True)
+    high = int.from_bytes(code[base + 8:base + 12], 'big', signed=True)
+    return base - pc + 12 + 4*(high - low + 1)
+  if opcode == Opcode.lookupswitch:
+    base = (pc + 4) & ~3
+    npairs = u4(code, base + 4)
+    return base - pc + 8 + 8*npairs
+  if opcode == _WIDE:
+    return 6 if code[pc + 1] == Opcode.iinc else 4
+  return 1 + OPERAND_LENGTH[opcode]
+
+def raw_instructions (code):
+  """ Yield (pc, opcode) for each instruction in a method's code bytes. """
+  pc = 0
+  end = len(code)
+  while pc < end:
+    yield pc, code[pc]
+    pc += instruction_length(code, pc)
+
+
+RawExceptionHandler = namedtuple('RawExceptionHandler',
+                                 ('start_pc', 'end_pc', 'handler_pc',
+                                  'catch_type_index'))
+
+class RawCode:
+  """ The parts of a Code attribute body, as offsets into the class bytes.
+
+  code is a slice of just the bytecode, so pcs index it directly.
+  """
+
+  def __init__ (self, raw, attribute):
+    data = raw.data
+    offset = attribute.offset
+    self.raw = raw
+    self.max_stack = u2(data, offset)
+    self.max_locals = u2(data, offset + 2)
+    code_length = u4(data, offset + 4)
+    offset += 8
+    self.code = data[offset:offset + code_length]
+    offset += code_length
+    count = u2(data, offset)
+    offset += 2
+    self.exception_table = [
+      RawExceptionHandler(u2(data, offset + 8*i), u2(data, offset + 8*i + 2),
+                          u2(data, offset + 8*i + 4), u2(data, offset + 8*i + 6))
+      for i in range(count)]
+    offset += 8*count
+    self.attributes, _ = read_attributes(data, offset)
+
+  @classmethod
+  def of (cls, raw, member):
+    """ The RawCode of a RawMember, or None for abstract and native methods. """
+    attribute = raw.find_attribute(member.attributes, 'Code')
+    return None if attribute is None else cls(raw, attribute)
+
+  def line_numbers (self):
+    """ Sorted (start_pc, line_number) pairs, empty without a
+    LineNumberTable. """
+    lines = []
+    data = self.raw.data
+    for attribute in self.attributes:
+      if self.raw.attribute_name(attribute) != 'LineNumberTable':
+        continue
+      count = u2(data, attribute.offset)
+      for i in range(count):
+        entry = attribute.offset + 2 + 4*i
+        lines.append((u2(data, entry), u2(data, entry + 2)))
+    lines.sort()
+    return lines
+
+  def line_at (self, pc, lines=None):
+    """ The source line of pc, or None. """
+    if lines is None:
+      lines = self.line_numbers()
+    i = bisect_right(lines, (pc, float('inf')))
+    return lines[i - 1][1] if i else None
@@ -0,0 +1,297 @@
+""" A graph of what every method on a classpath refers to, kept in SQLite.
+
+Nodes are classes, fields and methods, interned to integer ids. Edges run
+from a method to each class, field and method its code uses, and from a
+class to its super class and interfaces. References are recorded as written
+in the constant pool, so a call to an inherited method names the class it
+was invoked on. Classes are read from raw bytes and written in batches, so
+memory does not grow with the number of edges.
+
+  >>> graph = ReferenceGraph('refs.db')
+  >>> graph.build(ClassPath(['lib/a.jar']))
+  >>> graph.callers('com.acme.Foo', 'bar')
+  >>> graph.unused_classes()
+"""
+
+from collections import namedtuple
+from enum import IntEnum
+import logging
+import sqlite3
+
+from classfile.bytecode import Opcode
+from classfile.header import RawClass, u2
+from classfile.rawcode import RawCode, raw_instructions
+
+log = logging.getLogger(__name__)
+
+class NodeKind (IntEnum):
+  Class = 1
+  Field = 2
+  Method = 3
+
+  def __str__ (self):
+    return self.name
+
+class EdgeKind (IntEnum):
+  Call = 1
+  Read = 2
+  Write = 3
+  Reference = 4  # new, checkcast, instanceof, ldc of a class, ...
+  Extends = 5    # Super class or interface
+
+  def __str__ (self):
+    return self.name
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS node (
+  id INTEGER PRIMARY KEY,
+  kind INTEGER NOT NULL,
+  owner TEXT NOT NULL,
+  name TEXT NOT NULL,
+  descriptor TEXT NOT NULL,
+  defined INTEGER NOT NULL DEFAULT 0,
+  UNIQUE (owner, name, descriptor)
+);
+CREATE TABLE IF NOT EXISTS edge (
+  source INTEGER NOT NULL,
+  target INTEGER NOT NULL,
+  kind INTEGER NOT NULL,
+  PRIMARY KEY (source, target, kind)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edge_target ON edge (target, source);
+"""
+
+_CLASS, _FIELDREF, _METHODREF, _INTERFACE_METHODREF = 7, 9, 10, 11
+
+_FIELD_EDGES = {
+  Opcode.getstatic: EdgeKind.Read, Opcode.getfield: EdgeKind.Read,
+  Opcode.putstatic: EdgeKind.Write, Opcode.putfield: EdgeKind.Write,
+}
+_INVOKES = frozenset((Opcode.invokevirtual, Opcode.invokespecial,
+                      Opcode.invokestatic, Opcode.invokeinterface))
+_CLASS_OPERANDS = frozenset((Opcode.new, Opcode.anewarray, Opcode.checkcast,
+                             Opcode.instanceof, Opcode.multianewarray,
+                             Opcode.ldc_w))
+
+
+class Node (namedtuple('Node', ('kind', 'owner', 'name', 'descriptor'))):
+  """ A class (with empty name and descriptor), field or method. owner is a
+  dotted class name. """
+  __slots__ = ()
+
+  def __str__ (self):
+    if self.kind == NodeKind.Class:
+      return self.owner
+    separator = ':' if self.kind == NodeKind.Field else ''
+    return '{}.{}{}{}'.format(self.owner, self.name, separator,
+                              self.descriptor)
+
+
+def _class_node (internal_name):
+  """ The Node for a Class constant's name; arrays stand for their element
+  class, and arrays of primitives for nothing. """
+  name = internal_name.lstrip('[')
+  if name != internal_name:
+    if not name.startswith('L'):
+      return None
+    name = name[1:-1]
+  return Node(NodeKind.Class, name.replace('/', '.'), '', '')
+
+def class_references (data):
+  """ (class Node, declared member Nodes, edges) for a class file's bytes.
+
+  Each edge is (source Node, target Node, EdgeKind), without duplicates.
+  """
+  raw = RawClass(data)
+  pool = raw.pool
+  this = _class_node(raw.name)
+  owner = this.owner
+  targets = {}
+
+  def target (idx):
+    try:
+      return targets[idx]
+    except KeyError:
+      pass
+    tag = pool.tag(idx)
+    if tag == _CLASS:
+      node = _class_node(pool.class_name(idx))
+    else:
+      name_and_type = pool.u2_at(idx, 1)
+      kind = NodeKind.Field if tag == _FIELDREF else NodeKind.Method
+      node = Node(kind, pool.class_name(pool.u2_at(idx)).replace('/', '.'),
+                  pool.utf8(pool.u2_at(name_and_type)),
+                  pool.utf8(pool.u2_at(name_and_type, 1)))
+    targets[idx] = node
+    return node
+
+  edges = set()
+  for idx in [raw.super_class_index] + raw.interface_indexes:
+    if idx:
+      edges.add((this, target(idx), EdgeKind.Extends))
+
+  declared = [Node(NodeKind.Field, owner, raw.member_name(field),
+                   raw.member_descriptor(field)) for field in raw.fields]
+  for method in raw.methods:
+    source = Node(NodeKind.Method, owner, raw.member_name(method),
+                  raw.member_descriptor(method))
+    declared.append(source)
+    code = RawCode.of(raw, method)
+    if code is None:
+      continue
+    bytecode = code.code
+    for pc, opcode in raw_instructions(bytecode):
+      if opcode in _INVOKES:
+        kind = EdgeKind.Call
+      elif opcode in _FIELD_EDGES:
+        kind = _FIELD_EDGES[opcode]
+      elif opcode == Opcode.ldc:
+        if pool.tag(bytecode[pc + 1]) != _CLASS:
+          continue
+        node = target(bytecode[pc + 1])
+        if node is not None:
+          edges.add((source, node, EdgeKind.Reference))
+        continue
+      elif opcode in _CLASS_OPERANDS:
+        if pool.tag(u2(bytecode, pc + 1)) != _CLASS:
+          continue
+        kind = EdgeKind.Reference
+      else:
+        continue
+      node = target(u2(bytecode, pc + 1))
+      if node is not None:
+        edges.add((source, node, kind))
+  return this, declared, edges
+
+
+class ReferenceGraph:
+  # Node ids are cached between batches up to this many entries.
+  max_cached_nodes = 1000000
+
+  def __init__ (self, path):
+    self.path = path
+    self.db = sqlite3.connect(path)
+    self.db.executescript(_SCHEMA)
+    self._node_ids = {}
+
+  def close (self):
+    self.db.close()
+
+  def _intern (self, nodes):
+    """ Map each Node to its id, adding the new ones. """
+    ids = self._node_ids
+    missing = [node for node in nodes if node not in ids]
+    if missing:
+      db = self.db
+      db.execute("CREATE TEMP TABLE IF NOT EXISTS pending "
+                 "(kind INTEGER, owner TEXT, name TEXT, descriptor TEXT)")
+      db.execute("DELETE FROM pending")
+      db.executemany("INSERT INTO pending VALUES (?, ?, ?, ?)", missing)
+      db.execute("INSERT OR IGNORE INTO node (kind, owner, name, descriptor) "
+                 "SELECT kind, owner, name, descriptor FROM pending")
+      for id_, kind, owner, name, descriptor in db.execute(
+          "SELECT n.id, n.kind, n.owner, n.name, n.descriptor "
+          "FROM pending p JOIN node n ON n.owner = p.owner "
+          "AND n.name = p.name AND n.descriptor = p.descriptor"):
+        ids[Node(NodeKind(kind), owner, name, descriptor)] = id_
+    return [ids[node] for node in nodes]
+
+  def build (self, classpath, batch_size=500):
+    """ Replace the graph with that of a ClassPath.
+
+    Shadowed classes are skipped. Returns (classes, edges) counts.
+    """
+    db = self.db
+    with db:
+      db.execute("DELETE FROM edge")
+      db.execute("DELETE FROM node")
+    self._node_ids.clear()
+    classes = edges = 0
+    batch = []
+    for name, (_, _, _, container, resource) in classpath.headers.items():
+      try:
+        batch.append(class_references(container.read(resource)))
+      except (ValueError, IndexError) as e:
+        log.warning("Skipping %s!%s: %s", container.path, resource, e)
+        continue
+      if len(batch) >= batch_size:
+        edges += self._load(batch)
+        classes += len(batch)
+        batch = []
+    edges += self._load(batch)
+    classes += len(batch)
+    return classes, edges
+
+  def _load (self, batch):
+    if not batch:
+      return 0
+    nodes = set()
+    for this, declared, edges in batch:
+      nodes.add(this)
+      nodes.update(declared)
+      for source, target, _ in edges:
+        nodes.add(source)
+        nodes.add(target)
+    count = 0
+    db = self.db
+    with db:
+      if len(self._node_ids) > self.max_cached_nodes:
+        self._node_ids.clear()
+      nodes = list(nodes)
+      ids = dict(zip(nodes, self._intern(nodes)))
+      for this, declared, edges in batch:
+        db.executemany("UPDATE node SET defined = 1 WHERE id = ?",
+                       [(ids[this],)] + [(ids[node],) for node in declared])
+        db.executemany("INSERT OR IGNORE INTO edge VALUES (?, ?, ?)",
+                       [(ids[source], ids[target], int(kind))
+                        for source, target, kind in edges])
+        count += len(edges)
+    return count
+
+  def _reach (self, owner, name, descriptor, kinds, forward):
+    where = "owner = ?"
+    args = [owner]
+    if name is not None:
+      where += " AND name = ?"
+      args.append(name)
+    if descriptor is not None:
+      where += " AND descriptor = ?"
+      args.append(descriptor)
+    step = ("SELECT e.target FROM reach JOIN edge e ON e.source = reach.id"
+            if forward else
+            "SELECT e.source FROM reach JOIN edge e ON e.target = reach.id")
+    if kinds is not None:
+      step += " WHERE e.kind IN ({})".format(
+        ', '.join(str(int(kind)) for kind in kinds))
+    query = ("WITH RECURSIVE start (id) AS (SELECT id FROM node WHERE " +
+             where + "), reach (id) AS (SELECT id FROM start UNION " + step +
+             ") SELECT n.kind, n.owner, n.name, n.descriptor FROM reach "
+             "JOIN node n ON n.id = reach.id "
+             "WHERE reach.id NOT IN (SELECT id FROM start) "
+             "ORDER BY n.owner, n.name, n.descriptor")
+    return [Node(NodeKind(kind), *rest)
+            for kind, *rest in self.db.execute(query, args)]
+
+  def callees (self, owner, name=None, descriptor=None, kinds=None):
+    """ Everything transitively used by owner.name, or by all of owner when
+    name is None. kinds limits which EdgeKinds are followed. """
+    return self._reach(owner, name, descriptor, kinds, True)
+
+  def callers (self, owner, name=None, descriptor=None, kinds=None):
+    """ Every method and class that transitively uses owner.name, or any
+    part of owner when name is None. """
+    return self._reach(owner, name, descriptor, kinds, False)
+
+  def unused_classes (self):
+    """ Classes on the classpath that no other class refers to. """
+    return [owner for owner, in self.db.execute(
+      "SELECT c.owner FROM node c WHERE c.kind = ? AND c.defined AND "
+      "NOT EXISTS (SELECT 1 FROM node t JOIN edge e ON e.target = t.id "
+      "JOIN node s ON s.id = e.source "
+      "WHERE t.owner = c.owner AND s.owner != c.owner) "
+      "ORDER BY c.owner", (int(NodeKind.Class),))]
+
+  def is_class (self, owner):
+    return self.db.execute(
+      "SELECT 1 FROM node WHERE owner = ? AND name = '' AND descriptor = ''",
+      (owner,)).fetchone() is not None
@@ -0,0 +1,209 @@
+""" Answer questions about many classes straight from their bytes.
+
+Nothing here builds a ClassFile. Each query first rejects classes that cannot
+match with a cheap test on the raw bytes or the constant pool, and only walks
+the layout of the few that remain, skipping Code and other attribute bodies
+by length.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from classfile.bytecode import Opcode
+from classfile.classpath import open_container
+from classfile.header import RawClass, u2
+from classfile.rawcode import RawCode, raw_instructions
+
+_ANNOTATIONS = 'RuntimeVisibleAnnotations'
+_INVISIBLE_ANNOTATIONS = 'RuntimeInvisibleAnnotations'
+
+
+def _skip_element_value (data, offset):
+  tag = data[offset]
+  offset += 1
+  if tag in b'BCDFIJSZsc':
+    return offset + 2
+  if tag == ord('e'):
+    return offset + 4
+  if tag == ord('@'):
+    return _skip_annotation(data, offset)
+  if tag == ord('['):
+    count = u2(data, offset)
+    offset += 2
+    for _ in range(count):
+      offset = _skip_element_value(data, offset)
+    return offset
+  raise ValueError("Unknown ElementValue tag: {}".format(tag))
+
+def _skip_annotation (data, offset):
+  pairs = u2(data, offset + 2)
+  offset += 4
+  for _ in range(pairs):
+    offset = _skip_element_value(data, offset + 2)
+  return offset
+
+def _type_name (descriptor):
+  if descriptor.startswith('L') and descriptor.endswith(';'):
+    return descriptor[1:-1].replace('/', '.')
+  return descriptor
+
+def annotation_types (raw, attributes, visible_only=False):
+  """ Yield the dotted type names of the annotations in an attribute table.
+
+  Only the annotation type indexes are decoded; element values are stepped
+  over.
+  """
+  names = (_ANNOTATIONS,) if visible_only else (_ANNOTATIONS,
+                                                _INVISIBLE_ANNOTATIONS)
+  data = raw.data
+  for attribute in attributes:
+    if raw.attribute_name(attribute) not in names:
+      continue
+    offset = attribute.offset
+    count = u2(data, offset)
+    offset += 2
+    for _ in range(count):
+      yield _type_name(raw.pool.utf8(u2(data, offset)))
+      offset = _skip_annotation(data, offset)
+
+
+ClassAnnotations = namedtuple('ClassAnnotations', ('name', 'annotations',
+                                                   'members'))
+ClassAnnotations.__doc__ = """ Annotation type names found on a class.
+annotations are the class's own; members maps (name, descriptor) of each
+annotated field or method to its annotations. """
+
+def _descriptor_bytes (names):
+  return [b'L' + name.replace('.', '/').encode() + b';' for name in names]
+
+def scan_annotations (data, wanted=None, members=False, visible_only=False):
+  """ The ClassAnnotations of a class file, or None if it cannot match.
+
+  If wanted (dotted annotation names) is given, a class whose bytes do not
+  contain any of their descriptors is rejected before its constant pool is
+  even walked; that is almost every class on a typical classpath.
+  """
+  if wanted is not None:
+    if not any(descriptor in data for descriptor in _descriptor_bytes(wanted)):
+      return None
+  raw = RawClass(data)
+  found_members = {}
+  if members:
+    for member in raw.fields + raw.methods:
+      names = tuple(annotation_types(raw, member.attributes, visible_only))
+      if names:
+        key = (raw.member_name(member), raw.member_descriptor(member))
+        found_members[key] = names
+  return ClassAnnotations(
+    raw.name.replace('/', '.'),
+    tuple(annotation_types(raw, raw.attributes, visible_only)),
+    found_members)
+
+def find_annotated (classpath, wanted, members=False, visible_only=False):
+  """ Yield the ClassAnnotations of every class on a ClassPath carrying one of
+  the wanted annotations, on the class itself or, with members, on a field
+  or method.
+  """
+  wanted = set(wanted)
+  for resource in classpath.resources():
+    result = scan_annotations(resource.container.read(resource.name), wanted,
+                              members, visible_only)
+    if result is None:
+      continue
+    if wanted.intersection(result.annotations) or any(
+        wanted.intersection(names) for names in result.members.values()):
+      yield result
+
+
+_METHODREF, _INTERFACE_METHODREF = 10, 11
+_INVOKES = {Opcode.invokevirtual, Opcode.invokespecial, Opcode.invokestatic,
+            Opcode.invokeinterface}
+
+Caller = namedtuple('Caller', ('class_name', 'method_name', 'descriptor',
+                               'pc', 'line'))
+Caller.__doc__ = """ One invoke instruction calling the method searched for.
+line is None when the class has no LineNumberTable. """
+
+def parse_method_spec (spec):
+  """ Split 'pkg.Owner.name' or 'pkg.Owner.name(desc)' into internal owner,
+  name and descriptor (None if absent). """
+  descriptor = None
+  if '(' in spec:
+    spec, descriptor = spec.split('(', 1)
+    descriptor = '(' + descriptor
+  owner, _, name = spec.rpartition('.')
+  if not owner or not name:
+    raise ValueError("Expected Owner.method, got {!r}".format(spec))
+  return owner.replace('.', '/'), name, descriptor
+
+def _matching_refs (pool, owner, name, descriptor):
+  refs = set()
+  for idx in range(1, len(pool)):
+    if pool.tag(idx) not in (_METHODREF, _INTERFACE_METHODREF):
+      continue
+    name_and_type = pool.u2_at(idx, 1)
+    if pool.utf8(pool.u2_at(name_and_type)) != name:
+      continue
+    if pool.class_name(pool.u2_at(idx)) != owner:
+      continue
+    if descriptor is not None and \
+       pool.utf8(pool.u2_at(name_and_type, 1)) != descriptor:
+      continue
+    refs.add(idx)
+  return refs
+
+def scan_callers (data, owner, name, descriptor=None):
+  """ Yield a Caller for each call to owner.name in a class file's bytes.
+
+  owner is an internal (slash separated) name. The class is rejected by a
+  substring search for owner and name, then by its pool, before any code is
+  looked at; code is walked instruction by instruction only in the methods
+  of classes that reference the target.
+  """
+  if owner.encode() not in data or name.encode() not in data:
+    return
+  raw = RawClass(data)
+  refs = _matching_refs(raw.pool, owner, name, descriptor)
+  if not refs:
+    return
+  class_name = raw.name.replace('/', '.')
+  for method in raw.methods:
+    code = RawCode.of(raw, method)
+    if code is None:
+      continue
+    lines = None
+    bytecode = code.code
+    for pc, opcode in raw_instructions(bytecode):
+      if opcode in _INVOKES and u2(bytecode, pc + 1) in refs:
+        if lines is None:
+          lines = code.line_numbers()
+        yield Caller(class_name, raw.member_name(method),
+                     raw.member_descriptor(method), pc,
+                     code.line_at(pc, lines))
+
+def _container_callers (path, owner, name, descriptor):
+  container = open_container(path)
+  try:
+    return [caller
+            for resource in container.resources()
+            for caller in scan_callers(container.read(resource.name), owner,
+                                       name, descriptor)]
+  finally:
+    container.close()
+
+def find_callers (classpath, owner, name, descriptor=None, jobs=None):
+  """ Every Caller of owner.name on a ClassPath, in classpath order.
+
+  With jobs other than 1, containers are scanned in parallel processes.
+  """
+  paths = [container.path for container in classpath.containers]
+  args = (owner, name, descriptor)
+  if jobs == 1 or len(paths) < 2:
+    for path in paths:
+      yield from _container_callers(path, *args)
+    return
+  with ProcessPoolExecutor(jobs) as executor:
+    futures = [executor.submit(_container_callers, path, *args)
+               for path in paths]
+    for future in futures:
+      yield from future.result()
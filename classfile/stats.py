@@ -0,0 +1,206 @@
+""" Per-method bytecode metrics for a whole classpath, as NumPy columns.
+
+Methods are read from raw class bytes straight into a structured array,
+which grows by doubling, and an N x 256 matrix of opcode counts. Names are
+stored once each in a string table and referred to by index, so nothing is
+kept per method as Python objects. Needs NumPy.
+
+  >>> stats = MethodStats()
+  >>> stats.collect(ClassPath(['lib/a.jar']))
+  >>> stats.save('a.npz')
+  >>> np.load('a.npz')['methods']['max_stack'].max()
+  >>> string_table(np.load('a.npz'))[0]
+"""
+
+import logging
+
+import numpy as np
+
+from classfile.bytecode import Opcode
+from classfile.header import RawClass, u4
+from classfile.rawcode import RawCode, raw_instructions
+
+log = logging.getLogger(__name__)
+
+METHOD_DTYPE = np.dtype([
+  ('class', np.int32),        # Index into classes
+  ('name', np.int32),         # Index into strings
+  ('descriptor', np.int32),   # Index into strings
+  ('access_flags', np.uint16),
+  ('code_length', np.uint32),
+  ('max_stack', np.uint16),
+  ('max_locals', np.uint16),
+  ('instructions', np.uint32),
+  ('handlers', np.uint16),
+  ('switches', np.uint16),
+  ('switch_cases', np.uint32),  # Summed over all switches
+  ('largest_switch', np.uint32),
+])
+
+CLASS_DTYPE = np.dtype([
+  ('name', np.int32),         # Index into strings
+  ('access_flags', np.uint16),
+  ('major_version', np.uint16),
+  ('pool_size', np.uint16),
+  ('methods', np.uint16),
+  ('fields', np.uint16),
+])
+
+
+def _switch_cases (code, pc):
+  base = (pc + 4) & ~3
+  if code[pc] == Opcode.tableswitch:
+    low = int.from_bytes(code[base + 4:base + 8], 'big', signed=True)
+    high = int.from_bytes(code[base + 8:base + 12], 'big', signed=True)
+    return high - low + 1
+  return u4(code, base + 4)
+
+
+class _Columns:
+  """ A structured array and a count matrix that grow by doubling. """
+
+  def __init__ (self, dtype, width=0, capacity=1024):
+    self.rows = np.zeros(capacity, dtype=dtype)
+    self.matrix = np.zeros((capacity, width), dtype=np.uint32) \
+                  if width else None
+    self.count = 0
+
+  def append (self):
+    """ The index of a new, zeroed row. """
+    if self.count == len(self.rows):
+      self.rows = np.resize(self.rows, 2*len(self.rows))
+      self.rows[self.count:] = 0
+      if self.matrix is not None:
+        grown = np.zeros((2*len(self.matrix), self.matrix.shape[1]),
+                         dtype=self.matrix.dtype)
+        grown[:self.count] = self.matrix[:self.count]
+        self.matrix = grown
+    self.count += 1
+    return self.count - 1
+
+  def truncate (self, count):
+    """ Drop the rows from count on, zeroing them for reuse. """
+    self.rows[count:self.count] = 0
+    if self.matrix is not None:
+      self.matrix[count:self.count] = 0
+    self.count = count
+
+
+class MethodStats:
+  def __init__ (self):
+    self._methods = _Columns(METHOD_DTYPE, 256)
+    self._classes = _Columns(CLASS_DTYPE)
+    self._strings = {}
+
+  def __len__ (self):
+    return self._methods.count
+
+  def _string (self, text):
+    try:
+      return self._strings[text]
+    except KeyError:
+      index = self._strings[text] = len(self._strings)
+      return index
+
+  def add_class (self, data):
+    """ Add a row for a class file's bytes and one for each of its
+    methods. If the class turns out to be malformed, nothing is added. """
+    classes, methods = self._classes.count, self._methods.count
+    strings = len(self._strings)
+    try:
+      self._add_class(data)
+    except BaseException:
+      self._classes.truncate(classes)
+      self._methods.truncate(methods)
+      for text in list(self._strings)[strings:]:
+        del self._strings[text]
+      raise
+
+  def _add_class (self, data):
+    raw = RawClass(data)
+    class_id = self._classes.append()
+    row = self._classes.rows[class_id]
+    row['name'] = self._string(raw.name.replace('/', '.'))
+    row['access_flags'] = raw.access_flags
+    row['major_version'] = raw.major_version
+    row['pool_size'] = len(raw.pool)
+    row['methods'] = len(raw.methods)
+    row['fields'] = len(raw.fields)
+
+    for method in raw.methods:
+      index = self._methods.append()
+      row = self._methods.rows[index]
+      row['class'] = class_id
+      row['name'] = self._string(raw.member_name(method))
+      row['descriptor'] = self._string(raw.member_descriptor(method))
+      row['access_flags'] = method.access_flags
+      code = RawCode.of(raw, method)
+      if code is None:
+        continue
+      bytecode = code.code
+      row['code_length'] = len(bytecode)
+      row['max_stack'] = code.max_stack
+      row['max_locals'] = code.max_locals
+      row['handlers'] = len(code.exception_table)
+      pcs = []
+      switches = cases = largest = 0
+      for pc, opcode in raw_instructions(bytecode):
+        pcs.append(pc)
+        if opcode == Opcode.tableswitch or opcode == Opcode.lookupswitch:
+          size = _switch_cases(bytecode, pc)
+          switches += 1
+          cases += size
+          largest = max(largest, size)
+      row['instructions'] = len(pcs)
+      row['switches'] = switches
+      row['switch_cases'] = cases
+      row['largest_switch'] = largest
+      opcodes = np.frombuffer(bytecode, dtype=np.uint8)[pcs]
+      self._methods.matrix[index] = np.bincount(opcodes, minlength=256)
+
+  def collect (self, classpath):
+    """ Add every class on a ClassPath, shadowed ones excluded. Returns the
+    number of classes added. """
+    added = 0
+    for name, (_, _, _, container, resource) in classpath.headers.items():
+      try:
+        self.add_class(container.read(resource))
+      except (ValueError, IndexError) as e:
+        log.warning("Skipping %s!%s: %s", container.path, resource, e)
+        continue
+      added += 1
+    return added
+
+  def arrays (self):
+    """ The columns as a dict of arrays, trimmed to the rows filled in.
+
+    methods and classes are structured arrays, opcodes is the methods x 256
+    count matrix, and strings and string_offsets are the table that name and
+    descriptor columns index: string i is the UTF-8 in strings from
+    string_offsets[i] to string_offsets[i + 1] (see string_table).
+    """
+    # In index order, since indexes are handed out as strings are added.
+    encoded = [text.encode('utf-8', 'surrogateescape')
+               for text in self._strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+    return {
+      'methods': self._methods.rows[:self._methods.count],
+      'opcodes': self._methods.matrix[:self._methods.count],
+      'classes': self._classes.rows[:self._classes.count],
+      'strings': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+      'string_offsets': offsets,
+    }
+
+  def save (self, path):
+    """ Write the columns to an .npz file; np.load reads it back without
+    pickling. """
+    np.savez_compressed(path, **self.arrays())
+
+
+def string_table (arrays):
+  """ The string table of arrays, or of a loaded .npz, as a list. """
+  data = arrays['strings'].tobytes()
+  offsets = arrays['string_offsets'].tolist()
+  return [data[start:end].decode('utf-8', 'surrogateescape')
+          for start, end in zip(offsets, offsets[1:])]
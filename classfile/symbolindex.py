@@ -0,0 +1,240 @@
+""" A persistent inverted index of the constants in every class on a classpath.
+
+Symbols are string literals, Utf8 constants, and class, field and method
+references, taken straight from each class's raw constant pool. They are kept
+in SQLite with an FTS5 trigram index for substring queries (SQLite 3.34 or
+later). All queries are case-sensitive, as Java names are. Re-indexing
+only touches class files whose stamp (a jar entry's CRC32) changed.
+
+  >>> index = SymbolIndex('symbols.db')
+  >>> index.update(ClassPath(['lib/a.jar']))
+  >>> index.search('jdbc:', substring=True)
+"""
+
+from collections import namedtuple
+from enum import IntEnum
+import logging
+import os
+import sqlite3
+
+from classfile.header import RawClass
+
+log = logging.getLogger(__name__)
+
+class SymbolKind (IntEnum):
+  String = 1
+  Utf8 = 2
+  Class = 3
+  Field = 4
+  Method = 5
+
+  def __str__ (self):
+    return self.name
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resource (
+  id INTEGER PRIMARY KEY,
+  container TEXT NOT NULL,
+  name TEXT NOT NULL,
+  stamp INTEGER NOT NULL,
+  class_name TEXT,
+  UNIQUE (container, name)
+);
+CREATE TABLE IF NOT EXISTS symbol (
+  id INTEGER PRIMARY KEY,
+  kind INTEGER NOT NULL,
+  text TEXT NOT NULL,
+  UNIQUE (text, kind)
+);
+CREATE TABLE IF NOT EXISTS occurrence (
+  symbol_id INTEGER NOT NULL,
+  resource_id INTEGER NOT NULL,
+  PRIMARY KEY (symbol_id, resource_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS occurrence_resource ON occurrence (resource_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS symbol_text USING fts5 (
+  text, content='symbol', content_rowid='id',
+  tokenize='trigram case_sensitive 1'
+);
+"""
+
+# PRAGMA user_version of an up to date index. Indexes before version 1 had
+# a case-insensitive trigram index.
+_SCHEMA_VERSION = 1
+
+_STRING, _UTF8, _CLASS, _FIELDREF, _METHODREF, _INTERFACE_METHODREF = \
+  8, 1, 7, 9, 10, 11
+
+def pool_symbols (data):
+  """ (class name, set of (SymbolKind, text)) for a class file's bytes. """
+  raw = RawClass(data)
+  pool = raw.pool
+  symbols = set()
+
+  def member (idx):
+    owner = pool.class_name(pool.u2_at(idx)).replace('/', '.')
+    name_and_type = pool.u2_at(idx, 1)
+    return (owner, pool.utf8(pool.u2_at(name_and_type)),
+            pool.utf8(pool.u2_at(name_and_type, 1)))
+
+  for idx in range(1, len(pool)):
+    tag = pool.tag(idx)
+    if tag == _UTF8:
+      symbols.add((SymbolKind.Utf8, pool.utf8(idx)))
+    elif tag == _STRING:
+      symbols.add((SymbolKind.String, pool.utf8(pool.u2_at(idx))))
+    elif tag == _CLASS:
+      symbols.add((SymbolKind.Class,
+                   pool.class_name(idx).replace('/', '.')))
+    elif tag == _FIELDREF:
+      symbols.add((SymbolKind.Field, '{}.{}:{}'.format(*member(idx))))
+    elif tag in (_METHODREF, _INTERFACE_METHODREF):
+      symbols.add((SymbolKind.Method, '{}.{}{}'.format(*member(idx))))
+  return raw.name.replace('/', '.'), symbols
+
+
+Hit = namedtuple('Hit', ('kind', 'text', 'container', 'name', 'class_name'))
+
+
+class SymbolIndex:
+  # Symbol ids are cached between batches up to this many entries.
+  max_cached_symbols = 1000000
+
+  def __init__ (self, path):
+    self.path = path
+    self.db = sqlite3.connect(path)
+    version = self.db.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+      self.db.execute("DROP TABLE IF EXISTS symbol_text")
+    self.db.executescript(_SCHEMA)
+    if version < _SCHEMA_VERSION:
+      with self.db:
+        self.db.execute("INSERT INTO symbol_text (symbol_text) "
+                        "VALUES ('rebuild')")
+        self.db.execute("PRAGMA user_version = {}".format(_SCHEMA_VERSION))
+    self._symbol_ids = {}
+
+  def close (self):
+    self.db.close()
+
+  def _resource_stamps (self, container):
+    return {name: (id_, stamp) for id_, name, stamp in self.db.execute(
+      "SELECT id, name, stamp FROM resource WHERE container = ?",
+      (container,))}
+
+  def _intern (self, symbols):
+    """ Map each (kind, text) to its symbol id, adding the new ones. """
+    ids = self._symbol_ids
+    missing = [symbol for symbol in symbols if symbol not in ids]
+    if missing:
+      db = self.db
+      db.execute("CREATE TEMP TABLE IF NOT EXISTS pending "
+                 "(kind INTEGER, text TEXT)")
+      db.execute("DELETE FROM pending")
+      db.executemany("INSERT INTO pending VALUES (?, ?)", missing)
+      last = db.execute("SELECT coalesce(max(id), 0) FROM symbol").fetchone()[0]
+      db.execute("INSERT OR IGNORE INTO symbol (kind, text) "
+                 "SELECT kind, text FROM pending")
+      db.execute("INSERT INTO symbol_text (rowid, text) "
+                 "SELECT id, text FROM symbol WHERE id > ?", (last,))
+      for id_, kind, text in db.execute(
+          "SELECT s.id, s.kind, s.text FROM pending p "
+          "JOIN symbol s ON s.kind = p.kind AND s.text = p.text"):
+        ids[(kind, text)] = id_
+    return [ids[symbol] for symbol in symbols]
+
+  def update (self, classpath, batch_size=500):
+    """ Bring the index up to date with a ClassPath.
+
+    Returns (indexed, unchanged, removed) resource counts. Class files are
+    loaded in transactions of batch_size, so an interrupted run keeps what
+    it finished.
+    """
+    indexed = unchanged = removed = 0
+    db = self.db
+    for container in classpath.containers:
+      path = os.path.abspath(container.path)
+      known = self._resource_stamps(path)
+      pending = []
+      for resource in container.resources():
+        previous = known.pop(resource.name, None)
+        if previous is not None and previous[1] == resource.stamp:
+          unchanged += 1
+          continue
+        pending.append((previous, resource))
+        if len(pending) >= batch_size:
+          indexed += self._load(path, container, pending)
+          pending = []
+      indexed += self._load(path, container, pending)
+      with db:
+        for id_, _ in known.values():
+          db.execute("DELETE FROM occurrence WHERE resource_id = ?", (id_,))
+          db.execute("DELETE FROM resource WHERE id = ?", (id_,))
+          removed += 1
+    return indexed, unchanged, removed
+
+  def _load (self, path, container, pending):
+    if not pending:
+      return 0
+    parsed = []
+    batch_symbols = set()
+    for previous, resource in pending:
+      try:
+        class_name, symbols = pool_symbols(container.read(resource.name))
+      except (ValueError, IndexError) as e:
+        log.warning("Skipping %s!%s: %s", path, resource.name, e)
+        class_name, symbols = None, set()
+      parsed.append((previous, resource, class_name, symbols))
+      batch_symbols |= symbols
+
+    db = self.db
+    with db:
+      if len(self._symbol_ids) > self.max_cached_symbols:
+        self._symbol_ids.clear()
+      batch_symbols = list(batch_symbols)
+      symbol_ids = dict(zip(batch_symbols, self._intern(batch_symbols)))
+      for previous, resource, class_name, symbols in parsed:
+        if previous is None:
+          resource_id = db.execute(
+            "INSERT INTO resource (container, name, stamp, class_name) "
+            "VALUES (?, ?, ?, ?)",
+            (path, resource.name, resource.stamp, class_name)).lastrowid
+        else:
+          resource_id = previous[0]
+          db.execute("UPDATE resource SET stamp = ?, class_name = ? "
+                     "WHERE id = ?", (resource.stamp, class_name, resource_id))
+          db.execute("DELETE FROM occurrence WHERE resource_id = ?",
+                     (resource_id,))
+        db.executemany("INSERT INTO occurrence VALUES (?, ?)",
+                       ((symbol_ids[symbol], resource_id)
+                        for symbol in symbols))
+    return len(pending)
+
+  def search (self, text, kind=None, substring=False, limit=None):
+    """ Hits for symbols equal to text or, with substring, containing it.
+
+    Substring queries of three or more characters use the trigram index;
+    shorter ones fall back to a scan. Either way, case matters.
+    """
+    if substring and len(text) >= 3:
+      where = ("s.id IN (SELECT rowid FROM symbol_text "
+               "WHERE symbol_text MATCH ?)")
+      args = ['"{}"'.format(text.replace('"', '""'))]
+    elif substring:
+      where = "instr(s.text, ?) > 0"
+      args = [text]
+    else:
+      where = "s.text = ?"
+      args = [text]
+    if kind is not None:
+      where += " AND s.kind = ?"
+      args.append(int(kind))
+    query = ("SELECT s.kind, s.text, r.container, r.name, r.class_name "
+             "FROM symbol s JOIN occurrence o ON o.symbol_id = s.id "
+             "JOIN resource r ON r.id = o.resource_id WHERE " + where +
+             " ORDER BY s.kind, s.text, r.container, r.name")
+    if limit is not None:
+      query += " LIMIT ?"
+      args.append(limit)
+    return [Hit(SymbolKind(kind), *rest)
+            for kind, *rest in self.db.execute(query, args)]
@@ -0,0 +1,58 @@
+""" UTF-8 constants shared between class files.
+
+The class files of a program name the same things over and over:
+java/lang/Object, <init>, ()V, Code, LineNumberTable. Parsed on its own,
+every ClassFile has a ConstantUtf8 of its own for each. Parsed with a
+SymbolTable, a class gets the ConstantUtf8 already made for the same bytes
+by any class still alive, and its own copy is dropped. The table holds
+its constants weakly, so one goes away once no ClassFile uses it.
+
+  >>> symbols = SymbolTable()
+  >>> classes = [ClassFile.from_bytes(data, symbols=symbols) for data in ...]
+  >>> print(symbols)
+
+A ConstantUtf8 refers to nothing in its constant pool, so it can belong to
+many pools at once.
+"""
+
+import sys
+import threading
+import weakref
+
+
+class SymbolTable:
+  """ One ConstantUtf8 per distinct value, for as long as any is in use.
+
+  seen counts the constants interned, and shared those that were replaced
+  by one already in the table. bytes_saved is what the replaced objects
+  and their bytes took up. It is a lower bound, since it leaves out where
+  their attributes were kept. Safe to share between threads.
+  """
+
+  def __init__ (self):
+    self._symbols = weakref.WeakValueDictionary()
+    self._lock = threading.Lock()
+    self.seen = 0
+    self.shared = 0
+    self.bytes_saved = 0
+
+  def intern (self, constant):
+    """ The ConstantUtf8 in the table with the bytes of constant, or else
+    constant itself, which is added. """
+    with self._lock:
+      self.seen += 1
+      symbol = self._symbols.setdefault(constant.bytes, constant)
+      if symbol is not constant:
+        self.shared += 1
+        self.bytes_saved += (sys.getsizeof(constant) +
+                             sys.getsizeof(constant.bytes))
+      return symbol
+
+  def __len__ (self):
+    """ How many distinct constants are alive. """
+    return len(self._symbols)
+
+  def __str__ (self):
+    return ('{} UTF-8 constants, {} distinct alive, {} shared, '
+            '{:.1f} KB saved'.format(self.seen, len(self), self.shared,
+                                     self.bytes_saved / 1024))
@@ -1,8 +1,133 @@
+from classfile.bytecode import Opcode
+from classfile.constant import ReferenceKind
 from classfile.descriptor import ClassDescriptor, ArrayDescriptor
 from classfile.flags import *
+from decompyler.regions import build_try_regions
 from formatter import Document
 
-def decompyle (classfile):
+def render_call_site (site, simplify_class=str):
+  """ Java-like source for an invokedynamic CallSite. """
+  if site.is_lambda and len(site.arguments) >= 2:
+    interface = simplify_class(site.descriptor.return_type)
+    handle = site.arguments[1]
+    target = handle.reference
+    owner = simplify_class(target.cls)
+    name = target.name_and_type.name.string
+    if handle.reference_kind is ReferenceKind.REF_newInvokeSpecial:
+      body = '{}::new'.format(owner)
+    elif name.startswith('lambda$'):
+      body = 'lambda -> {}.{}'.format(owner, name)
+    else:
+      body = '{}::{}'.format(owner, name)
+    return '({}.{}) {}'.format(interface, site.name, body)
+
+  if site.is_string_concat and site.name == 'makeConcatWithConstants':
+    arg_types = iter(site.descriptor.arg_types)
+    constants = iter(site.arguments[1:])
+    parts = []
+    literal = []
+    def flush ():
+      if literal:
+        parts.append('"{}"'.format(''.join(literal).replace('\\', r'\\')
+                                   .replace('"', r'\"')))
+        literal.clear()
+    for char in site.arguments[0].value.string:
+      if char == '\x01':
+        flush()
+        parts.append('({})'.format(simplify_class(next(arg_types))))
+      elif char == '\x02':
+        flush()
+        parts.append(str(next(constants)))
+      else:
+        literal.append(char)
+    flush()
+    return ' + '.join(parts) or '""'
+
+  return '{}.{}({}) {}{}'.format(simplify_class(site.bootstrap_class),
+                                 site.bootstrap_name,
+                                 ', '.join(str(arg) for arg in site.arguments),
+                                 site.name, site.descriptor)
+
+def render_method_body (classfile, method, simplify_class=str):
+  """ The lines of a method's body: its try regions, then its bytecode. """
+  def describe_op (op):
+    if op.opcode is Opcode.invokedynamic and \
+       op.call_site_index in classfile.call_sites:
+      return 'invokedynamic {}'.format(
+        render_call_site(classfile.call_sites[op.call_site_index],
+                         simplify_class))
+    return str(op)
+
+  code = method.attributes.Code
+  lines = []
+  for region in build_try_regions(code):
+    lines.extend(region.describe(simplify_class))
+  lines.extend(code.byte_code.formatted(describe_op))
+  return lines
+
+def inner_class_entry (classfile):
+  """ The InnerClasses entry a nested class has for itself, or None. """
+  if 'InnerClasses' in classfile.attributes:
+    this_class = str(classfile.this_class)
+    for entry in classfile.attributes.InnerClasses.classes:
+      if str(entry.inner_class_info) == this_class:
+        return entry
+  return None
+
+def inner_class_flags (classfile):
+  """ The access flags a nested class was declared with, from its own
+  InnerClasses entry, or its class access flags if it has none. """
+  entry = inner_class_entry(classfile)
+  if entry is not None:
+    return entry.inner_class_access_flags
+  return classfile.access_flags
+
+def nested_name (classfile, suffix):
+  """ The name a nested class is declared with, from its InnerClasses
+  entry: Local for a local class Outer$1Local. An anonymous class has no
+  name there and keeps its binary one, Outer$1. suffix, the part of the
+  binary name after the enclosing class's, is used if there is no entry.
+  """
+  entry = inner_class_entry(classfile)
+  if entry is None:
+    return suffix
+  if entry.inner_name is None:
+    return classfile.this_class.class_name
+  return entry.inner_name.string
+
+def nested_kind (classfile):
+  """ 'anonymous' or 'local' for a class declared in a method body, which
+  has no outer class in its InnerClasses entry, or else None. """
+  entry = inner_class_entry(classfile)
+  if entry is None or entry.outer_class_info is not None:
+    return None
+  return 'anonymous' if entry.inner_name is None else 'local'
+
+def nest_classes (outer, classes):
+  """ Sort classes, ClassFiles named outer$..., under their closest
+  enclosing class: returns {enclosing class name: [(nested_name,
+  ClassFile)]}. """
+  names = {str(classfile.this_class): classfile for classfile in classes}
+  nested = {}
+  for name in sorted(names):
+    parent = outer
+    for prefix in names:
+      if len(prefix) > len(parent) and name.startswith(prefix + '$'):
+        parent = prefix
+    nested.setdefault(parent, []).append(
+      (nested_name(names[name], name[len(parent) + 1:]), names[name]))
+  return nested
+
+def decompyle (classfile, bodies=None, nested=()):
+  """ Java-like source for a ClassFile.
+
+  bodies, if given, supplies method bodies in place of render_method_body
+  through its body(classfile, method, simplify_class, render) method; see
+  decompyler.incremental.
+
+  nested are the ClassFiles of classes declared inside this one, such as
+  Outer$Inner and Outer$Inner$1, which are rendered inside its body.
+  """
   implicit = {None, 'java.lang', classfile.this_class.package}
   imports = set()
   namespace = set()
@@ -21,25 +146,62 @@ def decompyle (classfile):
 
     return class_.class_name
 
+  def annotate (doc, attributes):
+    for name in ('RuntimeVisibleAnnotations', 'RuntimeInvisibleAnnotations'):
+      if name in attributes:
+        for annotation in getattr(attributes, name).annotations:
+          line = doc.join(sep='')
+          line.append('@')
+          line.append(simplify_class(annotation.descriptor))
+          if annotation.element_value_pairs:
+            line.append('({})'.format(', '.join(
+              str(pair) for pair in annotation.element_value_pairs)))
+
   class_def = Document()
   package_decl = class_def.section()
   import_block = class_def.section()
-  decl, class_body = class_def.block()
 
   if classfile.this_class.package:
     package_decl.line('package', classfile.this_class.package)
 
+  inner = nest_classes(str(classfile.this_class), nested)
+  declare_class(class_def, classfile, classfile.this_class.class_name,
+                classfile.access_flags, inner, simplify_class, annotate,
+                bodies)
+
+  # Imports should all have been collected...
+  for class_ in sorted(imports):
+    import_block.line('import', class_)
+
+  return str(class_def)
+
+def declare_class (doc, classfile, name, access_flags, inner,
+                   simplify_class, annotate, bodies, kind=None):
+  """ Add the declaration of a class to doc, with the classes inner lists
+  for it nested inside. kind is the nested_kind of a nested class. """
+  annotate(doc, classfile.attributes)
+  decl, class_body = doc.block()
+
   class_fields = class_body.section()
   class_methods = class_body.section()
 
-  for flag in sorted(classfile.access_flags):
+  for flag in sorted(access_flags):
     if flag is ClassAccessFlags.ACC_PUBLIC:
       decl.append('public')
+    elif flag is ClassAccessFlags.ACC_PRIVATE:
+      decl.append('private')
+    elif flag is ClassAccessFlags.ACC_PROTECTED:
+      decl.append('protected')
+    elif flag is ClassAccessFlags.ACC_STATIC:
+      decl.append('static')
     elif flag is ClassAccessFlags.ACC_FINAL:
       decl.append('final')
     elif flag is ClassAccessFlags.ACC_ABSTRACT:
       decl.append('abstract')
 
+  if kind is not None:
+    decl.append('/* {} */'.format(kind))
+
   if ClassAccessFlags.ACC_INTERFACE in classfile.access_flags:
     decl.append('interface')
   elif ClassAccessFlags.ACC_ENUM in classfile.access_flags:
@@ -47,7 +209,7 @@ def decompyle (classfile):
   else:
     decl.append('class')
 
-  decl.append(classfile.this_class.class_name)
+  decl.append(name)
 
   if str(classfile.super_class) != 'java.lang.Object':
     decl.append('extends')
@@ -59,6 +221,7 @@ def decompyle (classfile):
     ifaces.extend(simplify_class(cls.descriptor) for cls in classfile.interfaces)
 
   for field in classfile.fields:
+    annotate(class_fields, field.attributes)
     field_line = class_fields.line()
     for flag in sorted(field.access_flags):
       if flag is FieldAccessFlags.ACC_PUBLIC:
@@ -88,6 +251,7 @@ def decompyle (classfile):
 
   for method in classfile.methods:
     method_def = class_methods.section()
+    annotate(method_def, method.attributes)
     if MethodAccessFlags.ACC_ABSTRACT in method.access_flags:
       method_decl = method_def.line()
       method_body = None
@@ -116,7 +280,7 @@ def decompyle (classfile):
         #continue
         method_decl.append('/* synthetic */')
     if method.name.string == '<init>':
-      method_decl.append(classfile.this_class.class_name)
+      method_decl.append(name)
     else:
       method_decl.append(simplify_class(method.descriptor.return_type))
       method_decl.append(method.name)
@@ -130,10 +294,14 @@ def decompyle (classfile):
       arglist.join(simplify_class(arg_type), 'arg{}'.format(i))
 
     if method_body is not None:
-      method_body.extend(method.attributes.Code.byte_code.formatted())
+      if bodies is None:
+        method_body.extend(render_method_body(classfile, method,
+                                              simplify_class))
+      else:
+        method_body.extend(bodies.body(classfile, method, simplify_class,
+                                       render_method_body))
 
-  # Imports should all have been collected...
-  for class_ in sorted(imports):
-    import_block.line('import', class_)
-
-  return str(class_def)
+  for inner_name, inner_class in inner.get(str(classfile.this_class), ()):
+    declare_class(class_body.section(), inner_class, inner_name,
+                  inner_class_flags(inner_class), inner, simplify_class,
+                  annotate, bodies, nested_kind(inner_class))
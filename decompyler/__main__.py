@@ -1,7 +1,6 @@
 import sys
-import decompyler
-import classfile
 
-classfile = classfile.ClassFile.from_file(sys.argv[1])
-#print()
-print(decompyler.decompyle(classfile))
+from decompyler.cli import main
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -0,0 +1,321 @@
+""" Batch decompilation that survives bad classes.
+
+Each class is decompiled in a supervised worker process with a wall-clock
+timeout and, where the platform has it, an RLIMIT_AS cap on its address
+space. A class that fails to parse or decompile, runs out of memory, takes
+too long or kills its worker gets a Failure record and a fallback output
+instead of stopping the run: a bytecode listing when the class parsed, or
+else a stub built from its header alone. A worker that timed out, crashed
+or ran out of memory is replaced.
+
+  >>> sink = DirectorySink('out/')
+  >>> report = BatchDecompiler(sink, timeout=30, memory_limit=1 << 30).run(
+  ...   [open_container('app.jar')])
+  >>> sink.close()
+"""
+
+from collections import namedtuple
+import json
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import time
+
+from classfile import ClassFile
+from classfile.header import read_summary
+import decompyler
+from decompyler.sinks import entry_rank
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+log = logging.getLogger(__name__)
+
+ERROR, MEMORY, TIMEOUT, CRASH = 'error', 'memory', 'timeout', 'crash'
+
+
+class Failure (namedtuple('Failure', ('name', 'kind', 'stage', 'message'))):
+  """ Why a class file got a fallback output. kind is ERROR, MEMORY,
+  TIMEOUT or CRASH; stage is 'parse' or 'decompile', or None when the
+  worker never reported back. """
+  __slots__ = ()
+
+  def __str__ (self):
+    stage = ' ({})'.format(self.stage) if self.stage else ''
+    return '{}: {}{}: {}'.format(self.name, self.kind, stage, self.message)
+
+  def to_json (self):
+    return json.dumps(self._asdict())
+
+
+class BatchReport (namedtuple('BatchReport', ('decompiled', 'failures',
+                                             'seconds'))):
+  __slots__ = ()
+
+  def __str__ (self):
+    return '{} classes decompiled, {} fell back, in {:.1f} s'.format(
+      self.decompiled, len(self.failures), self.seconds)
+
+
+def class_name (resource_name):
+  return resource_name[:-len('.class')].replace('/', '.')
+
+def _commented (lines):
+  return '\n'.join('// ' + line if line else '//' for line in lines)
+
+def header_stub (data, failure):
+  """ Source for a class known only by its header: its declaration, with
+  its members listed in comments. """
+  try:
+    summary = read_summary(data)
+  except (ValueError, IndexError) as e:
+    return _commented([str(failure), 'Unreadable header: {}'.format(e)])
+  lines = [_commented([str(failure)])]
+  declaration = 'class {}'.format(summary.name)
+  if summary.super_class:
+    declaration += ' extends {}'.format(summary.super_class)
+  if summary.interfaces:
+    declaration += ' implements {}'.format(', '.join(summary.interfaces))
+  lines.append(declaration + ' {')
+  for kind, members in (('field', summary.fields),
+                        ('method', summary.methods)):
+    for member in members:
+      lines.append('  // {} {} {}'.format(kind, member.name,
+                                          member.descriptor))
+  lines.append('}')
+  return '\n'.join(lines)
+
+def bytecode_listing (classfile, failure):
+  """ Source for a class that parsed but would not decompile: its full
+  description, commented out. """
+  return _commented([str(failure)] + str(classfile).split('\n'))
+
+
+def decompile_one (name, data, prepare=None):
+  """ Decompile a class file, falling back as described above. Returns
+  (class name, prepared source, Failure or None). A fallback is named
+  after the resource, so a broken copy of a class never replaces the
+  output of a good one. """
+  failure = None
+  stage = 'parse'
+  try:
+    classfile = ClassFile.from_bytes(data)
+    stage = 'decompile'
+    this_class, source = str(classfile.this_class), \
+                         decompyler.decompyle(classfile)
+    classfile.release()
+  except MemoryError:
+    failure = Failure(name, MEMORY, stage, 'memory limit exceeded')
+  except Exception as e:
+    failure = Failure(name, ERROR, stage, '{}: {}'.format(type(e).__name__,
+                                                          e))
+  if failure is not None:
+    this_class = class_name(name)
+    source = None
+    if stage == 'decompile':
+      try:
+        source = bytecode_listing(classfile, failure)
+      except Exception:
+        pass
+    if source is None:
+      source = header_stub(data, failure)
+  if prepare is not None:
+    source = prepare(this_class, source)
+  return this_class, source, failure
+
+def _serve (conn, memory_limit, prepare):
+  """ A worker's loop: decompile each (name, data) sent on conn and send
+  back the result, until told to stop or out of memory. """
+  if memory_limit and resource is not None:
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+  while True:
+    try:
+      task = conn.recv()
+    except EOFError:
+      return
+    if task is None:
+      return
+    try:
+      result = decompile_one(*task, prepare=prepare)
+      conn.send(result)
+    except MemoryError:
+      # Out of memory outside the parse, say while preparing or sending the
+      # output. The parent falls back on its own.
+      result = None
+      conn.send(None)
+    if result is None or (result[2] is not None and result[2].kind == MEMORY):
+      # The heap may be left fragmented past the limit; start over.
+      return
+
+
+class _Worker:
+  def __init__ (self, memory_limit, prepare):
+    self.conn, child = multiprocessing.Pipe()
+    self.process = multiprocessing.Process(
+      target=_serve, args=(child, memory_limit, prepare), daemon=True)
+    self.process.start()
+    child.close()
+    self.task = None
+    self.deadline = None
+
+  def send (self, task, timeout):
+    """ Hand over a (ClassResource, data) task. """
+    self.task = task
+    self.deadline = time.monotonic() + timeout
+    resource, data = task
+    self.conn.send((resource.name, data))
+
+  def stop (self):
+    try:
+      self.conn.send(None)
+    except OSError:
+      pass
+    self.conn.close()
+    self.process.join(1)
+    if self.process.is_alive():
+      self.process.kill()
+      self.process.join()
+
+  def kill (self):
+    self.process.kill()
+    self.process.join()
+    self.conn.close()
+
+
+class BatchDecompiler:
+  """ Decompiles every class file of some containers into sink (see
+  decompyler.sinks) on workers supervised as described above.
+
+  timeout is in seconds per class; memory_limit is in bytes per worker, or
+  None for no limit. on_failure, if given, is called with each Failure as
+  it happens. With a MemoryBudget, memory_limit defaults to a share of it,
+  and no new class is handed out while usage is near it. With a started
+  Journal (see decompyler.journal), only the class files it does not list
+  are decompiled, and each output, fallbacks included, is recorded there.
+  """
+
+  def __init__ (self, sink, workers=None, timeout=60, memory_limit=None,
+                on_failure=None, budget=None, journal=None):
+    self.sink = sink
+    self.journal = journal
+    self.workers = workers or os.cpu_count() or 1
+    self.timeout = timeout
+    if memory_limit is None and budget is not None:
+      memory_limit = budget.worker_limit(self.workers)
+    self.memory_limit = memory_limit
+    self.budget = budget
+    self.on_failure = on_failure
+    self._containers = []
+    if memory_limit and resource is None:
+      log.warning("No RLIMIT_AS on this platform; memory is not limited")
+
+  def _spawn (self):
+    return _Worker(self.memory_limit, getattr(self.sink, 'prepare', None))
+
+  def _fallback (self, name, data, failure):
+    this_class, source = class_name(name), header_stub(data, failure)
+    prepare = getattr(self.sink, 'prepare', None)
+    if prepare is not None:
+      source = prepare(this_class, source)
+    return this_class, source, failure
+
+  def _finish (self, resource, result, failures):
+    this_class, prepared, failure = result
+    record = self.sink(this_class, prepared,
+                       entry_rank(self._containers, resource))
+    if self.journal is not None:
+      self.journal.record(resource, this_class, record)
+    if failure is not None:
+      log.warning("%s", failure)
+      failures.append(failure)
+      if self.on_failure is not None:
+        self.on_failure(failure)
+
+  def _crashed (self, worker, failures):
+    resource, data = worker.task
+    self._finish(resource, self._fallback(resource.name, data, Failure(
+      resource.name, CRASH, None, 'worker exited with code {}'.format(
+        worker.process.exitcode))), failures)
+
+  def run (self, containers):
+    """ Decompile the class files of containers and return a BatchReport. """
+    started = time.monotonic()
+    containers = self._containers = list(containers)
+    if self.journal is not None:
+      resources = self.journal.remaining
+    else:
+      resources = lambda container: container.resources()
+    tasks = ((resource, container.read(resource.name))
+             for container in containers
+             for resource in resources(container))
+    idle = [self._spawn() for _ in range(self.workers)]
+    busy = {}
+    failures = []
+    done = 0
+    try:
+      while True:
+        while idle:
+          if busy and self.budget is not None and self.budget.check():
+            break
+          task = next(tasks, None)
+          if task is None:
+            break
+          worker = idle.pop()
+          try:
+            worker.send(task, self.timeout)
+          except OSError:
+            # The worker died while idle, say of its memory limit.
+            worker.kill()
+            self._crashed(worker, failures)
+            done += 1
+            idle.append(self._spawn())
+            continue
+          busy[worker.conn] = worker
+        if not busy:
+          break
+
+        now = time.monotonic()
+        timeout = max(0, min(worker.deadline for worker in busy.values()) -
+                         now)
+        for conn in wait(list(busy), timeout):
+          worker = busy.pop(conn)
+          resource, data = worker.task
+          try:
+            result = conn.recv()
+          except (EOFError, OSError):
+            worker.kill()
+            self._crashed(worker, failures)
+            done += 1
+            idle.append(self._spawn())
+            continue
+          if result is None:
+            result = self._fallback(resource.name, data, Failure(
+              resource.name, MEMORY, None, 'memory limit exceeded'))
+          if result[2] is not None and result[2].kind == MEMORY:
+            worker.stop()
+            worker = self._spawn()
+          self._finish(resource, result, failures)
+          done += 1
+          idle.append(worker)
+
+        now = time.monotonic()
+        for conn, worker in list(busy.items()):
+          if worker.deadline <= now:
+            del busy[conn]
+            worker.kill()
+            resource, data = worker.task
+            self._finish(resource, self._fallback(resource.name, data, Failure(
+              resource.name, TIMEOUT, None,
+              'no result after {} s'.format(self.timeout))), failures)
+            done += 1
+            idle.append(self._spawn())
+    finally:
+      for worker in idle:
+        worker.stop()
+      for worker in busy.values():
+        worker.kill()
+    return BatchReport(done - len(failures), failures,
+                       time.monotonic() - started)
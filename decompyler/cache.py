@@ -0,0 +1,41 @@
+""" A bounded cache of decompiled sources, shared by the decompile service
+and SourceTree. """
+
+from collections import OrderedDict
+
+
+class OutputCache:
+  """ Sources by key, such as a class file digest or a path, least recently
+  used first, holding at most max_bytes characters of source. """
+
+  def __init__ (self, max_bytes):
+    self.max_bytes = max_bytes
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self._sources = OrderedDict()
+
+  def get (self, key):
+    source = self._sources.get(key)
+    if source is None:
+      self.misses += 1
+      return None
+    self.hits += 1
+    self._sources.move_to_end(key)
+    return source
+
+  def put (self, key, source):
+    if key in self._sources or len(source) > self.max_bytes:
+      return
+    self._sources[key] = source
+    self.size += len(source)
+    while self.size > self.max_bytes:
+      _, evicted = self._sources.popitem(last=False)
+      self.size -= len(evicted)
+
+  def __contains__ (self, key):
+    """ Whether key is cached, without counting a hit or a miss. """
+    return key in self._sources
+
+  def __len__ (self):
+    return len(self._sources)
@@ -0,0 +1,186 @@
+""" The command line of python -m decompyler. """
+
+import argparse
+import logging
+import os
+import sys
+
+import classfile
+import decompyler
+from classfile.classpath import open_container
+from classfile.descriptor import set_descriptor_cache
+from decompyler.batch import BatchDecompiler
+from decompyler.incremental import IncrementalDecompiler
+from decompyler.journal import Journal, previous_run
+from decompyler.memory import MemoryBudget
+from decompyler.pipeline import Pipeline
+from decompyler.sinks import DirectorySink, ZipSink
+
+
+def build_parser (prog='python -m decompyler'):
+  parser = argparse.ArgumentParser(prog=prog)
+  parser.add_argument('input', help="A class file ('-' for standard "
+                                    "input), or with -o a jar or directory "
+                                    "of class files")
+  parser.add_argument('-o', '--output',
+                      help='Write one .java file per class under this '
+                           'directory, redoing only what changed since the '
+                           'last run, or into this .jar or .zip')
+  parser.add_argument('--manifest',
+                      help='Manifest of the last run (default: '
+                           'OUTPUT/.decompyler-manifest)')
+  parser.add_argument('--full', action='store_true',
+                      help='Ignore the manifest and decompile everything')
+  parser.add_argument('-j', '--jobs', type=int, metavar='N',
+                      help='With -o, decompile everything on N worker '
+                           'processes instead, replacing the output when done '
+                           '(0: one per CPU; the default for a jar)')
+  parser.add_argument('--threads', action='store_true',
+                      help='With -j, decompile on N threads rather than '
+                           'processes; for free-threaded Python')
+  parser.add_argument('--stats', type=float, metavar='SECONDS',
+                      help='With -j, print each stage\'s progress and '
+                           'queue depth this often; with --max-memory, '
+                           'memory use too (default 5)')
+  parser.add_argument('--max-memory', type=int, metavar='MB',
+                      help='With -o, keep the resident memory of the run '
+                           'and its workers under this, sizing queues and '
+                           'caches to fit and pausing new work near it')
+  parser.add_argument('--isolate', action='store_true',
+                      help='With -o, decompile each class in a supervised '
+                           'worker, falling back to a bytecode listing or '
+                           'header stub for classes that fail')
+  parser.add_argument('--timeout', type=float, default=60,
+                      help='With --isolate, seconds allowed per class '
+                           '(default 60)')
+  parser.add_argument('--memory-limit', type=int, metavar='MB',
+                      help='With --isolate, address space allowed per worker')
+  parser.add_argument('--errors', metavar='FILE',
+                      help='With --isolate, write a JSON line per failure '
+                           'here')
+  parser.add_argument('--resume', action='store_true',
+                      help='With -j or --isolate, carry on with an '
+                           'interrupted run of the same input and output, '
+                           'skipping the classes its journal lists')
+  parser.add_argument('--journal', metavar='FILE',
+                      help='With -j or --isolate, the run\'s journal '
+                           '(default: OUTPUT.journal)')
+  return parser
+
+def _batch (args):
+  """ Whether arguments ask for a batch run rather than an incremental
+  one. """
+  return args.jobs is not None or args.isolate or \
+         args.output.endswith(('.jar', '.zip'))
+
+def check_args (parser, args):
+  if args.output is not None and args.input == '-':
+    parser.error('-o needs a jar or directory, not standard input')
+  if args.resume and (args.output is None or not _batch(args)):
+    parser.error('--resume needs -o with -j or --isolate; other runs into '
+                 'a directory are incremental anyway')
+
+def run (args, out=sys.stdout, err=sys.stderr, own_process=True):
+  """ Do what parsed arguments ask, printing results to out and progress
+  to err. Unless the run has the process to itself (own_process), the
+  process's descriptor memo is left as it is, whatever --max-memory says. """
+  if args.output is None:
+    print(decompyler.decompyle(classfile.ClassFile.from_file(args.input)),
+          file=out)
+    return
+
+  budget = None
+  if args.max_memory is not None:
+    budget = MemoryBudget(args.max_memory << 20)
+    if own_process:
+      set_descriptor_cache(budget.descriptor_cache_size())
+    if args.stats is None:
+      args.stats = 5.0
+
+  if _batch(args):
+    if args.jobs is None and not args.isolate:
+      args.jobs = 0
+    journal_path = args.journal or \
+                   os.path.normpath(args.output) + '.journal'
+    header = {'input': os.path.abspath(args.input),
+              'output': os.path.abspath(args.output)}
+    previous = previous_run(journal_path, header, args.resume)
+    scratch = previous.header.get('scratch') if previous else None
+    if args.output.endswith(('.jar', '.zip')):
+      sink = ZipSink(args.output, spool=scratch)
+    else:
+      sink = DirectorySink(args.output, scratch)
+    journal = Journal(journal_path, header, sink, previous)
+    errors = None
+    if args.errors:
+      errors = open(args.errors, 'a' if journal.previous else 'w')
+    container = open_container(args.input)
+    try:
+      resumed = journal.start([container])
+      if resumed:
+        print('Resuming: {} classes already done'.format(resumed),
+              file=err)
+      if args.isolate:
+        def record (failure):
+          if errors is not None:
+            print(failure.to_json(), file=errors, flush=True)
+        memory_limit = args.memory_limit and args.memory_limit << 20
+        results = [BatchDecompiler(sink, args.jobs, args.timeout,
+                                   memory_limit, record, budget,
+                                   journal).run([container])]
+      else:
+        def report (stats):
+          stages = [str(stage) for stage in stats]
+          if budget is not None:
+            stages.append(str(budget))
+          print('; '.join(stages), file=err)
+        results = Pipeline(sink, processes=args.jobs, threads=args.threads,
+                           budget=budget, journal=journal,
+                           resize_memo=own_process).run_sync(
+          [container], args.stats, report)
+    except BaseException:
+      # Keep the sink's scratch space for --resume while this journal, or
+      # the one it was to carry on, names it.
+      if journal.close():
+        print('Stopped; run again with --resume to carry on',
+              file=err)
+      elif journal.previous is None:
+        sink.abort()
+      raise
+    else:
+      sink.close()
+      journal.finish()
+    finally:
+      container.close()
+      if errors is not None:
+        errors.close()
+    for result in results:
+      print(result, file=out)
+    return
+
+  manifest = args.manifest or os.path.join(args.output,
+                                           '.decompyler-manifest')
+  if args.full and os.path.exists(manifest):
+    os.remove(manifest)
+  incremental = IncrementalDecompiler(args.output, manifest)
+  container = open_container(args.input)
+  try:
+    print(incremental.run(container, budget=budget, interval=args.stats,
+                          report=lambda budget: print(budget, file=err)),
+          file=out)
+  finally:
+    container.close()
+    incremental.close()
+
+def main (argv):
+  parser = build_parser()
+  args = parser.parse_args(argv)
+  check_args(parser, args)
+  logging.basicConfig(format='%(levelname)s: %(message)s')
+  try:
+    run(args)
+  except FileExistsError as e:
+    sys.exit('error: {}'.format(e))
+  except KeyboardInterrupt:
+    # run has said how to carry on, if there is a way.
+    sys.exit(130)
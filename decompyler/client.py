@@ -0,0 +1,86 @@
+""" python -m decompyler, answered by a running decompyler.service.
+
+Takes the same arguments as python -m decompyler, plus --socket, and
+--benchmark N to time N requests for the input that the service must
+decompile, and N it may answer from its cache, against a cold run of
+python -m decompyler.
+"""
+
+import base64
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from decompyler.cli import build_parser, check_args
+from decompyler.service import Client, default_socket
+
+
+def _decompile_request (args):
+  if args.input == '-':
+    return {'data': base64.b64encode(sys.stdin.buffer.read()).decode()}
+  return {'path': os.path.abspath(args.input)}
+
+def _time_requests (client, request, runs):
+  times = []
+  for _ in range(runs):
+    started = time.perf_counter()
+    client.request('decompile', **request)
+    times.append(time.perf_counter() - started)
+  return times
+
+def benchmark (client, args, runs):
+  request = _decompile_request(args)
+  # Decompiled every time, first on workers that may not have seen the
+  # class, then answered from the service's cache.
+  uncached = _time_requests(client, dict(request, cache=False), runs)
+  cached = _time_requests(client, request, runs)
+  started = time.perf_counter()
+  subprocess.run([sys.executable, '-m', 'decompyler', args.input],
+                 input=base64.b64decode(request['data'])
+                       if 'data' in request else None,
+                 stdout=subprocess.DEVNULL, check=True)
+  cold = time.perf_counter() - started
+  rows = [('first request', uncached[0])]
+  for label, times in (('decompiled', uncached), ('cached', cached)):
+    times = sorted(times)
+    rows.append((label + ' median', statistics.median(times)))
+    rows.append((label + ' p95', times[int(0.95*(len(times) - 1))]))
+  rows.append(('cold process', cold))
+  for label, value in rows:
+    print('{:>20}: {:9.2f} ms'.format(label, 1000*value))
+
+def main (argv):
+  parser = build_parser('python -m decompyler.client')
+  parser.add_argument('--socket', help='The service\'s Unix socket '
+                                       '(default: {})'.format(default_socket()))
+  parser.add_argument('--benchmark', type=int, metavar='N',
+                      help='Time N decompile requests for the input')
+  args = parser.parse_args(argv)
+  check_args(parser, args)
+
+  client = Client(args.socket)
+  try:
+    if args.benchmark:
+      benchmark(client, args, args.benchmark)
+    elif args.output is None:
+      print(client.request('decompile', **_decompile_request(args))['source'])
+    else:
+      options = vars(args).copy()
+      del options['socket'], options['benchmark']
+      for name in ('input', 'output', 'manifest', 'errors', 'journal'):
+        if options[name] is not None:
+          options[name] = os.path.abspath(options[name])
+      response = client.response(client.send('run', args=options))
+      sys.stderr.write(response.get('stderr', ''))
+      if 'error' in response:
+        sys.exit('error: {}'.format(response['error']))
+      sys.stdout.write(response['output'])
+  except RuntimeError as e:
+    sys.exit('error: {}'.format(e))
+  finally:
+    client.close()
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -0,0 +1,150 @@
+""" Basic blocks and control flow graphs of method bytecode. """
+
+from classfile.bytecode import Opcode
+
+_UNCONDITIONAL = {
+  Opcode.goto, Opcode.goto_w, Opcode.athrow, Opcode.ret, Opcode.wide_ret,
+  Opcode.tableswitch, Opcode.lookupswitch,
+  Opcode.ireturn, Opcode.lreturn, Opcode.freturn, Opcode.dreturn,
+  Opcode.areturn, Opcode['return'],
+}
+
+def branch_targets (op):
+  """ Absolute pcs an instruction can jump to, not counting fall through. """
+  targets = [op.pc + getattr(op, name)
+             for name in op.parsed_names() if name.endswith('_offset')]
+  if op.opcode is Opcode.tableswitch:
+    targets.extend(op.pc + offset for offset in op.jump_table)
+  elif op.opcode is Opcode.lookupswitch:
+    targets.extend(op.pc + pair.offset for pair in op.lookup_table)
+  return targets
+
+def falls_through (op):
+  return op.opcode not in _UNCONDITIONAL
+
+
+class BasicBlock:
+  """ A maximal straight-line run of instructions [start_pc, end_pc).
+
+  successors are the normal control flow edges. handlers are the blocks
+  reached if an instruction in this block throws, innermost first.
+  """
+
+  def __init__ (self, index, ops):
+    self.index = index
+    self.ops = ops
+    self.start_pc = ops[0].pc
+    self.successors = []
+    self.predecessors = []
+    self.handlers = []
+    self.end_pc = None
+
+  def __repr__ (self):
+    return "<BasicBlock #{} [{}, {})>".format(self.index, self.start_pc,
+                                             self.end_pc)
+
+
+class ControlFlowGraph:
+  """ The basic blocks of an AttributeCode. blocks[0] is the entry block.
+
+  name, say the method's, is used in errors. Code that jumps or hands
+  exceptions to a pc that is not the start of an instruction raises
+  ValueError.
+  """
+
+  def __init__ (self, code, name='code'):
+    self.name = name
+    ops = list(code.byte_code)
+    index = code.handler_index
+
+    leaders = {0}
+    for handler in index:
+      leaders.update((handler.start_pc, handler.end_pc, handler.handler_pc))
+    for op, following in zip(ops, ops[1:]):
+      targets = branch_targets(op)
+      if targets or not falls_through(op):
+        leaders.update(targets)
+        leaders.add(following.pc)
+
+    self.blocks = []
+    self._block_at = {}
+    current = []
+    for op in ops:
+      if current and op.pc in leaders:
+        self._add_block(current)
+        current = []
+      current.append(op)
+    if current:
+      self._add_block(current)
+
+    code_length = code.byte_code.code_length
+    for block, following in zip(self.blocks, self.blocks[1:] + [None]):
+      block.end_pc = following.start_pc if following else code_length
+
+    for block, following in zip(self.blocks, self.blocks[1:] + [None]):
+      last = block.ops[-1]
+      targets = branch_targets(last)
+      if falls_through(last) and following is not None:
+        targets.append(following.start_pc)
+      for pc in targets:
+        self._link(block, self._target(pc, last.pc))
+      for handler in index.covering(block.start_pc, block.end_pc):
+        block.handlers.append(self._target(handler.handler_pc))
+
+  def _target (self, pc, source=None):
+    """ The block starting at pc, which source (None for an exception
+    handler) goes to. """
+    block = self._block_at.get(pc)
+    if block is None:
+      if source is None:
+        source = 'An exception handler'
+      else:
+        source = 'The instruction at pc {}'.format(source)
+      raise ValueError("{}: {} goes to pc {}, which does not start an "
+                       "instruction".format(self.name, source, pc))
+    return block
+
+  def _add_block (self, ops):
+    block = BasicBlock(len(self.blocks), ops)
+    self.blocks.append(block)
+    self._block_at[block.start_pc] = block
+
+  @staticmethod
+  def _link (block, successor):
+    if successor not in block.successors:
+      block.successors.append(successor)
+      successor.predecessors.append(block)
+
+  @property
+  def entry (self):
+    return self.blocks[0]
+
+  def block_at (self, pc):
+    """ The block starting at pc. """
+    return self._block_at[pc]
+
+  def reverse_postorder (self):
+    """ Blocks reachable from the entry, each before its successors where
+    possible. Exception handlers count as successors. """
+    seen = set()
+    order = []
+    stack = [(self.entry, iter(self.entry.successors + self.entry.handlers))]
+    seen.add(self.entry.index)
+    while stack:
+      block, children = stack[-1]
+      for child in children:
+        if child.index not in seen:
+          seen.add(child.index)
+          stack.append((child, iter(child.successors + child.handlers)))
+          break
+      else:
+        stack.pop()
+        order.append(block)
+    order.reverse()
+    return order
+
+  def __iter__ (self):
+    return iter(self.blocks)
+
+  def __len__ (self):
+    return len(self.blocks)
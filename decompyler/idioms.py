@@ -0,0 +1,168 @@
+""" Find compiler idioms in instruction streams in a single pass.
+
+An Idiom is a fixed-length sequence of Steps. Each Step accepts a set of
+opcodes and, optionally, a predicate over the instruction's operands. Every
+idiom given to an IdiomMatcher is compiled into one Aho-Corasick automaton
+over opcodes, so finding all of them costs one walk over a method's
+instructions however many idioms there are; predicates are only checked on
+the windows whose opcodes already match.
+
+  >>> matcher = IdiomMatcher(STANDARD_IDIOMS)
+  >>> for match in matcher.find(code.byte_code):
+  ...   print(match.idiom.name, match.pc)
+"""
+
+from collections import deque
+from itertools import product
+
+from classfile.bytecode import Opcode
+
+
+class Step:
+  """ One instruction of an idiom: any of opcodes, and where(op) if given. """
+
+  def __init__ (self, *opcodes, where=None):
+    self.opcodes = tuple(Opcode[code] if isinstance(code, str) else code
+                         for code in opcodes)
+    self.where = where
+
+  def accepts (self, op):
+    return self.where is None or self.where(op)
+
+  def __repr__ (self):
+    return "<Step {}>".format('|'.join(code.name for code in self.opcodes))
+
+
+class Idiom:
+  def __init__ (self, name, *steps):
+    if not steps:
+      raise ValueError("Idiom {} has no steps".format(name))
+    self.name = name
+    self.steps = steps
+
+  def __len__ (self):
+    return len(self.steps)
+
+  def __repr__ (self):
+    return "<Idiom {}: {}>".format(self.name, list(self.steps))
+
+
+class Match:
+  def __init__ (self, idiom, ops):
+    self.idiom = idiom
+    self.ops = ops
+
+  @property
+  def pc (self):
+    return self.ops[0].pc
+
+  def __repr__ (self):
+    return "<Match {} @ {}>".format(self.idiom.name, self.pc)
+
+
+class _State:
+  __slots__ = ('goto', 'fail', 'output')
+
+  def __init__ (self):
+    self.goto = {}
+    self.fail = None
+    self.output = []
+
+
+class IdiomMatcher:
+  def __init__ (self, idioms):
+    self.idioms = list(idioms)
+    self._root = root = _State()
+
+    for idiom in self.idioms:
+      for opcodes in product(*(step.opcodes for step in idiom.steps)):
+        state = root
+        for code in opcodes:
+          state = state.goto.setdefault(code, _State())
+        state.output.append(idiom)
+
+    # Breadth first, so every fail link points at an already finished state.
+    queue = deque()
+    for state in root.goto.values():
+      state.fail = root
+      queue.append(state)
+    while queue:
+      state = queue.popleft()
+      for code, child in state.goto.items():
+        fail = state.fail
+        while fail is not root and code not in fail.goto:
+          fail = fail.fail
+        child.fail = fail.goto.get(code, root)
+        child.output.extend(child.fail.output)
+        queue.append(child)
+
+  def find (self, ops):
+    """ Yield a Match for every idiom occurrence, in order of last pc.
+
+    Occurrences may overlap; a rewrite stage picks among them.
+    """
+    root = self._root
+    longest = max((len(idiom) for idiom in self.idioms), default=0)
+    window = deque(maxlen=longest)
+    state = root
+    for op in ops:
+      window.append(op)
+      code = op.opcode
+      while state is not root and code not in state.goto:
+        state = state.fail
+      state = state.goto.get(code, root)
+      for idiom in state.output:
+        candidate = list(window)[-len(idiom):]
+        if all(step.accepts(each) for step, each in zip(idiom.steps, candidate)):
+          yield Match(idiom, candidate)
+
+
+def _loads (prefix):
+  return (prefix + 'load',) + tuple('{}load_{}'.format(prefix, i)
+                                    for i in range(4))
+
+def _method (owners, *names):
+  def where (op):
+    ref = op.method
+    return (str(ref.cls) in owners and
+            (not names or ref.name_and_type.name.string in names))
+  return where
+
+def _field (test):
+  def where (op):
+    return test(op.field_ref.name_and_type.name.string)
+  return where
+
+_BOXES = {'java.lang.Boolean', 'java.lang.Byte', 'java.lang.Character',
+          'java.lang.Short', 'java.lang.Integer', 'java.lang.Long',
+          'java.lang.Float', 'java.lang.Double'}
+
+STANDARD_IDIOMS = [
+  # new T; dup; <args>; invokespecial T.<init> - the args vary, so only the
+  # allocation is matched here.
+  Idiom('new_dup', Step('new'), Step('dup')),
+  Idiom('string_builder_append',
+        Step('invokevirtual',
+             where=_method({'java.lang.StringBuilder',
+                            'java.lang.StringBuffer'}, 'append'))),
+  Idiom('loop_increment',
+        Step('iinc', 'wide_iinc'),
+        Step('goto', 'goto_w', where=lambda op: op.branch_offset < 0)),
+  Idiom('assert_guard',
+        Step('getstatic', where=_field(lambda name:
+                                       name == '$assertionsDisabled')),
+        Step('ifne')),
+  Idiom('enum_switch_map',
+        Step('getstatic', where=_field(lambda name:
+                                       name.startswith('$SwitchMap$'))),
+        Step(*_loads('a')),
+        Step('invokevirtual', where=lambda op:
+             op.method.name_and_type.name.string == 'ordinal'),
+        Step('iaload')),
+  Idiom('autobox',
+        Step('invokestatic', where=_method(_BOXES, 'valueOf'))),
+  Idiom('unbox',
+        Step('invokevirtual', where=_method(_BOXES,
+             'booleanValue', 'byteValue', 'charValue', 'shortValue',
+             'intValue', 'longValue', 'floatValue', 'doubleValue'))),
+]
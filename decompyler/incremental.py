@@ -0,0 +1,282 @@
+""" Re-decompile a jar or class directory, redoing only what changed.
+
+A manifest (an SQLite file) remembers, for every class file of the last run,
+its stamp (a jar entry's CRC32, read from the central directory), where its
+source went, and a key for each method's code. A class whose stamp is
+unchanged is not even decompressed. In a class that did change, a method
+whose Code attribute bytes and referenced constants hash to a stored key
+gets its previously rendered body spliced back in, as long as the class
+names it used still render the same way in the new class.
+
+Each .java file belongs to the first class file in the container that
+decompiles to it. Later ones that would overwrite it, as in a multi-release
+jar, are skipped with a warning and not recorded, so they are looked at
+again on every run in case the first goes away.
+
+  >>> run = IncrementalDecompiler('out/')
+  >>> print(run.run(open_container('app.jar')))
+"""
+
+from collections import namedtuple
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+
+from classfile import ClassFile
+from classfile.descriptor import ArrayDescriptor, ClassDescriptor
+from classfile.fingerprint import constant_key, member_key
+from classfile.header import RawClass
+from classfile.meta import Constant
+import decompyler
+from decompyler.sinks import output_path
+
+log = logging.getLogger(__name__)
+
+# Bump whenever rendering changes, to throw away stored bodies and outputs.
+FORMAT_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS setting (
+  name TEXT PRIMARY KEY,
+  value
+);
+CREATE TABLE IF NOT EXISTS entry (
+  name TEXT PRIMARY KEY,
+  stamp INTEGER NOT NULL,
+  output TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS method (
+  entry TEXT NOT NULL,
+  member TEXT NOT NULL,
+  key BLOB NOT NULL,
+  PRIMARY KEY (entry, member)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS method_key ON method (key);
+CREATE TABLE IF NOT EXISTS body (
+  key BLOB PRIMARY KEY,
+  lines TEXT NOT NULL,
+  classes TEXT NOT NULL
+);
+"""
+
+
+def code_key (raw_code, method, bootstrap_methods=None):
+  """ A digest of a Code attribute's bytes and of every constant its
+  instructions and handlers refer to, so a reordered pool changes it. """
+  digest = hashlib.blake2b(raw_code, digest_size=16)
+  code = method.attributes.Code
+  keys = [constant_key(handler.catch_type)
+          for handler in code.exception_table]
+  for op in code.byte_code:
+    for name in type(op).parsed_names():
+      value = getattr(op, name)
+      if isinstance(value, Constant):
+        keys.append(constant_key(value, bootstrap_methods))
+  digest.update(repr(keys).encode('utf-8', 'surrogatepass'))
+  return digest.digest()
+
+class BodyCache:
+  """ Method bodies for decompyle(), from the manifest when they can be.
+
+  keys maps member_key to code_key for the class being decompiled. A stored
+  body is reused if every class it named still simplifies to the same text;
+  asking simplify_class also re-adds the imports the body needs.
+  """
+
+  def __init__ (self, db, keys):
+    self.db = db
+    self.keys = keys
+    self.reused = 0
+    self.rendered = 0
+
+  def body (self, classfile, method, simplify_class, render):
+    key = self.keys[member_key(method)]
+    row = self.db.execute("SELECT lines, classes FROM body WHERE key = ?",
+                          (key,)).fetchone()
+    if row is not None:
+      lines, classes = row
+      if all(str(simplify_class(ClassDescriptor(name))) == text
+             for name, text in json.loads(classes)):
+        self.reused += 1
+        return lines.split('\n') if lines else []
+
+    used = []
+    def record (class_):
+      if isinstance(class_, ArrayDescriptor):
+        return ArrayDescriptor(record(class_.element_type))
+      simple = simplify_class(class_)
+      if isinstance(class_, ClassDescriptor):
+        used.append((str(class_), str(simple)))
+      return simple
+
+    lines = [str(line) for line in render(classfile, method, record)]
+    self.db.execute("INSERT OR REPLACE INTO body VALUES (?, ?, ?)",
+                    (key, '\n'.join(lines), json.dumps(used)))
+    self.rendered += 1
+    return lines
+
+
+class Report (namedtuple('Report', ('unchanged', 'decompiled', 'removed',
+                                   'failed', 'methods_reused',
+                                   'methods_rendered', 'duplicates'))):
+  __slots__ = ()
+
+  def __str__ (self):
+    duplicates = ''
+    if self.duplicates:
+      duplicates = ', {} duplicates skipped'.format(self.duplicates)
+    return ('{} classes unchanged, {} decompiled ({} of {} method bodies '
+            'reused), {} removed, {} failed{}'.format(
+              self.unchanged, self.decompiled, self.methods_reused,
+              self.methods_reused + self.methods_rendered, self.removed,
+              self.failed, duplicates))
+
+
+class IncrementalDecompiler:
+  """ Decompiles a container's classes into a directory of .java files,
+  keeping a manifest there (or at manifest) to make the next run
+  incremental. """
+
+  def __init__ (self, output, manifest=None):
+    self.output = output
+    os.makedirs(output, exist_ok=True)
+    if manifest is None:
+      manifest = os.path.join(output, '.decompyler-manifest')
+    self.db = sqlite3.connect(manifest)
+    self.db.executescript(_SCHEMA)
+    version = self.db.execute(
+      "SELECT value FROM setting WHERE name = 'version'").fetchone()
+    if version is None or version[0] != FORMAT_VERSION:
+      with self.db:
+        for table in ('entry', 'method', 'body'):
+          self.db.execute("DELETE FROM {}".format(table))
+        self.db.execute("INSERT OR REPLACE INTO setting VALUES "
+                        "('version', ?)", (FORMAT_VERSION,))
+
+  def close (self):
+    self.db.close()
+
+  def _write (self, relative, text):
+    path = os.path.join(self.output, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = '{}.tmp{}'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+      f.write(text)
+      f.write('\n')
+    os.replace(tmp, path)
+
+  def _remove (self, relative):
+    try:
+      os.remove(os.path.join(self.output, relative))
+    except FileNotFoundError:
+      pass
+
+  def _forget (self, name):
+    self.db.execute("DELETE FROM entry WHERE name = ?", (name,))
+    self.db.execute("DELETE FROM method WHERE entry = ?", (name,))
+
+  def _decompile (self, name, data, raw, relative):
+    """ Decompile one class file, whose RawClass is raw, to relative,
+    reusing what bodies it can. Returns the BodyCache. """
+    classfile = ClassFile.from_bytes(io.BytesIO(data))
+    bootstrap_methods = None
+    if 'BootstrapMethods' in classfile.attributes:
+      bootstrap_methods = \
+        classfile.attributes.BootstrapMethods.bootstrap_methods
+    keys = {}
+    for method, raw_method in zip(classfile.methods, raw.methods):
+      attribute = raw.find_attribute(raw_method.attributes, 'Code')
+      if attribute is not None:
+        keys[member_key(method)] = code_key(raw.attribute_data(attribute),
+                                            method, bootstrap_methods)
+    bodies = BodyCache(self.db, keys)
+    source = decompyler.decompyle(classfile, bodies)
+    classfile.release()
+    self._write(relative, source)
+    self.db.execute("DELETE FROM method WHERE entry = ?", (name,))
+    self.db.executemany("INSERT INTO method VALUES (?, ?, ?)",
+                        [(name, member, key) for member, key in keys.items()])
+    return bodies
+
+  def run (self, container, batch_size=200, budget=None, interval=None,
+           report=None):
+    """ Bring the output up to date with a container and return a Report.
+
+    With a MemoryBudget, garbage is collected whenever usage nears it, and
+    report(budget) is called every interval seconds if both are given.
+    """
+    db = self.db
+    known = {name: (stamp, output) for name, stamp, output in
+             db.execute("SELECT name, stamp, output FROM entry")}
+    unchanged = decompiled = failed = duplicates = reused = rendered = 0
+    # Output paths to the entry they belong to in this run.
+    owners = {}
+    pending = 0
+    try:
+      for resource in container.resources():
+        previous = known.pop(resource.name, None)
+        if previous is not None and previous[0] == resource.stamp and \
+           previous[1] not in owners and \
+           os.path.exists(os.path.join(self.output, previous[1])):
+          owners[previous[1]] = resource.name
+          unchanged += 1
+          continue
+        # An output an earlier entry took over is no longer this one's.
+        if previous is not None and previous[1] in owners:
+          previous = None
+        relative = None
+        try:
+          data = container.read(resource.name)
+          raw = RawClass(data)
+          relative = output_path(raw.name.replace('/', '.'))
+          owner = owners.get(relative)
+          if owner is not None:
+            log.warning("Skipping %s: %s already decompiles to %s",
+                        resource.name, owner, relative)
+            duplicates += 1
+            if previous is not None:
+              self._remove(previous[1])
+            self._forget(resource.name)
+            continue
+          owners[relative] = resource.name
+          bodies = self._decompile(resource.name, data, raw, relative)
+        except Exception as e:
+          log.warning("Failed to decompile %s: %s", resource.name, e)
+          failed += 1
+          # Leave the output to a later entry that can fill it.
+          if owners.get(relative) == resource.name:
+            del owners[relative]
+          if previous is not None:
+            self._remove(previous[1])
+          self._forget(resource.name)
+          continue
+        if previous is not None and previous[1] != relative:
+          self._remove(previous[1])
+        db.execute("INSERT OR REPLACE INTO entry VALUES (?, ?, ?)",
+                   (resource.name, resource.stamp, relative))
+        decompiled += 1
+        reused += bodies.reused
+        rendered += bodies.rendered
+        if budget is not None:
+          budget.check()
+          if report is not None and interval and budget.due(interval):
+            report(budget)
+        pending += 1
+        if pending >= batch_size:
+          db.commit()
+          pending = 0
+
+      for name, (_, output) in known.items():
+        if output not in owners:
+          self._remove(output)
+        self._forget(name)
+      db.execute("DELETE FROM body WHERE key NOT IN (SELECT key FROM method)")
+    finally:
+      # Whatever was written so far is recorded, so an interrupted run
+      # resumes where it stopped.
+      db.commit()
+    return Report(unchanged, decompiled, len(known), failed, reused, rendered,
+                  duplicates)
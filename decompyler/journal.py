@@ -0,0 +1,197 @@
+""" A journal of a batch run's finished work, for resuming it.
+
+A batch run appends a line to its journal for every class file whose
+output the sink has taken. The line holds the entry's name and stamp (for
+a jar, the CRC32 of its content, from the central directory), the class
+name, and the sink's record of where the output went. Lines are held
+back and written together at most once every interval seconds. Before
+they are written, the sink syncs the outputs they describe, and after,
+the journal is fsynced, so a line never outlives its output. That is one
+round of syncing per batch rather than per class.
+
+The sink keeps its unfinished output in scratch space (a staging directory
+or spool file) that outlives an interrupted run, and the journal's header
+names it. A resumed run takes back from the sink the outputs of the
+entries the journal lists with unchanged stamps, and decompiles the rest,
+which includes whatever was in flight when the run stopped. A finished
+run removes its journal.
+
+  >>> previous = previous_run('out.journal', header, resume=True)
+  >>> sink = DirectorySink('out/', previous and previous.header['scratch'])
+  >>> journal = Journal('out.journal', header, sink, previous)
+  >>> journal.start([container])
+"""
+
+from collections import namedtuple
+import json
+import logging
+import os
+import shutil
+import time
+
+log = logging.getLogger(__name__)
+
+JOURNAL_VERSION = 2
+
+JournalContents = namedtuple('JournalContents', ('path', 'header', 'records'))
+JournalContents.__doc__ = """ What a journal on disk says. records maps
+entry names to (stamp, class name, sink record). """
+
+
+def read_journal (path):
+  """ The JournalContents of the journal at path, or None if there is
+  none. Later lines for an entry replace earlier ones, and a torn last line,
+  from a run killed while writing it, is ignored. """
+  try:
+    with open(path, encoding='utf-8') as f:
+      lines = f.read().split('\n')
+  except FileNotFoundError:
+    return None
+  try:
+    header = json.loads(lines[0])
+  except ValueError:
+    header = None
+  if not isinstance(header, dict) or \
+     header.get('version') != JOURNAL_VERSION:
+    log.warning("Ignoring %s: not a journal of this version", path)
+    return JournalContents(path, {}, {})
+  records = {}
+  for line in lines[1:]:
+    try:
+      name, stamp, class_name, record = json.loads(line)
+    except (ValueError, TypeError):
+      break
+    records[name] = (stamp, class_name, record)
+  return JournalContents(path, header, records)
+
+def discard (contents):
+  """ Remove a journal and the scratch space it names. """
+  scratch = contents.header.get('scratch')
+  if scratch is not None:
+    if os.path.isdir(scratch):
+      shutil.rmtree(scratch, ignore_errors=True)
+    elif os.path.exists(scratch):
+      os.remove(scratch)
+  os.remove(contents.path)
+
+def previous_run (path, header, resume):
+  """ The contents of the journal at path, if resume is set and it is of a
+  run with header; otherwise None, after discarding any journal there. """
+  contents = read_journal(path)
+  if contents is None:
+    if resume:
+      log.warning("No journal at %s; starting from the beginning", path)
+    return None
+  if resume and all(contents.header.get(key) == value
+                    for key, value in header.items()):
+    return contents
+  if resume:
+    log.warning("%s is the journal of another run; starting from the "
+                "beginning", path)
+  discard(contents)
+  return None
+
+
+class Journal:
+  """ The journal at path of a run into sink.
+
+  header (a dict) describes the run, say its input and output; a later run
+  resumes this one only if its header is the same. previous is the
+  JournalContents of the run to resume, if any. It is only resumed if the
+  sink took up the scratch space it names.
+
+  The sink must have a scratch attribute and sync(records) and
+  resume(kept, stale) methods, and return a JSON-able record from each
+  call (see decompyler.sinks).
+  """
+
+  def __init__ (self, path, header, sink, previous=None, interval=1.0):
+    self.path = path
+    self.sink = sink
+    self.header = dict(header, version=JOURNAL_VERSION, scratch=sink.scratch)
+    if previous is not None and previous.header != self.header:
+      previous = None
+    self.previous = previous
+    self.interval = interval
+    # Entry names to (stamp, class name, sink record).
+    self.done = {}
+    self.syncs = 0
+    self._pending = []
+    self._records = []
+    self._last_sync = time.monotonic()
+    self._file = None
+
+  @staticmethod
+  def _line (name, stamp, class_name, record):
+    return json.dumps([name, stamp, class_name, record]) + '\n'
+
+  def start (self, containers):
+    """ Take back from the sink the outputs of the entries of containers
+    that the previous journal lists with unchanged stamps, and begin this
+    journal with them. Returns how many there were. """
+    if self.previous is not None:
+      records = dict(self.previous.records)
+      for container in containers:
+        for resource in container.resources():
+          record = records.get(resource.name)
+          if record is not None and record[0] == resource.stamp:
+            self.done[resource.name] = records.pop(resource.name)
+      self.sink.resume([record for _, _, record in self.done.values()],
+                       [record for _, _, record in records.values()])
+
+    tmp = self.path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+      f.write(json.dumps(self.header) + '\n')
+      for name, (stamp, class_name, record) in self.done.items():
+        f.write(self._line(name, stamp, class_name, record))
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp, self.path)
+    self._file = open(self.path, 'a', encoding='utf-8')
+    return len(self.done)
+
+  def remaining (self, container):
+    """ The resources of container that are still to do. """
+    for resource in container.resources():
+      done = self.done.get(resource.name)
+      if done is None or done[0] != resource.stamp:
+        yield resource
+
+  def record (self, resource, class_name, record):
+    """ Note that the sink took the output of resource and returned record.
+    Call from the sink's thread. """
+    self._pending.append(self._line(resource.name, resource.stamp,
+                                    class_name, record))
+    self._records.append(record)
+    if time.monotonic() - self._last_sync >= self.interval:
+      self.sync()
+
+  def sync (self):
+    """ Sync the sink's pending outputs, then write and sync the lines
+    about them. """
+    if self._pending:
+      self.sink.sync(self._records)
+      self._file.write(''.join(self._pending))
+      self._file.flush()
+      os.fsync(self._file.fileno())
+      self._pending = []
+      self._records = []
+      self.syncs += 1
+    self._last_sync = time.monotonic()
+
+  def close (self):
+    """ Sync and close the journal, leaving it for a later run to resume.
+    Returns whether there is one. """
+    if self._file is None:
+      return False
+    self.sync()
+    self._file.close()
+    self._file = None
+    return True
+
+  def finish (self):
+    """ Remove the journal, once the sink has closed. """
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+    os.remove(self.path)
@@ -0,0 +1,128 @@
+""" Keeping batch runs within a memory budget.
+
+A MemoryBudget measures the resident set of this process and its worker
+processes against a limit, sizes queues and caches from the limit, and
+tells the stage that brings new class files in to wait while usage is near
+it. Parsed classes are released as soon as their output is written (see
+ClassFile.release), so with in-flight work bounded, usage stays flat no
+matter how many classes go through.
+
+  >>> budget = MemoryBudget(1 << 30)
+  >>> Pipeline(sink, budget=budget).run_sync(containers)
+"""
+
+import asyncio
+import gc
+import multiprocessing
+import os
+import sys
+import time
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+# What one class costs while it is queued or being decompiled, and one
+# memoized descriptor, roughly, for sizing from a budget.
+ITEM_BYTES = 4 << 20
+DESCRIPTOR_BYTES = 1 << 10
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss (pid='self'):
+  """ The resident set size of a process in bytes, or None if it cannot be
+  read. Without /proc, this process's peak is the best there is. """
+  try:
+    with open('/proc/{}/statm'.format(pid)) as f:
+      return int(f.read().split()[1]) * _PAGE_SIZE
+  except (OSError, IndexError, ValueError):
+    if pid != 'self' or resource is None:
+      return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak if sys.platform == 'darwin' else peak * 1024
+
+def total_rss ():
+  """ The resident set of this process and its multiprocessing children. """
+  total = rss() or 0
+  for child in multiprocessing.active_children():
+    total += rss(child.pid) or 0
+  return total
+
+
+def _clamp (value, low, high):
+  return max(low, min(value, high))
+
+class MemoryBudget:
+  """ A limit in bytes on the resident set of a run and its workers.
+
+  New work waits while usage is above high (a fraction of the limit),
+  until it drops below low.
+  """
+
+  def __init__ (self, limit, high=0.85, low=0.7):
+    self.limit = limit
+    self.high = high
+    self.low = low
+    self.throttled = 0.0
+    self._last_report = time.monotonic()
+
+  def used (self):
+    return total_rss()
+
+  def pressure (self):
+    return self.used() / self.limit
+
+  def queue_size (self, workers):
+    """ How many classes may wait between stages: a quarter of the budget
+    at ITEM_BYTES each, at least one and at most four per worker. """
+    return _clamp(self.limit // 4 // ITEM_BYTES, 1, 4 * workers)
+
+  def descriptor_cache_size (self, processes=1):
+    """ Entries for each process's descriptor memo, from a sixteenth of the
+    budget. """
+    return _clamp(self.limit // 16 // DESCRIPTOR_BYTES // processes,
+                  256, 1 << 16)
+
+  def worker_limit (self, workers):
+    """ An address space limit for each of workers processes. Address
+    space runs well ahead of resident memory, hence the headroom. """
+    return 2 * self.limit // workers
+
+  def _should_wait (self):
+    if self.pressure() < self.high:
+      return False
+    gc.collect()
+    return self.pressure() >= self.low
+
+  async def wait_for_room (self, in_flight):
+    """ If usage is above the high mark, wait until it is below the low
+    one, or until in_flight() says nothing is left to finish; a run whose
+    baseline is over budget still makes progress, one class at a time. """
+    if not self._should_wait():
+      return
+    started = time.monotonic()
+    while self.pressure() >= self.low and in_flight():
+      await asyncio.sleep(0.05)
+    self.throttled += time.monotonic() - started
+
+  def check (self):
+    """ For loops without an event loop: collect garbage if usage is
+    above the high mark, and return whether it still is. """
+    return self._should_wait()
+
+  def due (self, interval):
+    """ Whether interval seconds have passed since this last returned
+    True. """
+    now = time.monotonic()
+    if now - self._last_report < interval:
+      return False
+    self._last_report = now
+    return True
+
+  def __str__ (self):
+    used = self.used()
+    return 'RSS {:.1f} MB of {:.0f} MB ({:.0%}), throttled {:.1f} s'.format(
+      used / (1 << 20), self.limit / (1 << 20), used / self.limit,
+      self.throttled)
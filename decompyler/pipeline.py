@@ -0,0 +1,251 @@
+""" An asyncio pipeline that decompiles many class files at once.
+
+Three stages are joined by bounded queues: class files are read from their
+containers on a thread pool, parsed, decompiled and prepared for the sink
+(written out, or compressed) on a process pool, and handed to the sink on a
+thread. A full queue makes the stage before it
+wait, so no more than about the sum of the queue sizes of class files and
+sources are in memory at once, whatever the size of the input.
+
+Each stage keeps a StageStats, so while a run is going the queue depths and
+how busy each stage's workers are show which stage holds the others up.
+
+  >>> sink = DirectorySink('out/')
+  >>> print(Pipeline(sink).run_sync([open_container('app.jar')]))
+  >>> sink.close()
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import io
+import logging
+import os
+import time
+
+from classfile import ClassFile
+from classfile.descriptor import set_descriptor_cache
+import decompyler
+from decompyler.sinks import entry_rank
+
+log = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def decompile_bytes (data, prepare=None):
+  """ (class name, source) for the bytes of a class file, or with prepare,
+  (class name, prepare(this_class, source)). Runs in a worker process. """
+  classfile = ClassFile.from_bytes(io.BytesIO(data))
+  this_class = classfile.this_class
+  source = decompyler.decompyle(classfile)
+  classfile.release()
+  if prepare is not None:
+    source = prepare(this_class, source)
+  return str(this_class), source
+
+
+class StageStats:
+  """ How much a stage has done and how full its input queue is. busy is
+  the time its workers have spent working, summed over workers. """
+
+  def __init__ (self, name, workers, queue=None):
+    self.name = name
+    self.workers = workers
+    self.queue = queue
+    self.done = 0
+    self.failed = 0
+    # Of those done, how many outputs the sink threw away as duplicates.
+    self.dropped = 0
+    self.busy = 0.0
+    self.started = time.perf_counter()
+    self.finished = None
+
+  @property
+  def depth (self):
+    return self.queue.qsize() if self.queue is not None else 0
+
+  @property
+  def elapsed (self):
+    return (self.finished or time.perf_counter()) - self.started
+
+  @property
+  def throughput (self):
+    """ Items finished per second. """
+    elapsed = self.elapsed
+    return self.done / elapsed if elapsed else 0.0
+
+  @property
+  def utilization (self):
+    """ The fraction of the time the stage's workers were busy. The stage
+    nearest 1 is the bottleneck. """
+    elapsed = self.elapsed
+    return self.busy / (elapsed * self.workers) if elapsed else 0.0
+
+  def __str__ (self):
+    queue = ''
+    if self.queue is not None:
+      queue = ', queue {}/{}'.format(self.depth, self.queue.maxsize)
+    notes = ''
+    if self.failed:
+      notes += ', {} failed'.format(self.failed)
+    if self.dropped:
+      notes += ', {} kept, {} dropped as duplicates'.format(
+        self.done - self.dropped, self.dropped)
+    return '{}: {} done ({:.1f}/s){}{}, {:.0%} busy'.format(
+      self.name, self.done, self.throughput, notes, queue, self.utilization)
+
+
+class Pipeline:
+  """ Decompiles every class file of some containers into sink (see
+  decompyler.sinks), which is called from one thread at a time.
+
+  readers threads read class files and processes (default: one per CPU)
+  decompile them. With threads, the decompiling is done on that many
+  threads instead, which only pays off on a free-threaded interpreter but
+  saves sending class files and sources between processes.
+  queue_size bounds each queue between stages.
+
+  With a MemoryBudget, queue_size and the workers' descriptor memos are
+  sized from it, and no new class file is read while usage is near it.
+  Decompiling on threads, the workers' memo is this process's, which is
+  only resized if resize_memo is set.
+  With a started Journal (see decompyler.journal), only the class files it
+  does not list are decompiled, and each output the sink takes is recorded
+  there.
+  """
+
+  def __init__ (self, sink, readers=4, processes=None, queue_size=None,
+                threads=False, budget=None, journal=None, resize_memo=True):
+    self.sink = sink
+    self.journal = journal
+    self.readers = readers
+    self.processes = processes or os.cpu_count() or 1
+    self.threads = threads
+    self.budget = budget
+    self.resize_memo = resize_memo
+    if queue_size is None and budget is not None:
+      queue_size = budget.queue_size(self.processes)
+    self.queue_size = queue_size or 4 * self.processes
+    self.stats = []
+
+  async def _stage (self, stats, inbox, outbox, work):
+    """ Runs one worker: takes items, each starting with a ClassResource,
+    from inbox, passes work(item) on to outbox, and stops at _DONE. """
+    while True:
+      item = await inbox.get()
+      if item is _DONE:
+        return
+      started = time.perf_counter()
+      try:
+        result = await work(item)
+      except Exception as e:
+        log.warning("%s failed on %s: %s", stats.name, item[0].name, e)
+        stats.failed += 1
+        continue
+      finally:
+        stats.busy += time.perf_counter() - started
+      stats.done += 1
+      if outbox is not None:
+        await outbox.put(result)
+
+  async def _workers (self, stats, inbox, outbox, consumers, work):
+    """ Runs a stage's workers, then tells each of the next stage's
+    consumers that nothing more is coming. """
+    await asyncio.gather(*(self._stage(stats, inbox, outbox, work)
+                           for _ in range(stats.workers)))
+    stats.finished = time.perf_counter()
+    for _ in range(consumers):
+      await outbox.put(_DONE)
+
+  async def _monitor (self, interval, report):
+    while True:
+      await asyncio.sleep(interval)
+      report(self.stats)
+
+  async def run (self, containers, interval=None, report=None):
+    """ Decompile the class files of containers, calling report(stats)
+    every interval seconds if both are given. Returns the list of
+    StageStats. """
+    containers = list(containers)
+    loop = asyncio.get_running_loop()
+    names = asyncio.Queue(self.queue_size)
+    classes = asyncio.Queue(self.queue_size)
+    sources = asyncio.Queue(self.queue_size)
+    self.stats = [StageStats('read', self.readers, names),
+                  StageStats('decompile', self.processes, classes),
+                  StageStats('write', 1, sources)]
+    read_stats, decompile_stats, write_stats = self.stats
+    prepare = getattr(self.sink, 'prepare', None)
+    journal = self.journal
+
+    budget = self.budget
+    if self.threads:
+      if budget is not None and self.resize_memo:
+        set_descriptor_cache(budget.descriptor_cache_size())
+      workers = ThreadPoolExecutor(self.processes)
+    elif budget is not None:
+      workers = ProcessPoolExecutor(
+        self.processes, initializer=set_descriptor_cache,
+        initargs=(budget.descriptor_cache_size(self.processes),))
+    else:
+      workers = ProcessPoolExecutor(self.processes)
+    with ThreadPoolExecutor(self.readers + 1) as threads, workers:
+      async def read (item):
+        resource, = item
+        return resource, await loop.run_in_executor(
+          threads, resource.container.read, resource.name)
+
+      async def decompile (item):
+        resource, data = item
+        return (resource,) + await loop.run_in_executor(
+          workers, decompile_bytes, data, prepare)
+
+      def take (resource, class_name, prepared):
+        duplicates = getattr(self.sink, 'duplicates', 0)
+        record = self.sink(class_name, prepared,
+                           entry_rank(containers, resource))
+        write_stats.dropped += getattr(self.sink, 'duplicates', 0) - \
+                               duplicates
+        if journal is not None:
+          journal.record(resource, class_name, record)
+
+      async def write (item):
+        await loop.run_in_executor(threads, take, *item)
+
+      fed = 0
+      def in_flight ():
+        return fed - sum(stage.failed for stage in self.stats) - \
+               write_stats.done
+
+      async def feed ():
+        nonlocal fed
+        for container in containers:
+          if journal is not None:
+            resources = journal.remaining(container)
+          else:
+            resources = container.resources()
+          for resource in resources:
+            if budget is not None:
+              await budget.wait_for_room(in_flight)
+            await names.put((resource,))
+            fed += 1
+        for _ in range(self.readers):
+          await names.put(_DONE)
+
+      monitor = None
+      if interval and report:
+        monitor = asyncio.ensure_future(self._monitor(interval, report))
+      try:
+        await asyncio.gather(
+          feed(),
+          self._workers(read_stats, names, classes, self.processes, read),
+          self._workers(decompile_stats, classes, sources, 1, decompile),
+          self._workers(write_stats, sources, None, 0, write))
+      finally:
+        if monitor is not None:
+          monitor.cancel()
+    return self.stats
+
+  def run_sync (self, containers, interval=None, report=None):
+    """ run() on a new event loop. """
+    return asyncio.run(self.run(containers, interval, report))
@@ -0,0 +1,132 @@
+""" Rebuild try/catch/finally regions from a method's exception table. """
+
+from formatter import Document
+
+
+class CatchClause:
+  def __init__ (self, handler_pc, catch_type):
+    self.handler_pc = handler_pc
+    self.catch_type = catch_type
+
+  def __repr__ (self):
+    return "<CatchClause({} -> {})>".format(self.catch_type, self.handler_pc)
+
+
+class TryRegion:
+  """ A protected pc range [start_pc, end_pc) and the code that handles it.
+
+  ranges are the pieces of the exception table that make up the try body.
+  catches are the typed handlers in the order the JVM tries them. finally_pc
+  is the handler javac emits for a finally block (a catch-all), if any.
+  children are the regions nested inside this one's protected range.
+  """
+
+  def __init__ (self, start_pc, end_pc):
+    self.start_pc = start_pc
+    self.end_pc = end_pc
+    self.ranges = []
+    self.catches = []
+    self.finally_pc = None
+    self.children = []
+
+  def contains (self, other):
+    return self.start_pc <= other.start_pc and other.end_pc <= self.end_pc
+
+  def describe (self, simplify_class=str):
+    doc = Document()
+    line = doc.line('// try [{}, {})'.format(self.start_pc, self.end_pc),
+                    term='')
+    for catch in self.catches:
+      line.append('catch ({}) -> {}'.format(simplify_class(catch.catch_type),
+                                            catch.handler_pc))
+    if self.finally_pc is not None:
+      line.append('finally -> {}'.format(self.finally_pc))
+    nested = doc.indent()
+    for child in self.children:
+      nested.extend(child.describe(simplify_class))
+    return doc
+
+  def __repr__ (self):
+    return "<TryRegion([{}, {}) catches={!r} finally={})>".format(
+      self.start_pc, self.end_pc, self.catches, self.finally_pc)
+
+
+def build_try_regions (code):
+  """ Build the try regions of an AttributeCode, outermost first.
+
+  javac splits a try body around every inlined copy of a finally block, so
+  one source-level try can own several ranges. Typed handlers are grouped by
+  range, and ranges with identical catch lists are merged back into one try.
+  A finally is compiled to a catch-all handler; it belongs to the try whose
+  range it protects exactly. A catch-all that matches no typed try is a
+  try/finally of its own, spanning the ranges that precede the handler.
+  """
+  index = code.handler_index
+
+  fragments = {}
+  catch_alls = {}
+  for handler in index:
+    if handler.start_pc >= handler.end_pc:
+      continue
+    if handler.catch_type is None:
+      catch_alls.setdefault(handler.handler_pc, []).append(handler)
+      continue
+    key = (handler.start_pc, handler.end_pc)
+    fragments.setdefault(key, []).append(
+      CatchClause(handler.handler_pc, handler.catch_type.descriptor))
+
+  regions = {}
+  for (start_pc, end_pc), catches in fragments.items():
+    signature = tuple((catch.handler_pc, catch.catch_type)
+                      for catch in catches)
+    if signature in regions:
+      region = regions[signature]
+      region.start_pc = min(region.start_pc, start_pc)
+      region.end_pc = max(region.end_pc, end_pc)
+    else:
+      region = regions[signature] = TryRegion(start_pc, end_pc)
+      region.catches = catches
+    region.ranges.append((start_pc, end_pc))
+
+  claimed = set()
+  for region in regions.values():
+    start_pc, end_pc = region.ranges[0]
+    for handler in index.covering(start_pc, end_pc):
+      if handler.catch_type is None and handler.end_pc == end_pc and \
+         handler.start_pc == start_pc:
+        region.finally_pc = handler.handler_pc
+        claimed.add(handler.handler_pc)
+        break
+
+  for handler_pc, handlers in catch_alls.items():
+    if handler_pc in claimed:
+      continue
+    body = [(handler.start_pc, handler.end_pc) for handler in handlers
+            if handler.start_pc < handler_pc]
+    if not body:
+      # Only protects itself, like the monitorexit guard of a synchronized
+      # block; there is no source-level try for it.
+      continue
+    region = TryRegion(min(start_pc for start_pc, _ in body),
+                       max(end_pc for _, end_pc in body))
+    region.ranges = body
+    region.finally_pc = handler_pc
+    regions[handler_pc] = region
+
+  return _nest(regions.values())
+
+
+def _nest (regions):
+  ordered = sorted(regions, key=lambda region: (region.start_pc,
+                                                -region.end_pc))
+  roots = []
+  stack = []
+  for region in ordered:
+    while stack and not stack[-1].contains(region):
+      stack.pop()
+    if stack:
+      stack[-1].children.append(region)
+    else:
+      roots.append(region)
+    stack.append(region)
+  return roots
@@ -0,0 +1,305 @@
+""" A long-running decompile service on a Unix socket.
+
+Starting Python and importing the decompiler costs more than decompiling a
+typical class, so editors and other tools that ask again and again are
+better served by a daemon:
+
+  $ python -m decompyler.service &
+  $ python -m decompyler.client Foo.class
+
+Requests and responses are JSON objects, one per line. Every request has an
+"id", which its response repeats, and an "op":
+
+  decompile  {"path": FILE} or {"data": base64 class file} or
+             {"classpath": [ENTRY, ...], "class": "pkg.Name"}, and
+             "cache": false to decompile it even if cached
+             -> {"source": ..., "cached": bool}
+  run        {"args": {...}}: the options of python -m decompyler, with -o
+             -> {"output": ..., "stderr": ...}: what it would have printed
+             to each, and on failure "error" in place of "output"
+  cancel     {"target": ID of a request on this connection}
+             -> {"cancelled": bool}
+  stats      -> counters and cache sizes
+  shutdown   -> {} and the service stops
+
+A failed request gets {"error": message} instead. Requests on a connection
+are served concurrently, so responses may come back out of order.
+
+Classes are decompiled on a pool of worker processes that live as long as
+the service, so their descriptor memo (classfile.descriptor) stays warm.
+The service itself keeps the sources it produced, keyed by a digest of
+the class file, and the header index of each classpath it was asked
+about, rebuilt only when one of its entries changes on disk. A cancelled
+request that a worker already started runs to completion, and its result
+is dropped.
+"""
+
+import argparse
+import asyncio
+import base64
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import io
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+from classfile.classpath import ClassPath
+from decompyler.cache import OutputCache
+from decompyler.cli import run
+from decompyler.pipeline import decompile_bytes
+
+log = logging.getLogger(__name__)
+
+
+def default_socket ():
+  directory = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+  return os.path.join(directory, 'decompyler-{}.sock'.format(os.getuid()))
+
+def _read_file (path):
+  with open(path, 'rb') as f:
+    return f.read()
+
+
+class DecompileService:
+  """ Serves requests on a Unix socket at path, decompiling on workers
+  processes and caching up to cache_bytes of source. """
+
+  def __init__ (self, path=None, workers=None, cache_bytes=256 << 20):
+    self.path = path or default_socket()
+    self.workers = workers or os.cpu_count() or 1
+    self.cache = OutputCache(cache_bytes)
+    self.requests = 0
+    self.cancelled = 0
+    # Classpath entries to (their stat stamps, ClassPath). Only touched,
+    # and the ClassPaths only read, on executor threads holding the lock.
+    self._classpaths = {}
+    self._classpaths_lock = threading.Lock()
+    self._pool = None
+    self._stopped = None
+    # The tasks serving open connections.
+    self._connections = set()
+
+  def _classpath (self, entries):
+    """ The ClassPath of entries, reopened if one has changed. Call with
+    the lock held. """
+    entries = tuple(entries)
+    stamps = []
+    for entry in entries:
+      stat = os.stat(entry)
+      stamps.append((stat.st_mtime_ns, stat.st_size))
+    known = self._classpaths.get(entries)
+    if known is not None and known[0] == stamps:
+      return known[1]
+    if known is not None:
+      known[1].close()
+    classpath = ClassPath(list(entries))
+    self._classpaths[entries] = (stamps, classpath)
+    return classpath
+
+  def _read_class (self, entries, name):
+    """ The bytes of class name on the classpath of entries. Runs on an
+    executor thread. """
+    with self._classpaths_lock:
+      return self._classpath(entries).read(name)
+
+  async def _decompile (self, request):
+    loop = asyncio.get_running_loop()
+    if 'data' in request:
+      data = base64.b64decode(request['data'])
+    elif 'path' in request:
+      data = await loop.run_in_executor(None, _read_file, request['path'])
+    else:
+      data = await loop.run_in_executor(None, self._read_class,
+                                        request['classpath'],
+                                        request['class'])
+    key = hashlib.blake2b(data, digest_size=16).digest()
+    if request.get('cache', True):
+      source = self.cache.get(key)
+      if source is not None:
+        return {'source': source, 'cached': True}
+    _, source = await loop.run_in_executor(self._pool, decompile_bytes, data)
+    self.cache.put(key, source)
+    return {'source': source, 'cached': False}
+
+  async def _run (self, request):
+    args = argparse.Namespace(**request['args'])
+    if args.output is None:
+      raise ValueError("run needs an output; use decompile")
+    out = io.StringIO()
+    err = io.StringIO()
+    try:
+      # The run shares this process, so it must leave its descriptor memo
+      # alone.
+      await asyncio.get_running_loop().run_in_executor(None, run, args, out,
+                                                       err, False)
+    except Exception as e:
+      log.warning("Run of %s failed: %s", args.input, e)
+      return {'error': '{}: {}'.format(type(e).__name__, e),
+              'stderr': err.getvalue()}
+    return {'output': out.getvalue(), 'stderr': err.getvalue()}
+
+  def _stats (self):
+    return {'requests': self.requests, 'cancelled': self.cancelled,
+            'cache_entries': len(self.cache), 'cache_bytes': self.cache.size,
+            'cache_hits': self.cache.hits, 'cache_misses': self.cache.misses,
+            'classpaths': len(self._classpaths), 'workers': self.workers}
+
+  async def _handle (self, request, tasks, respond):
+    id = request.get('id')
+    op = request.get('op')
+    try:
+      if op == 'decompile':
+        response = await self._decompile(request)
+      elif op == 'run':
+        response = await self._run(request)
+      elif op == 'cancel':
+        task = tasks.get(request.get('target'))
+        response = {'cancelled': task is not None and task.cancel()}
+      elif op == 'stats':
+        response = self._stats()
+      elif op == 'ping':
+        response = {}
+      elif op == 'shutdown':
+        response = {}
+      else:
+        raise ValueError("Unknown op {!r}".format(op))
+    except asyncio.CancelledError:
+      self.cancelled += 1
+      response = {'error': 'cancelled'}
+    except Exception as e:
+      log.warning("Request %s (%s) failed: %s", id, op, e)
+      response = {'error': '{}: {}'.format(type(e).__name__, e)}
+    finally:
+      tasks.pop(id, None)
+    response['id'] = id
+    await respond(response)
+    if op == 'shutdown':
+      self._stopped.set()
+
+  async def _connection (self, reader, writer):
+    connection = asyncio.current_task()
+    self._connections.add(connection)
+    tasks = {}
+    lock = asyncio.Lock()
+
+    async def respond (response):
+      async with lock:
+        if writer.is_closing():
+          return
+        writer.write(json.dumps(response).encode() + b'\n')
+        await writer.drain()
+
+    try:
+      while True:
+        line = await reader.readline()
+        if not line:
+          break
+        try:
+          request = json.loads(line)
+        except ValueError as e:
+          await respond({'id': None, 'error': 'Bad request: {}'.format(e)})
+          continue
+        self.requests += 1
+        task = asyncio.ensure_future(self._handle(request, tasks, respond))
+        if request.get('op') not in ('cancel', 'stats', 'ping'):
+          tasks[request.get('id')] = task
+      await asyncio.gather(*tasks.values(), return_exceptions=True)
+    except asyncio.CancelledError:
+      # The service is stopping; end quietly rather than as cancelled.
+      pass
+    finally:
+      self._connections.discard(connection)
+      for task in tasks.values():
+        task.cancel()
+      writer.close()
+
+  async def serve (self):
+    """ Serve until a shutdown request. """
+    self._stopped = asyncio.Event()
+    if os.path.exists(self.path):
+      os.remove(self.path)
+    with ProcessPoolExecutor(self.workers) as self._pool:
+      # Start the workers now rather than on the first request.
+      await asyncio.gather(*(
+        asyncio.get_running_loop().run_in_executor(self._pool, os.getpid)
+        for _ in range(self.workers)))
+      server = await asyncio.start_unix_server(self._connection, self.path,
+                                               limit=1 << 28)
+      log.info("Serving on %s with %d workers", self.path, self.workers)
+      try:
+        async with server:
+          await self._stopped.wait()
+          server.close()
+          connections = list(self._connections)
+          for connection in connections:
+            connection.cancel()
+          await asyncio.gather(*connections, return_exceptions=True)
+      finally:
+        os.remove(self.path)
+        with self._classpaths_lock:
+          for _, classpath in self._classpaths.values():
+            classpath.close()
+
+
+class Client:
+  """ A connection to a DecompileService. request() sends one request and
+  waits for its response. """
+
+  def __init__ (self, path=None):
+    self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.socket.connect(path or default_socket())
+    self._file = self.socket.makefile('rwb')
+    self._next_id = 0
+
+  def send (self, op, **fields):
+    """ Send a request without waiting, returning its id. """
+    self._next_id += 1
+    fields.update(id=self._next_id, op=op)
+    self._file.write(json.dumps(fields).encode() + b'\n')
+    self._file.flush()
+    return self._next_id
+
+  def receive (self):
+    line = self._file.readline()
+    if not line:
+      raise ConnectionError("The decompile service closed the connection")
+    return json.loads(line)
+
+  def response (self, id):
+    """ Wait for the response to request id, whatever it says. """
+    while True:
+      response = self.receive()
+      if response.get('id') == id:
+        return response
+
+  def request (self, op, **fields):
+    response = self.response(self.send(op, **fields))
+    if 'error' in response:
+      raise RuntimeError(response['error'])
+    return response
+
+  def close (self):
+    self._file.close()
+    self.socket.close()
+
+
+def main (argv):
+  parser = argparse.ArgumentParser(prog='python -m decompyler.service')
+  parser.add_argument('--socket', help='Unix socket to listen on (default: '
+                                       '{})'.format(default_socket()))
+  parser.add_argument('-j', '--jobs', type=int,
+                      help='Worker processes (default: one per CPU)')
+  parser.add_argument('--cache-mb', type=int, default=256,
+                      help='Decompiled source to keep, in MB (default 256)')
+  args = parser.parse_args(argv)
+  logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+  service = DecompileService(args.socket, args.jobs, args.cache_mb << 20)
+  asyncio.run(service.serve())
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -0,0 +1,332 @@
+""" Where decompiled sources go.
+
+A sink is called as sink(class name, prepared, rank) from one thread at a
+time. A sink may have a prepare attribute, a picklable callable that the
+pipeline runs in its worker processes as prepare(this_class, source); its
+result is what the sink is then called with. Without one, the sink gets
+the source itself. rank is the entry_rank of the class file: when several
+give the same source file, as in a multi-release jar, the sinks here keep
+the one that comes first in the input, whatever order they finish in, and
+count the others in their duplicates attribute.
+
+Both sinks here do their heavy work in prepare, so the parent process
+only does bookkeeping. Nothing appears at the destination until close(),
+which renames the finished output into place; abort() throws it away.
+
+For a run journal (decompyler.journal), each call also returns a JSON-able
+record of where the output went. Until close(), output is kept in scratch
+space, which a sink made with the scratch of an interrupted run takes up
+again. sync(records) makes the outputs of records durable, and
+resume(kept, stale) takes back the outputs of an interrupted run, as told
+by its records.
+"""
+
+import functools
+import os
+import shutil
+import stat
+import struct
+import tempfile
+import uuid
+import zlib
+
+from classfile.descriptor import ClassDescriptor
+
+
+def output_path (this_class):
+  """ Where the source of a class goes, relative to the output root, as
+  package/Name.java. this_class is a ClassDescriptor or a dotted name. """
+  if not isinstance(this_class, ClassDescriptor):
+    this_class = ClassDescriptor(this_class)
+  name = this_class.class_name + '.java'
+  if this_class.package:
+    return this_class.package.replace('.', '/') + '/' + name
+  return name
+
+
+def entry_rank (containers, resource):
+  """ Where a ClassResource comes in a list of containers, as a JSON-able
+  sort key. """
+  return [containers.index(resource.container), resource.position]
+
+
+def write_source (root, this_class, source):
+  """ Write a source file under root to a part file of its own beside
+  where it goes, returning both their paths relative to root. """
+  relative = output_path(this_class)
+  part = '{}.{}.part'.format(relative, uuid.uuid4().hex)
+  path = os.path.join(root, part)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+  with open(fd, 'w', encoding='utf-8') as f:
+    f.write(source)
+    f.write('\n')
+  return relative, part
+
+# Marks a directory tree as a run's output, which a later run may replace.
+OUTPUT_MARKER = '.decompyler-output'
+
+def _is_own_file (name):
+  return name == OUTPUT_MARKER or name.startswith('.decompyler-manifest')
+
+def check_replaceable (root):
+  """ Raise FileExistsError unless root is missing, empty, or the output
+  of an earlier run holding nothing but .java files. """
+  if not os.path.lexists(root):
+    return
+  if not os.path.isdir(root) or os.path.islink(root):
+    raise FileExistsError("{} exists and is not a directory".format(root))
+  names = os.listdir(root)
+  if not names:
+    return
+  if not any(_is_own_file(name) for name in names):
+    raise FileExistsError("{} is not empty and is not the output of an "
+                          "earlier run; refusing to replace it".format(root))
+  for directory, _, files in os.walk(root):
+    for name in files:
+      if not name.endswith('.java') and \
+         not (directory == root and _is_own_file(name)):
+        raise FileExistsError("{} holds {}, which no run wrote; refusing to "
+                              "replace it".format(
+                                root, os.path.join(directory, name)))
+
+def _default_mode ():
+  """ The mode a new directory gets under the current umask. """
+  umask = os.umask(0)
+  os.umask(umask)
+  return 0o777 & ~umask
+
+def _fsync (path):
+  fd = os.open(path, os.O_RDONLY)
+  try:
+    os.fsync(fd)
+  finally:
+    os.close(fd)
+
+class DirectorySink:
+  """ One .java file per class in a package directory tree at root.
+
+  Workers write each source to a part file of its own in a staging
+  directory beside root (or in staging, if it exists). close() renames the
+  part file of the first-ranked class for each source file into place and
+  the staging directory over root. Records are [path, part file, rank],
+  relative to root. An existing root is only replaced if it is the
+  output of an earlier run (see check_replaceable); anything else raises
+  FileExistsError, up front and again on close().
+  """
+
+  def __init__ (self, root, staging=None):
+    self.root = os.path.normpath(root)
+    check_replaceable(self.root)
+    if staging is not None and os.path.isdir(staging):
+      self.staging = staging
+    else:
+      parent, base = os.path.split(self.root)
+      self.staging = tempfile.mkdtemp(prefix='.{}.'.format(base),
+                                      dir=parent or '.')
+      open(os.path.join(self.staging, OUTPUT_MARKER), 'w').close()
+    self.prepare = functools.partial(write_source, self.staging)
+    self.duplicates = 0
+    # Source file paths to (rank, part file) of the class that goes there.
+    self._chosen = {}
+
+  @property
+  def scratch (self):
+    return self.staging
+
+  def _choose (self, relative, part, rank):
+    """ Keep part for relative if it ranks first so far, and remove the
+    part file that loses. """
+    chosen = self._chosen.get(relative)
+    if chosen is None or rank < chosen[0]:
+      self._chosen[relative] = (rank, part)
+      if chosen is None:
+        return
+      part = chosen[1]
+    self.duplicates += 1
+    os.remove(os.path.join(self.staging, part))
+
+  def __call__ (self, class_name, written, rank):
+    relative, part = written
+    self._choose(relative, part, rank)
+    return [relative, part, rank]
+
+  def sync (self, records):
+    directories = set()
+    for relative, part, rank in records:
+      path = os.path.join(self.staging, part)
+      if os.path.exists(path):
+        _fsync(path)
+      directories.add(os.path.dirname(path))
+    for directory in directories:
+      _fsync(directory)
+
+  def resume (self, kept, stale):
+    """ Take back the part files of the kept records. The others, stale
+    or never recorded, are swept up by close(). """
+    for relative, part, rank in kept:
+      if os.path.exists(os.path.join(self.staging, part)):
+        self._choose(relative, part, rank)
+
+  def _sweep (self):
+    """ Remove the part files left in staging, and the directories that
+    are then empty. """
+    for directory, _, files in os.walk(self.staging, topdown=False):
+      for name in files:
+        if name.endswith('.part'):
+          os.remove(os.path.join(directory, name))
+      if directory != self.staging and not os.listdir(directory):
+        os.rmdir(directory)
+
+  def close (self):
+    for relative, (_, part) in self._chosen.items():
+      os.replace(os.path.join(self.staging, part),
+                 os.path.join(self.staging, relative))
+    self._chosen = {}
+    self._sweep()
+    check_replaceable(self.root)
+    # mkdtemp made staging private; give it the mode root has or would get.
+    if os.path.isdir(self.root):
+      os.chmod(self.staging, stat.S_IMODE(os.stat(self.root).st_mode))
+    else:
+      os.chmod(self.staging, _default_mode())
+    old = None
+    if os.path.exists(self.root):
+      old = self.staging + '.old'
+      os.rename(self.root, old)
+    os.rename(self.staging, self.root)
+    if old is not None:
+      shutil.rmtree(old)
+
+  def abort (self):
+    shutil.rmtree(self.staging, ignore_errors=True)
+
+
+def deflate_source (level, this_class, source):
+  """ (crc32, size, raw deflate data) of a source file's UTF-8 bytes. """
+  data = (source + '\n').encode('utf-8')
+  compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+  return (zlib.crc32(data), len(data),
+          compressor.compress(data) + compressor.flush())
+
+# 1980-01-01 00:00, the earliest zip timestamp, so equal inputs give equal
+# jars.
+_DOS_TIME, _DOS_DATE = 0, (0 << 9) | (1 << 5) | 1
+# General purpose flag 11: names are UTF-8.
+_UTF8 = 0x800
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+
+class ZipSink:
+  """ A sources jar at path.
+
+  Workers compress each source, and the compressed entries are spooled to a
+  temporary file in whatever order they finish. close() copies the
+  first-ranked entry of each name into the jar, sorted by name, with fixed
+  timestamps, so the same classes always give the same bytes, then renames
+  the jar into place. Only the entry index is kept in memory.
+
+  With spool, the path of an existing spool, new entries are added to its
+  end. Records are [entry name, rank, spool offset, crc32, compressed size,
+  size].
+  """
+
+  def __init__ (self, path, level=6, spool=None):
+    self.path = path
+    self.prepare = functools.partial(deflate_source, level)
+    if spool is not None and os.path.isfile(spool):
+      self._spool_path = spool
+      self._spool = open(spool, 'r+b')
+      self._spool.seek(0, os.SEEK_END)
+    else:
+      parent, base = os.path.split(os.path.abspath(path))
+      fd, self._spool_path = tempfile.mkstemp(prefix='.{}.'.format(base),
+                                              suffix='.spool', dir=parent)
+      self._spool = os.fdopen(fd, 'w+b')
+    # Entry name to (rank, spool offset, crc32, compressed size, size).
+    self._entries = {}
+    self.duplicates = 0
+
+  @property
+  def scratch (self):
+    return self._spool_path
+
+  def _choose (self, name, rank, *entry):
+    chosen = self._entries.get(name)
+    if chosen is None or rank < chosen[0]:
+      self._entries[name] = (rank,) + entry
+    if chosen is not None:
+      self.duplicates += 1
+
+  def __call__ (self, class_name, entry, rank):
+    crc, size, data = entry
+    name = output_path(class_name)
+    start = self._spool.tell()
+    self._choose(name, rank, start, crc, len(data), size)
+    self._spool.write(data)
+    return [name, rank, start, crc, len(data), size]
+
+  def sync (self, records):
+    self._spool.flush()
+    os.fsync(self._spool.fileno())
+
+  def resume (self, kept, stale):
+    """ Take back the kept entries; stale ones are left unused in the
+    spool. """
+    for record in kept:
+      self._choose(*record)
+
+  def _write_jar (self, out):
+    spool = self._spool
+    central = []
+    offset = 0
+    for name in sorted(self._entries):
+      _, start, crc, compressed, size = self._entries[name]
+      encoded = name.encode('utf-8')
+      if offset > 0xffffffff or size > 0xffffffff:
+        raise ValueError("{} is too large for a zip without zip64"
+                         .format(self.path))
+      out.write(_LOCAL_HEADER.pack(0x04034b50, 20, _UTF8, zlib.DEFLATED,
+                                   _DOS_TIME, _DOS_DATE, crc, compressed,
+                                   size, len(encoded), 0))
+      out.write(encoded)
+      spool.seek(start)
+      remaining = compressed
+      while remaining:
+        chunk = spool.read(min(remaining, 1 << 20))
+        out.write(chunk)
+        remaining -= len(chunk)
+      central.append(_CENTRAL_HEADER.pack(
+        0x02014b50, (3 << 8) | 20, 20, _UTF8, zlib.DEFLATED, _DOS_TIME,
+        _DOS_DATE, crc, compressed, size, len(encoded), 0, 0, 0, 0,
+        0o100644 << 16, offset) + encoded)
+      offset += _LOCAL_HEADER.size + len(encoded) + compressed
+    if len(central) > 0xffff:
+      raise ValueError("{} has too many entries for a zip without zip64"
+                       .format(self.path))
+    directory = b''.join(central)
+    out.write(directory)
+    out.write(_END_OF_CENTRAL_DIRECTORY.pack(
+      0x06054b50, 0, 0, len(central), len(central), len(directory), offset,
+      0))
+
+  def close (self):
+    tmp = self._spool_path[:-len('.spool')] + '.tmp'
+    try:
+      with open(tmp, 'wb') as out:
+        self._write_jar(out)
+        out.flush()
+        os.fsync(out.fileno())
+      os.replace(tmp, self.path)
+    except BaseException:
+      if os.path.exists(tmp):
+        os.remove(tmp)
+      raise
+    finally:
+      self.abort()
+
+  def abort (self):
+    self._spool.close()
+    if os.path.exists(self._spool_path):
+      os.remove(self._spool_path)
@@ -0,0 +1,181 @@
+""" A jar or classpath seen as a read-only tree of .java files.
+
+  >>> tree = SourceTree('app.jar')
+  >>> tree.packages()
+  ['com/acme']
+  >>> tree.classes('com/acme')
+  ['com/acme/Foo.java']
+  >>> print(tree['com/acme/Foo.java'])
+
+The tree is listed from the containers' directories alone (for a jar, its
+central directory). Nothing is read or decompiled until a source is asked
+for. A class file Outer$Inner.class goes in Outer.java, rendered inside
+Outer, if Outer.class is beside it; otherwise it gets a file of its own.
+
+Sources are kept in an LRU cache of bounded size. Whenever one is asked
+for, a background thread decompiles the files after it in its package
+ahead of time, until a source is asked for again.
+"""
+
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import threading
+
+from classfile import ClassFile
+from classfile.classpath import open_container, split_classpath
+import decompyler
+from decompyler.cache import OutputCache
+
+log = logging.getLogger(__name__)
+
+
+def outer_name (name, names):
+  """ The internal name of the class in whose file the class file named
+  name belongs, given the names of all class files. """
+  package, _, simple = name.rpartition('/')
+  dollar = simple.find('$', 1)
+  if dollar > 0:
+    outer = simple[:dollar]
+    if package:
+      outer = package + '/' + outer
+    if outer in names:
+      return outer
+  return name
+
+
+class SourceTree (Mapping):
+  """ Decompiled sources by path, like com/acme/Foo.java, of the classes in
+  entries: a jar or directory, or a list of them or an os.pathsep separated
+  string. Earlier entries shadow later ones, as on a classpath.
+
+  At most cache_bytes characters of source are kept. Up to prefetch
+  neighbours of each source asked for are decompiled ahead (0 for none).
+  The tree is safe to use from several threads at once; close() it when
+  done.
+  """
+
+  def __init__ (self, entries, cache_bytes=64 << 20, prefetch=8):
+    self.containers = [open_container(path)
+                       for path in split_classpath(entries)]
+    self.cache = OutputCache(cache_bytes)
+    self.prefetch = prefetch
+    # Internal class names to (container, resource name).
+    classes = {}
+    for container in self.containers:
+      for resource in container.resources():
+        classes.setdefault(resource.name[:-len('.class')],
+                           (container, resource.name))
+    # .java paths to the class files that go in them, the outer one first.
+    files = {}
+    for name in sorted(classes):
+      files.setdefault(outer_name(name, classes) + '.java', []).append(
+        classes[name])
+    self._files = dict(sorted(files.items()))
+    self._packages = {}
+    for path in self._files:
+      self._packages.setdefault(path.rpartition('/')[0], []).append(path)
+
+    self._lock = threading.Lock()
+    # Paths being decompiled to Futures of their sources.
+    self._pending = {}
+    # Bumped on every lookup, to stop prefetching for an earlier one.
+    self._generation = 0
+    self._prefetcher = ThreadPoolExecutor(1) if prefetch else None
+
+  def packages (self):
+    """ Package paths, like com/acme; '' is the default package. """
+    return sorted(self._packages)
+
+  def classes (self, package):
+    """ The paths of the .java files in a package. """
+    return list(self._packages.get(package, ()))
+
+  def __contains__ (self, path):
+    return path in self._files
+
+  def __iter__ (self):
+    return iter(self._files)
+
+  def __len__ (self):
+    return len(self._files)
+
+  def __getitem__ (self, path):
+    if path not in self._files:
+      raise KeyError(path)
+    source = self._get(path)
+    if self._prefetcher is not None:
+      self._schedule(path)
+    return source
+
+  def _render (self, path):
+    (container, name), *members = self._files[path]
+    outer = ClassFile.from_bytes(container.read(name))
+    nested = []
+    for container, name in members:
+      try:
+        nested.append(ClassFile.from_bytes(container.read(name)))
+      except (ValueError, IndexError) as e:
+        log.warning("Leaving %s out of %s: %s", name, path, e)
+    try:
+      return decompyler.decompyle(outer, nested=nested)
+    finally:
+      for classfile in [outer] + nested:
+        classfile.release()
+
+  def _get (self, path):
+    """ The source of path: cached, being decompiled on another thread, or
+    decompiled now. """
+    with self._lock:
+      source = self.cache.get(path)
+      if source is not None:
+        return source
+      future = self._pending.get(path)
+      if future is not None:
+        mine = False
+      else:
+        future = self._pending[path] = Future()
+        mine = True
+    if not mine:
+      return future.result()
+    try:
+      source = self._render(path)
+    except BaseException as e:
+      with self._lock:
+        del self._pending[path]
+      future.set_exception(e)
+      raise
+    with self._lock:
+      self.cache.put(path, source)
+      del self._pending[path]
+    future.set_result(source)
+    return source
+
+  def _schedule (self, path):
+    package = self._packages[path.rpartition('/')[0]]
+    i = package.index(path)
+    neighbours = (package[i + 1:] + package[:i])[:self.prefetch]
+    with self._lock:
+      self._generation += 1
+      generation = self._generation
+    self._prefetcher.submit(self._prefetch, neighbours, generation)
+
+  def _prefetch (self, paths, generation):
+    for path in paths:
+      if self._generation != generation:
+        return
+      with self._lock:
+        if path in self.cache or path in self._pending:
+          continue
+      try:
+        self._get(path)
+      except Exception as e:
+        log.debug("Prefetching %s failed: %s", path, e)
+
+  def close (self):
+    if self._prefetcher is not None:
+      with self._lock:
+        self._generation += 1
+      self._prefetcher.shutdown(cancel_futures=True)
+    for container in self.containers:
+      container.close()
@@ -0,0 +1,169 @@
+""" Stress test concurrent parsing and decompiling.
+
+Decompiles class files on many threads at once, in two ways: each thread
+parsing its own copies, and all threads sharing one parse of each class,
+which races on its lazily computed properties. Every result must match a
+single-threaded reference.
+
+The test means most on a free-threaded interpreter. If this one has a GIL
+and a free-threaded python3.Nt is on the PATH, the test re-runs itself
+there. Otherwise the GIL is made to switch threads as often as it can.
+
+  $ python -m decompyler.stress -t 8 -r 3 app.jar
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from classfile import ClassFile
+from classfile.classpath import open_container
+import decompyler
+
+_FREE_THREADED_NAMES = ('python3.14t', 'python3.13t', 'python3t')
+
+
+def is_free_threaded ():
+  is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+  return is_gil_enabled is not None and not is_gil_enabled()
+
+def find_free_threaded ():
+  """ The path of a free-threaded interpreter on the PATH, or None. """
+  for name in _FREE_THREADED_NAMES:
+    path = shutil.which(name)
+    if path is None:
+      continue
+    result = subprocess.run(
+      [path, '-X', 'gil=0', '-c', 'import sys; print(sys._is_gil_enabled())'],
+      capture_output=True, text=True)
+    if result.returncode == 0 and result.stdout.strip() == 'False':
+      return path
+  return None
+
+
+def load_classes (inputs):
+  """ (name, bytes) for every class file in inputs. """
+  classes = []
+  for path in inputs:
+    container = open_container(path)
+    try:
+      for resource in container.resources():
+        classes.append((resource.name, container.read(resource.name)))
+    finally:
+      container.close()
+  return classes
+
+def _render (classfile):
+  return decompyler.decompyle(classfile), classfile.fingerprint()
+
+def _run_threads (count, work):
+  """ Run work(i) on count threads at once; return the seconds taken and
+  the exceptions raised. """
+  errors = []
+  start = threading.Barrier(count)
+  def run (i):
+    start.wait()
+    try:
+      work(i)
+    except Exception as e:
+      errors.append(e)
+  threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+  started = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return time.perf_counter() - started, errors
+
+def stress (classes, threads, rounds, out=sys.stdout):
+  """ Run both tests, print what happened to out, and return the number of
+  mismatches and errors. Classes that fail on one thread are left out, with
+  a warning. """
+  started = time.perf_counter()
+  # By position in classes, since inputs can share entry names.
+  reference = {}
+  for key, (name, data) in enumerate(classes):
+    try:
+      reference[key] = _render(ClassFile.from_bytes(data))
+    except Exception as e:
+      print('Skipping {}: {}'.format(name, e), file=sys.stderr)
+  serial = time.perf_counter() - started
+  classes = [(key, name, data) for key, (name, data) in enumerate(classes)
+             if key in reference]
+  print('{} classes, {:.1f} classes/s on one thread'.format(
+    len(classes), len(classes)/serial), file=out)
+
+  failures = 0
+  lock = threading.Lock()
+  def check (key, name, result):
+    nonlocal failures
+    if result != reference[key]:
+      with lock:
+        failures += 1
+        print('MISMATCH {}'.format(name), file=out)
+
+  def own_copies (i):
+    order = list(classes)
+    random.Random(i).shuffle(order)
+    for _ in range(rounds):
+      for key, name, data in order:
+        check(key, name, _render(ClassFile.from_bytes(io.BytesIO(data))))
+
+  seconds, errors = _run_threads(threads, own_copies)
+  print('separate parses: {:.1f} classes/s on {} threads'.format(
+    threads*rounds*len(classes)/seconds, threads), file=out)
+
+  for _ in range(rounds):
+    shared = [(key, name, ClassFile.from_bytes(data))
+              for key, name, data in classes]
+    def shared_parses (i):
+      order = list(shared)
+      random.Random(i).shuffle(order)
+      for key, name, classfile in order:
+        check(key, name, _render(classfile))
+    seconds, more_errors = _run_threads(threads, shared_parses)
+    errors += more_errors
+  print('shared parses: {} rounds on {} threads'.format(rounds, threads),
+        file=out)
+
+  for error in errors:
+    print('ERROR {}: {}'.format(type(error).__name__, error), file=out)
+  return failures + len(errors)
+
+
+def main (argv):
+  parser = argparse.ArgumentParser(prog='python -m decompyler.stress')
+  parser.add_argument('inputs', nargs='+',
+                      help='Class files, jars or directories to decompile')
+  parser.add_argument('-t', '--threads', type=int, default=8)
+  parser.add_argument('-r', '--rounds', type=int, default=2)
+  parser.add_argument('--no-reexec', action='store_true',
+                      help='Stay on this interpreter even if it has a GIL')
+  args = parser.parse_args(argv)
+
+  if not is_free_threaded():
+    interpreter = None if args.no_reexec else find_free_threaded()
+    if interpreter is not None:
+      print('Re-running under {}'.format(interpreter), flush=True)
+      root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+      env = dict(os.environ)
+      env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, (root, env.get('PYTHONPATH'))))
+      os.execve(interpreter, [interpreter, '-X', 'gil=0', '-m',
+                              'decompyler.stress', '--no-reexec'] + argv, env)
+    print('No free-threaded interpreter; switching the GIL as often as '
+          'possible')
+    sys.setswitchinterval(1e-6)
+
+  failures = stress(load_classes(args.inputs), args.threads, args.rounds)
+  print('{} failures'.format(failures))
+  sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+  main(sys.argv[1:])